@@ -1,64 +1,92 @@
+import argparse
+import asyncio
 import signal
 import sys
-import socket
-import struct
 import json
-from datetime import datetime as dt
+import math
+import time
 from datetime import timedelta as td
-from flask import Flask, render_template
+from flask import Flask, Response, render_template, request
 from flask_socketio import SocketIO
-from threading import Thread
-from Crypto.Cipher import Salsa20
-from collections import deque
+from threading import Thread, Lock
+import gt7capture
+import gt7delta
+import gt7history
+import gt7ingest
+import gt7laps
+import gt7lapstore
+import gt7metrics
+import gt7multi
+import gt7outline
+import gt7ring
+import gt7trackdetect
+import gt7trail
+import gt7wire
 
 app = Flask(__name__)
 socketio = SocketIO(app, cors_allowed_origins="*")
 
-# Ports for send and receive data
-SendPort = 33739
-ReceivePort = 33740
-
-# Global variables
-telemetry_data = {
-    'throttle': 0,
-    'brake': 0,
-    'speed': 0,
-    'rpm': 0,
-    'gear': 'N',
-    'position_x': 0,
-    'position_y': 0,
-    'velocity_x': 0,
-    'velocity_y': 0,
-    'lap_time': '0:00.000',
-    'current_lap': 0,
-    'position_history': []
+# Stage timing from datagram to emit, served on /metrics
+metrics = gt7metrics.Metrics()
+for stage in ('recv', 'queue', 'decrypt', 'decode', 'deliver', 'laps', 'history', 'emit', 'latency'):
+    metrics.stage(stage)  # Listed in pipeline order
+
+GEAR_CODES = {'R': -1, 'N': 0}
+
+def gear_code(gear):
+    return GEAR_CODES[gear] if gear in GEAR_CODES else int(gear)
+
+def optional_float(value):
+    return float('nan') if value is None else value
+
+# Binary layout of telemetry_update for clients that pick the binary format
+TELEMETRY_WIRE = gt7wire.WireFormat((
+    ('throttle', 'f'),
+    ('brake', 'f'),
+    ('speed', 'f'),
+    ('rpm', 'f'),
+    ('position_x', 'f'),
+    ('position_y', 'f'),
+    ('position_z', 'f'),
+    ('velocity_x', 'f'),
+    ('velocity_y', 'f'),
+    ('velocity_z', 'f'),
+    ('angular_vel_x', 'f'),
+    ('angular_vel_y', 'f'),
+    ('angular_vel_z', 'f'),
+    ('accel_sway', 'f'),
+    ('accel_heave', 'f'),
+    ('accel_surge', 'f'),
+    ('lap_time_ms', 'i'),
+    ('current_lap', 'h'),
+    ('current_position', 'h'),
+    ('total_positions', 'h'),
+    ('gear', 'b', gear_code),
+    ('delta', 'f', optional_float),
+    ('t', 'f'),
+))
+
+# Channels of the line plots kept for the whole session, with their scale from packet units
+HISTORY_CHANNELS = {
+    'throttle': 1,
+    'brake': 1,
+    'speed': 2.237,  # mph
+    'rpm': 1,
+    'accel_sway': 1,
+    'accel_heave': 1,
+    'accel_surge': 1,
 }
+MAX_HISTORY_WIDTH = 2000  # Points per channel a history view may ask for, a half-page plot on a 4K screen
 
-position_history = deque()  # Keep entire position history
+position_lock = Lock()
+history_lock = Lock()
 ip = None
-udp_socket = None
-
-def salsa20_dec(dat):
-    KEY = b'Simulator Interface Packet GT7 ver 0.0'
-    oiv = dat[0x40:0x44]
-    iv1 = int.from_bytes(oiv, byteorder='little')
-    # Updated to use correct magic number for GT7
-    iv2 = iv1 ^ 0xDEADBEEF
-    IV = bytearray()
-    IV.extend(iv2.to_bytes(4, 'little'))
-    IV.extend(iv1.to_bytes(4, 'little'))
-    
-    cipher = Salsa20.new(key=KEY[0:32], nonce=bytes(IV))
-    ddata = cipher.decrypt(dat)
-    
-    magic = int.from_bytes(ddata[0:4], byteorder='little')
-    if magic != 0x47375330:
-        return bytearray(b'')
-    return ddata
-
-def send_hb(s):
-    send_data = 'B'
-    s.sendto(send_data.encode('utf-8'), (ip, SendPort))
+consoles = []  # Console IPs, more than one runs a worker process per console
+recorder = None  # Optional raw packet capture writer
+lap_recorder = None  # Optional per-lap store writer
+live_delta = None  # Delta to the reference lap, needs the lap store
+outline_builder = None  # Optional track outline cache
+track_outline = None  # Outline of the current track as sent to clients, None when there is none
 
 def secondsToLaptime(seconds):
     remaining = seconds
@@ -66,185 +94,597 @@ def secondsToLaptime(seconds):
     remaining = seconds % 60
     return '{:01.0f}:{:06.3f}'.format(minutes, remaining)
 
-def telemetry_receiver():
-    global telemetry_data, position_history, udp_socket
+POSITION_EVERY = 15  # Packets between trail points read from the ring, 0.25 s
+
+class CarFeed:
+    """Newest telemetry payload, position trail and plot history of one console
+
+    With a frame ring (single console), the ingest thread only writes packets to the
+    ring: the payload is built from its newest record when a client is due, and the
+    trail and history sampled from the records written since the last pass. Without
+    one, payloads are published to the feed as they come.
+    """
+
+    def __init__(self, ring=None):
+        self.ring = ring  # gt7ring.FrameRing every packet is written to
+        self.reader = gt7ring.RingReader(ring) if ring else None  # Trail sampling position in the ring
+        self.payload = None
+        self.payload_t_ns = 0  # Receive time of the datagram the payload came from
+        self.version = 0
+        self.packed = None  # (version, binary record) cache shared by binary clients
+        self.trail = gt7trail.Trail()  # Recent positions in full, older ones simplified per level of detail
+        self.history = gt7history.History(HISTORY_CHANNELS)  # Every packet while racing, for zoomed out plots
+        self.last_position_time = 0
+
+    def current(self):
+        """(version, payload) of the newest packet"""
+        ring = self.ring
+        if ring is not None and ring.seq != self.version:
+            frame = ring.latest()
+            if frame is not None:
+                delta = None if math.isnan(frame.delta) else frame.delta
+                self.payload = telemetry_payload(frame, frame.lap_ms, delta)
+                with history_lock:
+                    self.payload['t'] = self.history.seconds(frame.t_ns)
+                self.payload_t_ns = frame.t_ns
+                self.version = frame.seq + 1
+        return self.version, self.payload
+
+feeds = {}  # Console IP -> CarFeed
+
+def append_position(feed, x, y):
+    """Add a point to the position trail, the emit scheduler sends it on as a delta"""
+    with position_lock:
+        feed.trail.append(x, y)
+
+def position_snapshot(feed, level=0):
+    """Whole trail at a level of detail: simplified older points, then the recent ones
+    tagged with the sequence number of the first"""
+    with position_lock:
+        older, seq, points = feed.trail.view(level)
+        return {'seq': seq, 'points': points, 'older': older, 'level': level, 'epoch': feed.trail.epoch}
+
+def positions_since(feed, seq):
+    """Position delta from sequence number seq onwards, or None if those points are gone"""
+    with position_lock:
+        points = feed.trail.since(seq)
+        return {'seq': seq, 'points': points} if points is not None else None
+
+def sample_ring(feed):
+    """Add the ring's records since the last call to the history, and a position to the trail
+    every POSITION_EVERY packets, while racing; returns the number of records read"""
+    count = 0
+    with position_lock:
+        for records in feed.reader.poll():
+            count += len(records)
+            racing = records['current_lap'] > 0
+            keep = (records['packet_id'] % POSITION_EVERY == 0) & racing
+            for x, z in zip(records['position_x'][keep].tolist(), records['position_z'][keep].tolist()):
+                feed.trail.append(round(x, 2), -round(z, 2))
+            racing = records[racing]
+            with history_lock:
+                feed.history.extend(racing['t_ns'], {name: racing[name] * scale for name, scale in HISTORY_CHANNELS.items()})
+    return count
+
+def reset_history(feed):
+    """Forget the position trail and plot history, the plot time starts again"""
+    with position_lock:
+        feed.trail.clear()
+        if feed.reader:
+            feed.reader.next = feed.ring.seq  # Nothing written before the reset goes into the trail or history
+        with history_lock:
+            feed.history.clear()
+
+def history_view(feed, start, end, width, method):
+    """Downsampled plot history between start and end (s), about width points per channel"""
+    # Only the copy holds up the scheduler, the downsampling runs after the lock is released
+    with history_lock:
+        times, columns = feed.history.window(start, end)
+    return dict(gt7history.downsample(times, columns, width, method), start=start, end=end)
+
+class ClientState:
+    __slots__ = ('interval', 'binary', 'next_due', 'sent_version', 'in_flight', 'sent_at', 'dropped', 'trail_seq', 'trail_epoch',
+                 'trail_level', 'car')
+
+    def __init__(self, rate, car):
+        self.interval = 1.0 / rate
+        self.binary = False  # Send TELEMETRY_WIRE records instead of JSON
+        self.next_due = 0.0
+        self.sent_version = 0
+        self.in_flight = False
+        self.sent_at = 0.0
+        self.dropped = 0
+        self.trail_seq = 0
+        self.trail_epoch = None  # None until the client has a position snapshot
+        self.trail_level = 0  # Trail level of detail matching the client's map zoom
+        self.car = car  # Console whose feed this client watches
+
+class EmitScheduler:
+    """Sends the newest telemetry to each client at its own rate
+
+    The receiver only publishes the latest payload, it never touches the network.
+    A background task visits every client when it is due, sends the newest payload
+    if it has not seen it yet, and skips clients still working on their previous
+    frame (no ack yet), so stale frames are dropped instead of queued.
+    """
+
+    def __init__(self, socketio, default_rate=60, max_rate=60, ack_timeout=1.0, metrics=None):
+        self.socketio = socketio
+        self.default_rate = default_rate
+        self.max_rate = max_rate
+        self.ack_timeout = ack_timeout
+        self.lock = Lock()
+        self.clients = {}
+        self.emit_stage = None
+        self.latency_stage = None
+        self.history_stage = None
+        if metrics is not None:
+            self.history_stage = metrics.stage('history')
+            self.emit_stage = metrics.stage('emit')
+            self.latency_stage = metrics.stage('latency')
+            metrics.gauge('clients', lambda: len(self.clients), 'Connected dashboard clients.')
+            metrics.counter('frames_skipped_total', lambda: sum(c.dropped for c in list(self.clients.values())),
+                            'Frames connected clients skipped because of their rate or backpressure.')
+
+    def publish(self, feed, payload, t_ns=0):
+        # Called from the receiver thread for every packet, must stay O(1) and non-blocking
+        feed.payload_t_ns = t_ns
+        feed.payload = payload
+        feed.version += 1
+
+    def add_client(self, sid, car):
+        with self.lock:
+            self.clients[sid] = ClientState(self.default_rate, car)
+
+    def remove_client(self, sid):
+        with self.lock:
+            self.clients.pop(sid, None)
+
+    def set_rate(self, sid, rate):
+        rate = max(1.0, min(float(rate), self.max_rate))
+        with self.lock:
+            client = self.clients.get(sid)
+            if client:
+                client.interval = 1.0 / rate
+        return rate
+
+    def set_binary(self, sid, binary):
+        with self.lock:
+            client = self.clients.get(sid)
+            if client:
+                client.binary = binary
+
+    def _packed_payload(self, feed, version):
+        packed = feed.packed
+        if packed is None or packed[0] != version:
+            packed = (version, TELEMETRY_WIRE.pack(feed.payload))
+            feed.packed = packed
+        return packed[1]
+
+    def car_of(self, sid):
+        client = self.clients.get(sid)
+        return client.car if client else None
+
+    def select_car(self, sid, car):
+        with self.lock:
+            client = self.clients.get(sid)
+            if client and client.car != car:
+                client.car = car
+                client.sent_version = 0
+                client.trail_epoch = None  # Snapshot of the new car's trail
+
+    def request_snapshot(self, sid):
+        with self.lock:
+            client = self.clients.get(sid)
+            if client:
+                client.trail_epoch = None
+
+    def set_trail_zoom(self, sid, metres_per_pixel):
+        with self.lock:
+            client = self.clients.get(sid)
+            feed = feeds.get(client.car) if client else None
+            if feed is None:
+                return
+            level = feed.trail.level_for(metres_per_pixel)
+            if client.trail_level != level:
+                client.trail_level = level
+                client.trail_epoch = None  # Resend the trail at the new level
+
+    def _ack(self, client, *args):
+        client.in_flight = False
+
+    def _send(self, sid, client, now):
+        feed = feeds.get(client.car)
+        if feed is None:
+            return
+        version, payload = feed.current()
+        if version != client.sent_version and payload is not None:
+            if client.sent_version:
+                client.dropped += version - client.sent_version - 1
+            client.sent_version = version
+            client.in_flight = True
+            client.sent_at = now
+            if client.binary:
+                event, payload = 'telemetry_frame', self._packed_payload(feed, version)
+            else:
+                event = 'telemetry_update'
+            self.socketio.emit(event, payload, to=sid,
+                               callback=lambda *args: self._ack(client, *args))
+            if self.latency_stage is not None and feed.payload_t_ns:
+                # Datagram received to emitted, everything in between included
+                self.latency_stage.observe(time.monotonic_ns() - feed.payload_t_ns)
+
+        # Trail points go out with the frame, in one delta per send
+        trail = feed.trail
+        if client.trail_epoch != trail.epoch:
+            snapshot = position_snapshot(feed, client.trail_level)
+            client.trail_epoch = snapshot['epoch']
+            client.trail_seq = snapshot['seq'] + len(snapshot['points'])
+            self.socketio.emit('position_snapshot', snapshot, to=sid)
+        elif client.trail_seq < trail.seq:
+            delta = positions_since(feed, client.trail_seq)
+            if delta is None:
+                client.trail_epoch = None
+            else:
+                client.trail_seq = delta['seq'] + len(delta['points'])
+                self.socketio.emit('position_delta', delta, to=sid)
+
+    def run(self):
+        while True:
+            now = time.monotonic()
+            next_wake = now + 1.0 / self.max_rate
+            for feed in list(feeds.values()):
+                if feed.reader:
+                    t0 = time.monotonic_ns()
+                    if sample_ring(feed) and self.history_stage is not None:
+                        self.history_stage.observe(time.monotonic_ns() - t0)
+            with self.lock:
+                clients = list(self.clients.items())
+            for sid, client in clients:
+                if client.in_flight and now - client.sent_at < self.ack_timeout:
+                    continue  # Backpressure, client has not finished the previous frame
+                if now >= client.next_due:
+                    t0 = time.monotonic_ns()
+                    try:
+                        self._send(sid, client, now)
+                    except Exception as e:
+                        print(f'Error sending telemetry: {e}')
+                    if self.emit_stage is not None:
+                        self.emit_stage.observe(time.monotonic_ns() - t0)
+                    client.next_due += client.interval
+                    if client.next_due < now:
+                        client.next_due = now + client.interval
+                next_wake = min(next_wake, client.next_due)
+            self.socketio.sleep(max(0.001, next_wake - time.monotonic()))
+
+emit_scheduler = EmitScheduler(socketio, metrics=metrics)
+
+def telemetry_payload(frame, lap_ms, delta=None):
+    """Dashboard view of one decoded packet"""
+    # Extract telemetry data
+    throttle = frame.throttle
+    brake = frame.brake
+    speed = 2.237 * frame.speed  # Convert to mph (m/s * 2.237)
+    rpm = frame.rpm
+    
+    cgear = frame.current_gear
+    if cgear == 0:
+        cgear = 'N'
+    elif cgear < 0:
+        cgear = 'R'
+    else:
+        cgear = str(cgear)
+    
+    position_x = frame.position_x
+    position_y = frame.position_y
+    position_z = frame.position_z
+    velocity_x = frame.velocity_x
+    velocity_y = frame.velocity_y
+    velocity_z = frame.velocity_z
+    
+    # Angular velocity (rotation rates around each axis)
+    angular_vel_x = frame.angular_vel_x  # Roll rate
+    angular_vel_y = frame.angular_vel_y  # Pitch rate
+    angular_vel_z = frame.angular_vel_z  # Yaw rate
+    
+    # Acceleration data (Packet B fields, zero for shorter packets)
+    accel_sway = frame.accel_sway
+    accel_heave = frame.accel_heave
+    accel_surge = frame.accel_surge
     
-    prevlap = -1
-    pktid = 0
-    pknt = 0
-    dt_start = dt.now()
-    last_position_time = 0
+    curlap = frame.current_lap
+    
+    # Extract race position data
+    current_position = frame.current_position
+    total_positions = frame.total_positions
+    
+    # Lap time on the packet clock
+    if curlap > 0:
+        lap_time_ms = int(lap_ms)
+        lap_time = secondsToLaptime(lap_time_ms / 1000)
+    else:
+        lap_time = '0:00.000'
+        lap_time_ms = 0
+    
+    return {
+        'throttle': round(throttle, 1),
+        'brake': round(brake, 1),
+        'speed': round(speed, 1),
+        'rpm': round(rpm, 0),
+        'gear': cgear,
+        'position_x': round(position_x, 2),
+        'position_y': round(position_y, 2),
+        'position_z': round(position_z, 2),
+        'velocity_x': round(velocity_x, 2),
+        'velocity_y': round(velocity_y, 2),
+        'velocity_z': round(velocity_z, 2),
+        'angular_vel_x': round(angular_vel_x, 3),
+        'angular_vel_y': round(angular_vel_y, 3),
+        'angular_vel_z': round(angular_vel_z, 3),
+        'accel_sway': round(accel_sway, 3),
+        'accel_heave': round(accel_heave, 3),
+        'accel_surge': round(accel_surge, 3),
+        'lap_time': lap_time,
+        'lap_time_ms': lap_time_ms,
+        'current_lap': curlap,
+        'current_position': current_position,
+        'total_positions': total_positions,
+        'delta': round(delta, 3) if delta is not None else None
+    }
+
+def console_summary(frame, laps):
+    # Made in the console's worker process in multi-console mode
+    return telemetry_payload(frame, laps.lap_ms())
+
+def publish_telemetry(feed, payload, t_ns):
+    # Add to position history every 0.25 seconds, only when actively racing (lap > 0)
+    current_time = time.time()
+    if payload['current_lap'] > 0 and current_time - feed.last_position_time >= 0.25:
+        append_position(feed, payload['position_x'], -payload['position_z'])
+        feed.last_position_time = current_time
+    
+    # The plot history gets every summary the worker sent, already in plot units
+    with history_lock:
+        payload['t'] = feed.history.seconds(t_ns)
+        if payload['current_lap'] > 0:
+            feed.history.append(t_ns, payload)
+    
+    # Hand the newest data to the emit scheduler
+    emit_scheduler.publish(feed, payload, t_ns)
+
+# Lap segmentation and the frame ring see every packet
+lap_tracker = gt7laps.LapTracker()
+
+def print_lap(lap, console=None):
+    prefix = f'{console} ' if len(consoles) > 1 else ''
+    best = ', best' if lap.best else ''
+    print(f'{prefix}Lap {lap.lap}: {secondsToLaptime(lap.ms / 1000)} (console {secondsToLaptime(lap.official_ms / 1000)}{best})')
+
+async def track_laps(frames, feed):
+    deliver_stage = metrics.stage('deliver')
+    laps_stage = metrics.stage('laps')
     
+    async for packet in frames:
+        t0 = time.monotonic_ns()
+        deliver_stage.observe(t0 - packet.t_ns)  # Received to picked up here
+        events = lap_tracker.update(packet.frame)
+        if lap_recorder:
+            stored = lap_recorder.update(packet.frame, events)
+            live_delta.update(packet.frame, events, stored)
+        if outline_builder and outline_builder.update(packet.frame, events, lap_recorder.track if lap_recorder else None):
+            publish_outline(outline_builder.current())
+        # The emit scheduler and other local readers take the packet from the ring
+        feed.ring.write(packet.frame, packet.t_ns, lap_tracker.lap_ms(), live_delta.delta if live_delta else None)
+        laps_stage.observe(time.monotonic_ns() - t0)
+        for event in events:
+            # Clear position history when lap 1 starts (race start/restart)
+            if event.kind == 'start' and event.lap == 1:
+                reset_history(feed)
+            elif event.kind == 'official':
+                print_lap(lap_tracker.laps[-1])
+
+def publish_outline(outline):
+    # Clients draw the outline once as the map background, None clears it
+    global track_outline
+    track_outline = outline.compact() if outline is not None else None
+    socketio.emit('track_outline', track_outline)
+
+async def record_packets(raw):
+    async for packet in raw:
+        recorder.write(packet.data, packet.t_ns)
+
+async def link_status(core, frames, interval=1.0):
+    # network loss, reordering and jitter, next to the packets the dashboard itself skipped
     while True:
-        try:
-            data, address = udp_socket.recvfrom(4096)
-            pknt = pknt + 1
-            ddata = salsa20_dec(data)
-            
-            if len(ddata) > 0:
-                pktid = struct.unpack('i', ddata[0x70:0x70+4])[0]
-                
-                # Extract telemetry data
-                throttle = struct.unpack('B', ddata[0x91:0x91+1])[0] / 2.55
-                brake = struct.unpack('B', ddata[0x92:0x92+1])[0] / 2.55
-                speed = 2.237 * struct.unpack('f', ddata[0x4C:0x4C+4])[0]  # Convert to mph (m/s * 2.237)
-                rpm = struct.unpack('f', ddata[0x3C:0x3C+4])[0]
-                
-                cgear = struct.unpack('B', ddata[0x90:0x90+1])[0] & 0b00001111
-                if cgear < 1:
-                    cgear = 'R'
-                elif cgear == 0:
-                    cgear = 'N'
-                else:
-                    cgear = str(cgear)
-                
-                position_x = struct.unpack('f', ddata[0x04:0x04+4])[0]
-                position_y = struct.unpack('f', ddata[0x08:0x08+4])[0]
-                position_z = struct.unpack('f', ddata[0x0C:0x0C+4])[0]
-                velocity_x = struct.unpack('f', ddata[0x10:0x10+4])[0]
-                velocity_y = struct.unpack('f', ddata[0x14:0x14+4])[0]
-                velocity_z = struct.unpack('f', ddata[0x18:0x18+4])[0]
-                
-                # Extract angular velocity (rotation rates) from correct offsets
-                # These represent rotation rates around each axis
-                angular_vel_x = struct.unpack('f', ddata[0x2C:0x2C+4])[0]  # Roll rate
-                angular_vel_y = struct.unpack('f', ddata[0x30:0x30+4])[0]  # Pitch rate  
-                angular_vel_z = struct.unpack('f', ddata[0x34:0x34+4])[0]  # Yaw rate
-                
-                # Extract acceleration data (Packet B fields)
-                # sway (X axis accel) at 0x130 (304)
-                # heave (Y axis accel) at 0x134 (308)
-                # surge (Z axis accel) at 0x138 (312)
-                accel_sway = struct.unpack('f', ddata[0x130:0x130+4])[0] if len(ddata) >= 316 else 0.0
-                accel_heave = struct.unpack('f', ddata[0x134:0x134+4])[0] if len(ddata) >= 316 else 0.0
-                accel_surge = struct.unpack('f', ddata[0x138:0x138+4])[0] if len(ddata) >= 316 else 0.0
-                
-                curlap = struct.unpack('h', ddata[0x74:0x74+2])[0]
-                
-                # Extract race position data
-                current_position = struct.unpack('h', ddata[0x84:0x84+2])[0]
-                total_positions = struct.unpack('h', ddata[0x86:0x86+2])[0]
-                
-                # Calculate lap time and handle lap transitions
-                if curlap > 0:
-                    dt_now = dt.now()
-                    # Clear position history when transitioning from lap 0 to lap 1 (race start/restart)
-                    if curlap == 1 and prevlap != 1:
-                        position_history.clear()
-                        dt_start = dt_now
-                    elif curlap != prevlap:
-                        dt_start = dt_now
-                    prevlap = curlap
-                    curLapTime = dt_now - dt_start
-                    lap_time = secondsToLaptime(curLapTime.total_seconds())
-                else:
-                    # When lap is 0, update prevlap to track it properly
-                    lap_time = '0:00.000'
-                    prevlap = curlap
-                
-                # Add to position history every 0.25 seconds, only when actively racing (lap > 0)
-                import time
-                current_time = time.time()
-                if curlap > 0 and current_time - last_position_time >= 0.25:
-                    position_history.append({'x': position_x, 'y': -position_z})
-                    last_position_time = current_time
-                
-                # Update global telemetry data
-                telemetry_data = {
-                    'throttle': round(throttle, 1),
-                    'brake': round(brake, 1),
-                    'speed': round(speed, 1),
-                    'rpm': round(rpm, 0),
-                    'gear': cgear,
-                    'position_x': round(position_x, 2),
-                    'position_y': round(position_y, 2),
-                    'position_z': round(position_z, 2),
-                    'velocity_x': round(velocity_x, 2),
-                    'velocity_y': round(velocity_y, 2),
-                    'velocity_z': round(velocity_z, 2),
-                    'angular_vel_x': round(angular_vel_x, 3),
-                    'angular_vel_y': round(angular_vel_y, 3),
-                    'angular_vel_z': round(angular_vel_z, 3),
-                    'accel_sway': round(accel_sway, 3),
-                    'accel_heave': round(accel_heave, 3),
-                    'accel_surge': round(accel_surge, 3),
-                    'lap_time': lap_time,
-                    'current_lap': curlap,
-                    'current_position': current_position,
-                    'total_positions': total_positions,
-                    'position_history': list(position_history)
-                }
-                
-                # Emit data to connected clients
-                socketio.emit('telemetry_update', telemetry_data)
-            
-            if pknt > 100:
-                send_hb(udp_socket)
-                pknt = 0
-                
-        except Exception as e:
-            print(f'Error receiving telemetry: {e}')
-            send_hb(udp_socket)
-            pknt = 0
+        await asyncio.sleep(interval)
+        status = core.link.summary()
+        status['skipped'] = frames.dropped
+        status['car'] = ip
+        socketio.emit('link_status', status)
+
+async def run_ingest():
+    core = gt7ingest.IngestCore(ip, metrics=metrics)
+    feed = feeds[ip]
+    # every packet goes through lap timing into the frame ring, clients get the newest from there
+    frames = core.subscribe(maxsize=1024)
+    metrics.counter('packets_skipped_total', lambda: frames.dropped, 'Packets the dashboard had no time to process.')
+    consumers = [track_laps(frames, feed), link_status(core, frames)]
+    if recorder:
+        # Unbounded, a capture keeps every datagram
+        consumers.append(record_packets(core.subscribe_raw(maxsize=0)))
+    await asyncio.gather(core.run(), *consumers)
+
+async def console_updates(updates):
+    # Results of the per-console worker processes in multi-console mode
+    deliver_stage = metrics.stage('deliver')
+    history_stage = metrics.stage('history')
+    async for update in updates:
+        feed = feeds[update.console]
+        if update.kind == 'frame':
+            t0 = time.monotonic_ns()
+            deliver_stage.observe(t0 - update.t_ns)  # Received, decoded in the worker and back here
+            publish_telemetry(feed, update.data, update.t_ns)
+            history_stage.observe(time.monotonic_ns() - t0)
+        elif update.kind == 'event':
+            event, lap = update.data
+            if event.kind == 'start' and event.lap == 1:
+                reset_history(feed)
+            elif event.kind == 'official':
+                print_lap(lap, update.console)
+        elif update.kind == 'link':
+            status = update.data
+            status['car'] = update.console
+            socketio.emit('link_status', status)
+
+async def run_multi_ingest():
+    multi = gt7multi.MultiIngest(consoles, console_summary, metrics=metrics)
+    metrics.counter('packets_unknown_total', lambda: multi.unknown, 'Datagrams from addresses that are not one of the consoles.')
+    metrics.counter('packets_backlog_dropped_total', lambda: sum(multi.dropped.values()),
+                    'Datagrams dropped because a console worker fell behind.')
+    await asyncio.gather(multi.run(), console_updates(multi.subscribe(maxsize=4096)))
 
 @app.route('/')
 def index():
-    import time
     response = app.make_response(render_template('dashboard.html', version=int(time.time())))
     response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
     return response
 
+@app.route('/metrics')
+def metrics_text():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
-    socketio.emit('telemetry_update', telemetry_data)
+    # The scheduler sends the current data and a position snapshot on its next pass
+    emit_scheduler.add_client(request.sid, consoles[0] if consoles else None)
+    socketio.emit('telemetry_schema', TELEMETRY_WIRE.schema(), to=request.sid)
+    socketio.emit('cars', {'cars': consoles, 'selected': consoles[0] if consoles else None}, to=request.sid)
+    if track_outline is not None:
+        socketio.emit('track_outline', track_outline, to=request.sid)
+
+@socketio.on('set_rate')
+def handle_set_rate(data):
+    rate = emit_scheduler.set_rate(request.sid, data.get('rate', emit_scheduler.default_rate))
+    print(f'Client update rate set to {rate:g} Hz')
+
+@socketio.on('set_format')
+def handle_set_format(data):
+    binary = data.get('format') == 'binary'
+    emit_scheduler.set_binary(request.sid, binary)
+    print(f"Client format set to {'binary' if binary else 'JSON'}")
+
+@socketio.on('select_car')
+def handle_select_car(data):
+    car = data.get('car')
+    if car in feeds:
+        emit_scheduler.select_car(request.sid, car)
+        print(f'Client watching {car}')
+
+@socketio.on('request_position_snapshot')
+def handle_request_position_snapshot():
+    # Client missed a delta, resend the whole trail once
+    emit_scheduler.request_snapshot(request.sid)
+
+@socketio.on('set_trail_zoom')
+def handle_set_trail_zoom(data):
+    # Map scale of the client's position plot, picks the trail level it gets
+    metres_per_pixel = float(data.get('metres_per_pixel', 0))
+    if metres_per_pixel > 0:
+        emit_scheduler.set_trail_zoom(request.sid, metres_per_pixel)
+
+@socketio.on('request_history')
+def handle_request_history(data):
+    # Zoomed or scrolled line plots, the view goes back as the acknowledgement
+    feed = feeds.get(emit_scheduler.car_of(request.sid))
+    if feed is None:
+        return None
+    try:
+        start = data.get('start')
+        end = data.get('end')
+        width = max(10, min(int(data.get('width', 1000)), MAX_HISTORY_WIDTH))
+        return history_view(feed, None if start is None else float(start), None if end is None else float(end), width,
+                            data.get('method', 'lttb'))
+    except (TypeError, ValueError) as e:
+        return {'error': str(e)}
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    emit_scheduler.remove_client(request.sid)
     print('Client disconnected')
 
 @socketio.on('clear_history')
 def handle_clear_history():
-    global position_history
-    position_history.clear()
-    print('Position history cleared by user')
+    feed = feeds.get(emit_scheduler.car_of(request.sid))
+    if feed:
+        reset_history(feed)
+        print('History cleared by user')
 
 def signal_handler(signum, frame):
     print('\nShutting down...')
-    if udp_socket:
-        udp_socket.close()
+    if recorder:
+        recorder.close()
+    for feed in feeds.values():
+        if feed.ring:
+            feed.ring.close()
     sys.exit(0)
 
 if __name__ == '__main__':
     import os
     signal.signal(signal.SIGINT, signal_handler)
     
-    # Get IP address from command line
-    if len(sys.argv) == 2:
-        ip = sys.argv[1]
-    else:
-        print('Run like: python3 dashboard.py <playstation-ip>')
-        sys.exit(1)
+    # Get IP address and options from command line
+    parser = argparse.ArgumentParser(usage='python3 dashboard.py <playstation-ip> [<playstation-ip> ...] [--record FILE] [--store DIR [--reference LAP]] [--outlines DIR] [--ring NAME]')
+    parser.add_argument('ip', nargs='+', help='LAN IP address of the PlayStation, several for one car per console')
+    parser.add_argument('--record', metavar='FILE', help='append the raw packet stream to a capture file')
+    parser.add_argument('--store', metavar='DIR', help='keep every completed lap in this lap store')
+    parser.add_argument('--reference', type=int, metavar='LAP', help='stored lap to show the delta against (default: fastest for the track and car)')
+    parser.add_argument('--outlines', metavar='DIR', help='build and cache track outlines in this directory')
+    parser.add_argument('--ring', metavar='NAME', help='shared memory name of the frame ring other local tools can read (default: generated)')
+    args = parser.parse_args()
+    consoles = list(dict.fromkeys(args.ip))
+    ip = consoles[0]
+    if len(consoles) > 1 and (args.record or args.store or args.outlines or args.ring):
+        parser.error('--record, --store, --outlines and --ring need a single console')
+    for console in consoles:
+        feeds[console] = CarFeed()
     
-    # Only initialize UDP socket in the main reloader process (not the parent process)
+    # Only start receiving in the main reloader process (not the parent process)
     # WERKZEUG_RUN_MAIN is set by Flask's reloader in the actual worker process
     if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
-        # Create UDP socket
-        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        udp_socket.bind(('0.0.0.0', ReceivePort))
-        udp_socket.settimeout(10)
+        if len(consoles) == 1:
+            feeds[ip] = CarFeed(gt7ring.FrameRing(args.ring, create=True))
+            print(f'Sharing decoded packets in memory as {feeds[ip].ring.name} (python3 gt7ring.py {feeds[ip].ring.name})')
+        if args.record:
+            recorder = gt7capture.CaptureWriter(args.record)
+            print(f'Recording raw packets to {args.record}')
+        if args.store:
+            lap_store = gt7lapstore.LapStore(args.store)
+            lap_recorder = gt7lapstore.LapRecorder(lap_store, lap_tracker, gt7trackdetect.TrackDetector())
+            references = gt7delta.ReferenceCache(lap_store)
+            if args.reference is not None:
+                references.select(args.reference)
+            live_delta = gt7delta.LiveDelta(references, lap_recorder)
+            print(f'Storing laps in {args.store}')
+        if args.outlines:
+            # Track detection comes from the lap recorder when there is one
+            detector = None if lap_recorder else gt7trackdetect.TrackDetector()
+            outline_builder = gt7outline.OutlineBuilder(gt7outline.OutlineStore(args.outlines), lap_tracker, detector)
+            print(f'Caching track outlines in {args.outlines}')
         
-        # Send initial heartbeat
-        send_hb(udp_socket)
-        
-        # Start telemetry receiver thread
-        receiver_thread = Thread(target=telemetry_receiver, daemon=True)
+        # Start telemetry ingestion (socket, heartbeats, decoding) on its own event loop,
+        # with a decoding worker process per console when there are several
+        ingest = run_ingest if len(consoles) == 1 else run_multi_ingest
+        receiver_thread = Thread(target=lambda: asyncio.run(ingest()), daemon=True)
         receiver_thread.start()
         
+        # Start per-client emit scheduler
+        socketio.start_background_task(emit_scheduler.run)
+        
         print(f'GT7 Telemetry Dashboard starting...')
-        print(f'Connected to PlayStation at {ip}')
+        print(f'Connected to PlayStation at {", ".join(consoles)}')
         print(f'Open http://localhost:5001 in your browser')
     
     # Start Flask app
@@ -0,0 +1,300 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from Crypto.Cipher import Salsa20
+import gt7packet
+import gt7screen
+import gt7synth
+import gt7trackdetect
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Micro-benchmarks for the telemetry receive path.
+#
+# Run like : python3 gt7bench.py decrypt [--packets N]
+#            python3 gt7bench.py trackdetect [--tracks N [N ...]]
+#            python3 gt7bench.py suite [--rates 60 120 1000] [--save FILE] [--compare FILE]
+#
+# The suite feeds gt7synth packets through each hot path at fixed packet rates, like the
+# console would, and reports the rate kept up, the time per packet and its lateness
+# against the schedule as percentiles, CPU use, and allocations (tracemalloc: peak while
+# running, and what is still held afterwards). --compare fails when a stage got slower
+# or started to hold on to memory.
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+# salsa20_dec() as it was copied into gt7telemetry.py and dashboard.py, kept as the baseline
+def legacy_salsa20_dec(dat):
+	KEY = b'Simulator Interface Packet GT7 ver 0.0'
+	oiv = dat[0x40:0x44]
+	iv1 = int.from_bytes(oiv, byteorder='little')
+	iv2 = iv1 ^ 0xDEADBEEF
+	IV = bytearray()
+	IV.extend(iv2.to_bytes(4, 'little'))
+	IV.extend(iv1.to_bytes(4, 'little'))
+
+	cipher = Salsa20.new(key=KEY[0:32], nonce=bytes(IV))
+	ddata = cipher.decrypt(dat)
+
+	magic = int.from_bytes(ddata[0:4], byteorder='little')
+	if magic != 0x47375330:
+		return bytearray(b'')
+	return ddata
+
+def make_packets(count, seed=0):
+	"""Encrypted variant 'B' packets of a synthetic session, distinct IV seeds and packet ids"""
+	return gt7synth.packets(count, seed=seed)
+
+def run(name, func, packets, repeat, unit='packet'):
+	start = time.perf_counter()
+	for _ in range(repeat):
+		for dat in packets:
+			func(dat)
+	elapsed = time.perf_counter() - start
+	total = len(packets) * repeat
+	print('{:<36} {:>12,.0f} {}s/s {:>8.2f} us/{}'.format(name, total / elapsed, unit, 1e6 * elapsed / total, unit))
+
+def bench_decrypt(args):
+	packets = make_packets(args.packets)
+	decryptor = gt7packet.PacketDecryptor()
+	prefix = gt7packet.PacketDecryptor(fields=('packet_id', 'current_lap'))
+	decode = gt7packet.decode
+
+	run('legacy salsa20_dec', legacy_salsa20_dec, packets, args.repeat)
+	run('PacketDecryptor', decryptor.decrypt, packets, args.repeat)
+	run('PacketDecryptor (id + lap prefix)', prefix.decrypt, packets, args.repeat)
+	run('PacketDecryptor + decode', lambda dat: decode(decryptor.decrypt(dat)), packets, args.repeat)
+
+def make_tracks(count, seed=0, spread=4000.0):
+	"""Random layouts with ~20 m start lines and a crossing for each, as (rows, crossings)"""
+	rnd = random.Random(seed)
+	rows = []
+	crossings = []
+	for track in range(count):
+		x, y = rnd.uniform(-spread, spread), rnd.uniform(-spread, spread)
+		angle = rnd.uniform(0, 2 * math.pi)
+		dx, dy = 10 * math.cos(angle), 10 * math.sin(angle)
+		# the car crosses at right angles, 1 m per packet
+		cx, cy = -dy / 10, dx / 10
+		size = rnd.uniform(300, 1500)
+		rows.append(gt7trackdetect.TrackBounds(
+			TRACK=track, P1X=x - dx, P1Y=y - dy, P2X=x + dx, P2Y=y + dy,
+			DIRECTION=gt7trackdetect.crossing_direction(cx, cy),
+			MINX=x - size, MINY=y - size, MAXX=x + size, MAXY=y + size))
+		crossings.append((x - cx / 2, y - cy / 2, x + cx / 2, y + cy / 2, x - size * 0.9, y - size * 1.1, x + size, y + size * 0.95))
+	return rows, crossings
+
+def bench_trackdetect(args):
+	real = gt7trackdetect.load_track_bounds(gt7trackdetect.TRACK_BOUNDS_FILE)
+	for count in args.tracks:
+		if count == len(real):
+			rows = real
+			crossings = [((r.P1X + r.P2X) / 2 - 0.5, (r.P1Y + r.P2Y) / 2, (r.P1X + r.P2X) / 2 + 0.5, (r.P1Y + r.P2Y) / 2,
+				r.MINX, r.MINY, r.MAXX, r.MAXY) for r in real]
+		else:
+			rows, crossings = make_tracks(count)
+		crossings = (crossings * (args.queries // len(crossings) + 1))[:args.queries]
+		start = time.perf_counter()
+		table = gt7trackdetect.TrackTable(rows)
+		print(f'{count} layouts (index built in {(time.perf_counter() - start) * 1000:.1f} ms)')
+		find = gt7trackdetect.find_matching_track
+		run('  row loop', lambda c: find(*c, rows), crossings, 1, 'crossing')
+		run('  TrackTable', lambda c: find(*c, table), crossings, args.repeat, 'crossing')
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+SUITE_STAGES = ('decrypt', 'decode', 'receiver', 'render', 'trackdetect')
+
+def receiver_stage():
+	"""Dashboard receive path per packet: decrypt, decode, lap timing, frame ring write, payload"""
+	import dashboard
+	import gt7laps
+	import gt7ring
+	ring = gt7ring.FrameRing(capacity=4096, create=True)
+	feed = dashboard.CarFeed(ring)
+	laps = gt7laps.LapTracker()
+	decrypt = gt7packet.PacketDecryptor().decrypt
+	decode = gt7packet.decode
+
+	def receive(data):
+		frame = decode(decrypt(data))
+		laps.update(frame)
+		ring.write(frame, time.monotonic_ns(), laps.lap_ms())
+		feed.current()
+
+	def close():
+		feed.reader = None
+		ring.close()
+	return receive, close
+
+def render_stage():
+	"""Terminal display per packet: every field formatted into the screen model and written out"""
+	out = open(os.devnull, 'w')
+	screen = gt7screen.Screen(out)
+	fields = [(name, 1 + i % 40, 1 + 20 * (i // 40)) for i, name in enumerate(gt7packet.FIELDS)]
+
+	def render(frame):
+		put = screen.put
+		for name, row, column in fields:
+			put('{:11.4f}'.format(getattr(frame, name)), row, column)
+		screen.render()
+	return render, out.close
+
+def suite_inputs(stage, count, seed):
+	"""(factory returning (function, close), inputs) of a stage"""
+	if stage in ('decrypt', 'decode', 'receiver'):
+		packets = gt7synth.packets(count, seed=seed)
+		if stage == 'decrypt':
+			return (lambda: (gt7packet.salsa20_dec, None)), packets
+		if stage == 'decode':
+			return (lambda: (gt7packet.decode, None)), [gt7packet.salsa20_dec(data) for data in packets]
+		return receiver_stage, packets
+	if stage == 'render':
+		return render_stage, list(gt7synth.SyntheticSession(seed=seed).frames(count))
+	# one start line crossing per packet against the shipped table
+	real = gt7trackdetect.load_track_bounds(gt7trackdetect.TRACK_BOUNDS_FILE)
+	table = gt7trackdetect.TrackTable(real)
+	crossings = [((r.P1X + r.P2X) / 2 - 0.5, (r.P1Y + r.P2Y) / 2, (r.P1X + r.P2X) / 2 + 0.5, (r.P1Y + r.P2Y) / 2,
+		r.MINX, r.MINY, r.MAXX, r.MAXY) for r in real]
+	find = gt7trackdetect.find_matching_track
+	return (lambda: (lambda c: find(*c, table), None)), (crossings * (count // len(crossings) + 1))[:count]
+
+def paced(func, inputs, rate, seconds):
+	"""Call func on the inputs on a fixed schedule (rate None: back to back)
+
+	Returns (service times, lateness from the scheduled time to done, wall s, cpu s), times in ns.
+	"""
+	count = int(rate * seconds) if rate else len(inputs)
+	interval = 1e9 / rate if rate else 0
+	service = np.zeros(count, dtype=np.int64)
+	lateness = np.zeros(count, dtype=np.int64)
+	n = len(inputs)
+	clock = time.monotonic_ns
+	cpu0 = time.process_time()
+	start = clock()
+	for i in range(count):
+		due = start + int(i * interval)
+		wait = due - clock()
+		if wait > 0:
+			time.sleep(wait / 1e9)
+		t0 = clock()
+		func(inputs[i % n])
+		t1 = clock()
+		service[i] = t1 - t0
+		lateness[i] = t1 - due if rate else t1 - t0
+	return service, lateness, (clock() - start) / 1e9, time.process_time() - cpu0
+
+def allocations(factory, inputs, count):
+	"""(peak bytes above the start, bytes and blocks still held) over count calls"""
+	func, close = factory()
+	n = len(inputs)
+	for i in range(min(n, 60)):
+		func(inputs[i])		# warm caches and lazy imports first
+	tracemalloc.start()
+	before = tracemalloc.take_snapshot()
+	base = tracemalloc.get_traced_memory()[0]
+	for i in range(count):
+		func(inputs[i % n])
+	current, peak = tracemalloc.get_traced_memory()
+	after = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+	held = [stat for stat in after.compare_to(before, 'filename') if stat.size_diff > 0]
+	if close:
+		close()
+	return peak - base, current - base, sum(stat.count_diff for stat in held)
+
+def bench_suite(args):
+	results = {}
+	header = '{:<12} {:>6} {:>9} {:>9} {:>9} {:>9} {:>10} {:>6} {:>10} {:>10}'.format(
+		'stage', 'rate', 'pkts/s', 'p50 µs', 'p99 µs', 'max µs', 'late p99', 'cpu %', 'peak KiB', 'held B/pkt')
+	print(header)
+	for stage in args.stages:
+		count = int(max(args.rates) * args.seconds) if args.rates else args.packets
+		factory, inputs = suite_inputs(stage, max(count, args.packets), args.seed)
+		peak, held, blocks = allocations(factory, inputs, args.alloc_packets)
+		for rate in list(args.rates) + [None]:
+			func, close = factory()
+			service, lateness, wall, cpu = paced(func, inputs, rate, args.seconds)
+			if close:
+				close()
+			p50, p99 = np.percentile(service, [50, 99]) / 1000
+			row = {
+				'packets_per_s': len(service) / wall,
+				'p50_us': p50,
+				'p99_us': p99,
+				'max_us': service.max() / 1000,
+				'late_p99_us': np.percentile(lateness, 99) / 1000,
+				'cpu_pct': 100 * cpu / wall,
+				'peak_kib': peak / 1024,
+				'held_bytes_per_packet': held / args.alloc_packets,
+				'held_blocks': blocks,
+			}
+			name = str(rate) if rate else 'max'
+			results[f'{stage}@{name}'] = row
+			print('{:<12} {:>6} {:>9,.0f} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.1f} {:>6.1f} {:>10.1f} {:>10.1f}'.format(
+				stage, name, row['packets_per_s'], row['p50_us'], row['p99_us'], row['max_us'], row['late_p99_us'],
+				row['cpu_pct'], row['peak_kib'], row['held_bytes_per_packet']))
+
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=1)
+		print(f'Results saved to {args.save}')
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)['results']
+		failures = compare(baseline, results, args.tolerance)
+		for failure in failures:
+			print('REGRESSION', failure)
+		if failures:
+			exit(1)
+		print(f'No regressions against {args.compare}')
+
+def compare(baseline, results, tolerance):
+	"""Descriptions of what got worse by more than tolerance (a fraction) than the baseline"""
+	failures = []
+	for key, row in results.items():
+		base = baseline.get(key)
+		if base is None:
+			continue
+		if row['p50_us'] > base['p50_us'] * (1 + tolerance):
+			failures.append(f'{key}: p50 {base["p50_us"]:.1f} -> {row["p50_us"]:.1f} µs')
+		if key.endswith('@max') and row['packets_per_s'] < base['packets_per_s'] / (1 + tolerance):
+			failures.append(f'{key}: {base["packets_per_s"]:,.0f} -> {row["packets_per_s"]:,.0f} packets/s')
+		# a few hundred bytes of caches are fine, growing with every packet is not
+		if row['held_bytes_per_packet'] > max(base['held_bytes_per_packet'] * (1 + tolerance), 8.0):
+			failures.append(f'{key}: holds {row["held_bytes_per_packet"]:.1f} bytes per packet, was {base["held_bytes_per_packet"]:.1f}')
+	return failures
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='GT7 telemetry micro-benchmarks')
+	sub = parser.add_subparsers(dest='bench', required=True)
+
+	p = sub.add_parser('decrypt', help='packet decryption throughput')
+	p.add_argument('--packets', type=int, default=1000, help='distinct packets to cycle through')
+	p.add_argument('--repeat', type=int, default=50, help='passes over the packet set')
+	p.set_defaults(func=bench_decrypt)
+
+	p = sub.add_parser('trackdetect', help='find_matching_track with growing track tables')
+	p.add_argument('--tracks', type=int, nargs='+', default=[103, 1000, 10000], help='table sizes, 103 is the shipped CSV')
+	p.add_argument('--queries', type=int, default=1000, help='start line crossings per size')
+	p.add_argument('--repeat', type=int, default=5, help='passes over the crossings for the indexed table')
+	p.set_defaults(func=bench_trackdetect)
+
+	p = sub.add_parser('suite', help='every hot path at console packet rates: throughput, percentiles, allocations')
+	p.add_argument('--stages', nargs='+', choices=SUITE_STAGES, default=list(SUITE_STAGES))
+	p.add_argument('--rates', type=float, nargs='+', default=[60, 120, 1000], help='packets per second, a back to back run follows')
+	p.add_argument('--seconds', type=float, default=2.0, help='length of each paced run (default: 2)')
+	p.add_argument('--packets', type=int, default=2000, help='distinct inputs generated at least, and the back to back run length')
+	p.add_argument('--alloc-packets', type=int, default=1000, help='packets traced for allocations')
+	p.add_argument('--seed', type=int, default=1)
+	p.add_argument('--save', metavar='FILE', help='write the results as JSON')
+	p.add_argument('--compare', metavar='FILE', help='fail on regressions against saved results')
+	p.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown as a fraction (default: 0.25)')
+	p.set_defaults(func=bench_suite)
+
+	args = parser.parse_args()
+	args.func(args)
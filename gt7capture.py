@@ -0,0 +1,278 @@
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+import gt7packet
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Raw packet capture files.
+#
+# A capture is an append-only file of the encrypted datagrams exactly as received:
+#
+#   header  : CAPTURE_MAGIC (8 bytes)
+#   records : <q monotonic receive time (ns)> <H length> <length bytes of datagram>
+#
+# The reader memory-maps the capture and keeps a sidecar index (<capture>.idx) with the
+# offset, receive time, packet ID (0x70) and lap (0x74) of every record, plus a table of
+# where each lap starts, so any lap or packet ID can be located without scanning the
+# capture. The index also holds the receive time of the first record, so the index of a
+# capture that was since replaced by another one is not reused.
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+CAPTURE_MAGIC = b'GT7CAP\x00\x01'
+INDEX_MAGIC = b'GT7IDX\x00\x02'
+
+_RECORD = struct.Struct('<qH')
+_INDEX_HEADER = struct.Struct('<8sQIIq')	# magic, indexed capture size, records, lap starts, first receive time
+
+# packet id / lap recorded for datagrams that do not decrypt to a GT7 packet
+INVALID = -1
+
+class CaptureWriter:
+	"""Appends raw datagrams to a capture file"""
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.f = open(filename, 'ab')
+		if self.f.tell() == 0:
+			self.f.write(CAPTURE_MAGIC)
+			self.f.flush()
+		self.count = 0
+
+	def write(self, data, t_ns=None):
+		if t_ns is None:
+			t_ns = time.monotonic_ns()
+		self.f.write(_RECORD.pack(t_ns, len(data)))
+		self.f.write(data)
+		self.count += 1
+
+	def flush(self):
+		self.f.flush()
+
+	def close(self):
+		self.f.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+class CaptureReader:
+	"""Memory-mapped, indexed access to a capture file"""
+
+	def __init__(self, filename):
+		self.filename = filename
+		self.index_filename = filename + '.idx'
+		self.f = open(filename, 'rb')
+		self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+		if self.mm[:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+			self.close()
+			raise ValueError(f'{filename} is not a GT7 capture file')
+
+		self.offsets = array('q')			# offset of each record's payload
+		self.timestamps = array('q')		# monotonic receive time (ns)
+		self.packet_ids = array('i')
+		self.laps = array('h')
+		self.lap_start_laps = array('h')	# lap number of each lap start
+		self.lap_start_records = array('I')	# first record of each lap start
+		self.indexed_size = len(CAPTURE_MAGIC)
+		self.packet_runs = None				# (first record, stop) of each run of ascending packet IDs, made on demand
+
+		if not self._load_index():
+			self._reset_index()
+		if self.indexed_size < len(self.mm):
+			self._extend_index()
+			self._save_index()
+		self._build_lap_table()
+
+	# –– index ––
+
+	def _reset_index(self):
+		for a in (self.offsets, self.timestamps, self.packet_ids, self.laps, self.lap_start_laps, self.lap_start_records):
+			del a[:]
+		self.indexed_size = len(CAPTURE_MAGIC)
+
+	def _load_index(self):
+		try:
+			with open(self.index_filename, 'rb') as f:
+				buf = f.read()
+		except OSError:
+			return False
+		if len(buf) < _INDEX_HEADER.size:
+			return False
+		magic, indexed_size, count, starts, first_t_ns = _INDEX_HEADER.unpack_from(buf)
+		if magic != INDEX_MAGIC or indexed_size > len(self.mm):
+			return False
+		if count and self._timestamp(len(CAPTURE_MAGIC) + _RECORD.size) != first_t_ns:
+			return False	# index of another capture by the same name
+
+		pos = _INDEX_HEADER.size
+		for a, n in ((self.offsets, count), (self.timestamps, count), (self.packet_ids, count), (self.laps, count),
+				(self.lap_start_laps, starts), (self.lap_start_records, starts)):
+			end = pos + n * a.itemsize
+			if end > len(buf):
+				self._reset_index()
+				return False
+			a.frombytes(buf[pos:end])
+			pos = end
+		if count and self._timestamp(self.offsets[-1]) != self.timestamps[-1]:
+			self._reset_index()
+			return False
+		self.indexed_size = indexed_size
+		return True
+
+	def _timestamp(self, offset):
+		# receive time in the record header in front of the payload at offset
+		return _RECORD.unpack_from(self.mm, offset - _RECORD.size)[0]
+
+	def _save_index(self):
+		tmp = self.index_filename + '.tmp'
+		with open(tmp, 'wb') as f:
+			first_t_ns = self.timestamps[0] if self.timestamps else 0
+			f.write(_INDEX_HEADER.pack(INDEX_MAGIC, self.indexed_size, len(self.offsets), len(self.lap_start_laps), first_t_ns))
+			for a in (self.offsets, self.timestamps, self.packet_ids, self.laps, self.lap_start_laps, self.lap_start_records):
+				a.tofile(f)
+		os.replace(tmp, self.index_filename)
+
+	def _extend_index(self):
+		# only the leading bytes up to the lap counter need decrypting to index a record
+		decrypt = gt7packet.PacketDecryptor(fields=('packet_id', 'current_lap')).decrypt
+		id_offset = gt7packet.FIELD_OFFSETS['packet_id'][0]
+		lap_offset = gt7packet.FIELD_OFFSETS['current_lap'][0]
+		unpack_id = struct.Struct('<i').unpack_from
+		unpack_lap = struct.Struct('<h').unpack_from
+
+		mm = self.mm
+		size = len(mm)
+		pos = self.indexed_size
+		prevlap = self.laps[-1] if self.laps else INVALID
+		while pos + _RECORD.size <= size:
+			t_ns, length = _RECORD.unpack_from(mm, pos)
+			start = pos + _RECORD.size
+			if start + length > size:
+				break	# record still being written
+			ddata = decrypt(mm[start:start + length])
+			if ddata:
+				packet_id = unpack_id(ddata, id_offset)[0]
+				lap = unpack_lap(ddata, lap_offset)[0]
+			else:
+				packet_id = lap = INVALID
+			if lap != INVALID and lap != prevlap:
+				self.lap_start_laps.append(lap)
+				self.lap_start_records.append(len(self.offsets))
+			if lap != INVALID:
+				prevlap = lap
+			self.offsets.append(start)
+			self.timestamps.append(t_ns)
+			self.packet_ids.append(packet_id)
+			self.laps.append(lap)
+			pos = start + length
+		self.indexed_size = pos
+
+	def _build_lap_table(self):
+		# lap number -> record index of each time that lap started
+		self.lap_starts = {}
+		for lap, record in zip(self.lap_start_laps, self.lap_start_records):
+			self.lap_starts.setdefault(lap, []).append(record)
+
+	# –– access ––
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def __getitem__(self, i):
+		"""(receive time ns, raw datagram) of record i"""
+		start = self.offsets[i]
+		length = _RECORD.unpack_from(self.mm, start - _RECORD.size)[1]
+		return self.timestamps[i], self.mm[start:start + length]
+
+	def __iter__(self):
+		return self.records()
+
+	def records(self, start=0, stop=None):
+		if stop is None:
+			stop = len(self.offsets)
+		for i in range(start, stop):
+			yield self[i]
+
+	def seek_lap(self, lap, occurrence=-1):
+		"""Record index where the given lap starts (latest occurrence by default)"""
+		starts = self.lap_starts.get(lap)
+		if not starts:
+			raise KeyError(f'lap {lap} not in capture')
+		return starts[occurrence]
+
+	def lap_range(self, lap, occurrence=-1):
+		"""range() of record indices covering one lap"""
+		start = self.seek_lap(lap, occurrence)
+		# the lap ends where the next lap start begins
+		i = bisect_right(self.lap_start_records, start)
+		stop = self.lap_start_records[i] if i < len(self.lap_start_records) else len(self.offsets)
+		return range(start, stop)
+
+	def _build_packet_runs(self):
+		# packet IDs only go up within a session, a run ends at a restart, a duplicate or
+		# late packet, or a record that did not decrypt
+		runs = []
+		ids = self.packet_ids
+		start = None
+		previous = INVALID
+		for i, packet_id in enumerate(ids):
+			if packet_id == INVALID or packet_id <= previous:
+				if start is not None:
+					runs.append((start, i))
+				start = i if packet_id != INVALID else None
+			elif start is None:
+				start = i
+			previous = packet_id
+		if start is not None:
+			runs.append((start, len(ids)))
+		self.packet_runs = runs
+
+	def seek_packet(self, packet_id, occurrence=-1):
+		"""Record index of the packet with this ID (latest occurrence by default)"""
+		if self.packet_runs is None:
+			self._build_packet_runs()
+		ids = self.packet_ids
+		found = []
+		for start, stop in self.packet_runs:
+			if ids[start] <= packet_id <= ids[stop - 1]:
+				i = bisect_left(ids, packet_id, start, stop)
+				if ids[i] == packet_id:
+					found.append(i)
+		if not found:
+			raise KeyError(f'packet {packet_id} not in capture')
+		return found[occurrence]
+
+	def close(self):
+		self.mm.close()
+		self.f.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+if __name__ == '__main__':
+	if len(sys.argv) != 2:
+		print('Run like : python3 gt7capture.py <capture-file>')
+		exit(1)
+
+	with CaptureReader(sys.argv[1]) as capture:
+		if len(capture) == 0:
+			print('Empty capture')
+			exit(0)
+		duration = (capture.timestamps[-1] - capture.timestamps[0]) / 1e9
+		print(f'{len(capture)} packets, {duration:.1f} s')
+		ends = capture.lap_start_records[1:].tolist() + [len(capture)]
+		for lap, start, stop in zip(capture.lap_start_laps, capture.lap_start_records, ends):
+			print(f'  lap {lap:3d}: packets {start}-{stop - 1} ({stop - start})')
@@ -0,0 +1,212 @@
+import math
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Live delta to a reference lap.
+#
+# The reference lap's (x, z) trace is cut into segments between consecutive packets and
+# bucketed into a uniform grid. Each live position is matched to the nearest segment,
+# first by searching forward a short window from the previous match (the car only moves
+# forward along the lap, so this is amortized O(1)), and through the grid when that
+# fails, e.g. at the start of a lap or after a spin. The delta is the live lap time minus
+# the reference time interpolated at the matched point, negative when ahead.
+#
+#   reference = references.get(track, car)
+#   delta = DeltaTracker(reference)
+#   seconds = delta.update(frame.position_x, frame.position_z, laps.lap_ms() / 1000)
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+CELL_SIZE = 20.0		# m, grid cell edge
+WINDOW = 120			# segments searched forward from the previous match, 2 s at 60 Hz
+PATIENCE = 10			# stop searching forward after this many segments getting farther away
+MAX_OFFSET = 15.0		# m, farther from the reference line counts as no match
+
+def _segment_distance(px, pz, ax, az, bx, bz):
+	"""Squared distance from p to the segment a-b and the fraction along it"""
+	dx = bx - ax
+	dz = bz - az
+	length = dx * dx + dz * dz
+	f = ((px - ax) * dx + (pz - az) * dz) / length if length > 0 else 0.0
+	f = 0.0 if f < 0 else 1.0 if f > 1 else f
+	ex = ax + f * dx - px
+	ez = az + f * dz - pz
+	return ex * ex + ez * ez, f
+
+class ReferenceLap:
+	"""Reference trace with a uniform grid over its segments"""
+
+	def __init__(self, x, z, time, entry=None, cell_size=CELL_SIZE):
+		self.x = x
+		self.z = z
+		self.time = time
+		self.entry = entry				# gt7lapstore.LapEntry it was loaded from
+		self.cell_size = cell_size
+		self.grid = {}					# (column, row) -> segment indices
+		cell = self._cell
+		for i in range(len(x) - 1):
+			c0, r0 = cell(min(x[i], x[i + 1]), min(z[i], z[i + 1]))
+			c1, r1 = cell(max(x[i], x[i + 1]), max(z[i], z[i + 1]))
+			for c in range(c0, c1 + 1):
+				for r in range(r0, r1 + 1):
+					self.grid.setdefault((c, r), []).append(i)
+
+	@classmethod
+	def from_store(cls, store, entry):
+		columns = store.load(entry, ['position_x', 'position_z', 'time'])
+		return cls(columns['position_x'], columns['position_z'], columns['time'], entry)
+
+	def __len__(self):
+		return len(self.x) - 1
+
+	def _cell(self, x, z):
+		return math.floor(x / self.cell_size), math.floor(z / self.cell_size)
+
+	def _nearest(self, px, pz, segments):
+		x = self.x
+		z = self.z
+		best = None
+		for i in segments:
+			d2, f = _segment_distance(px, pz, x[i], z[i], x[i + 1], z[i + 1])
+			if best is None or d2 < best[0]:
+				best = (d2, i, f)
+		return best
+
+	def _forward(self, px, pz, hint):
+		# walk forward while the trace gets closer, the car rarely moves more than a segment per packet
+		x = self.x
+		z = self.z
+		best = None
+		worse = 0
+		for i in range(hint, min(hint + WINDOW, len(self))):
+			d2, f = _segment_distance(px, pz, x[i], z[i], x[i + 1], z[i + 1])
+			if best is None or d2 < best[0]:
+				best = (d2, i, f)
+				worse = 0
+			else:
+				worse += 1
+				if worse > PATIENCE:
+					break
+		return best
+
+	def locate(self, px, pz, hint=None):
+		"""Nearest (segment, fraction, distance) to a position, None if too far from the trace"""
+		if hint is not None:
+			best = self._forward(px, pz, hint)
+			if best is not None and best[0] <= MAX_OFFSET * MAX_OFFSET:
+				return best[1], best[2], math.sqrt(best[0])
+
+		c, r = self._cell(px, pz)
+		candidates = set()
+		for dc in (-1, 0, 1):
+			for dr in (-1, 0, 1):
+				candidates.update(self.grid.get((c + dc, r + dr), ()))
+		best = self._nearest(px, pz, sorted(candidates))
+		if best is None or best[0] > MAX_OFFSET * MAX_OFFSET:
+			return None
+		# where the trace passes close by twice (start/finish), take the first pass after the hint
+		limit = math.sqrt(best[0]) + 1.0
+		for i in sorted(candidates):
+			if hint is not None and i < hint:
+				continue
+			d2, f = _segment_distance(px, pz, self.x[i], self.z[i], self.x[i + 1], self.z[i + 1])
+			if d2 <= limit * limit:
+				return i, f, math.sqrt(d2)
+		return best[1], best[2], math.sqrt(best[0])
+
+	def time_at(self, segment, fraction):
+		t = self.time
+		return t[segment] + fraction * (t[segment + 1] - t[segment])
+
+class DeltaTracker:
+	"""Delta to a reference lap for one car, restart it at every lap start"""
+
+	def __init__(self, reference):
+		self.reference = reference
+		self.hint = 0
+		self.delta = None
+
+	def reset(self):
+		self.hint = 0
+		self.delta = None
+
+	def update(self, x, z, lap_seconds):
+		"""Seconds behind (positive) or ahead (negative) of the reference, None when off the trace"""
+		match = self.reference.locate(x, z, self.hint)
+		if match is None:
+			self.delta = None
+			return None
+		segment, fraction, _ = match
+		self.hint = segment
+		self.delta = lap_seconds - self.reference.time_at(segment, fraction)
+		return self.delta
+
+class ReferenceCache:
+	"""Reference laps from a lap store, by track and car, loaded once"""
+
+	def __init__(self, store):
+		self.store = store
+		self.selected = {}		# (track, car) -> lap id picked instead of the fastest
+		self.references = {}	# (track, car) -> ReferenceLap or None
+
+	def select(self, lap_id):
+		"""Use this stored lap as the reference for its track and car"""
+		entry = self.store.get(lap_id)
+		if entry is None:
+			raise KeyError(f'no stored lap {lap_id}')
+		key = (entry.track, entry.car)
+		self.selected[key] = lap_id
+		self.references.pop(key, None)
+		return entry
+
+	def invalidate(self, track, car):
+		"""Pick the reference again on next use, e.g. after a faster lap was stored"""
+		self.references.pop((track, car), None)
+
+	def get(self, track, car):
+		key = (track, car)
+		if key not in self.references:
+			lap_id = self.selected.get(key)
+			if lap_id is not None:
+				entry = self.store.get(lap_id)
+			else:
+				best = self.store.best_laps(track, car, 1)
+				entry = best[0] if best else None
+			self.references[key] = ReferenceLap.from_store(self.store, entry) if entry else None
+		return self.references[key]
+
+class LiveDelta:
+	"""Delta to the reference lap of the current track and car, following lap events
+
+	The track comes from a gt7lapstore.LapRecorder, so nothing is shown before it has
+	been detected.
+	"""
+
+	def __init__(self, references, recorder):
+		self.references = references
+		self.recorder = recorder
+		self.key = None
+		self.tracker = None
+		self.delta = None
+
+	def update(self, frame, events, stored=None):
+		"""Advance with one packet, its LapTracker events and the lap it stored, if any"""
+		restart = False
+		for event in events:
+			if event.kind in ('start', 'reset'):
+				restart = True
+		if stored is not None and stored.track is not None and not stored.partial:
+			reference = self.references.references.get((stored.track, stored.car))
+			if reference is None or stored.lap_ms < reference.entry.lap_ms:
+				self.references.invalidate(stored.track, stored.car)
+
+		key = (self.recorder.track, frame.car_id)
+		if restart or key != self.key:
+			self.key = key
+			reference = self.references.get(*key) if key[0] is not None else None
+			self.tracker = DeltaTracker(reference) if reference is not None else None
+
+		laps = self.recorder.tracker
+		if self.tracker is None or laps.start_id is None:
+			self.delta = None
+		else:
+			self.delta = self.tracker.update(frame.position_x, frame.position_z, laps.lap_ms(frame.packet_id) / 1000)
+		return self.delta
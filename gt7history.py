@@ -0,0 +1,200 @@
+import numpy as np
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Whole-session history of a few telemetry channels, served as downsampled views.
+#
+# Every sample is kept, in NumPy columns that grow as needed. A view covers a time range
+# with a budget of points per channel, usually the pixel width of the plot, so what goes
+# to the browser depends on the plot and not on the length of the session. Two ways of
+# picking the points:
+#
+#   lttb     Largest-Triangle-Three-Buckets, one point per bucket, the one making the
+#            largest triangle with its neighbours, which keeps the visual shape of the line
+#   minmax   the minimum and maximum of each bucket, which keeps every peak exactly
+#
+# Ranges with no more samples than the budget come back in full.
+#
+#   history = History(('speed', 'rpm'))
+#   history.extend(t_ns, {'speed': speeds, 'rpm': rpms})
+#   view = history.view(0, 1800, 800)
+#   times, speeds = view['channels']['speed']
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+LIMIT = 1 << 20		# samples kept, almost 5 hours at 60 per second, the oldest quarter goes beyond that
+INITIAL_SIZE = 1 << 12
+
+METHODS = ('lttb', 'minmax')
+
+def lttb(x, y, n):
+	"""Indices of n points of the line (x, y) picked by Largest-Triangle-Three-Buckets"""
+	count = len(x)
+	if n >= count:
+		return np.arange(count)
+	if n < 3:
+		return np.array([0, count - 1])
+	# first and last point are always kept, the ones between go into n - 2 buckets
+	edges = np.linspace(1, count - 1, n - 1).astype(np.int64)
+	sizes = np.diff(edges)
+	# the average of the following bucket is the third corner of a bucket's triangles
+	mean_x = np.add.reduceat(x[:count - 1], edges[:-1]) / sizes
+	mean_y = np.add.reduceat(y[:count - 1], edges[:-1], dtype=np.float64) / sizes
+	next_x = np.append(mean_x[1:], x[-1])
+	next_y = np.append(mean_y[1:], y[-1])
+	selected = np.empty(n, dtype=np.int64)
+	selected[0] = 0
+	selected[-1] = count - 1
+	a = 0
+	for bucket in range(n - 2):
+		lo = edges[bucket]
+		hi = edges[bucket + 1]
+		ax = x[a]
+		ay = y[a]
+		cx = next_x[bucket]
+		cy = next_y[bucket]
+		# twice the area of the triangle from the last picked point over each candidate to the average
+		area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+		a = lo + int(area.argmax())
+		selected[bucket + 1] = a
+	return selected
+
+def minmax(y, n):
+	"""Indices of the minimum and maximum of y in each of n // 2 buckets, in order"""
+	count = len(y)
+	buckets = n // 2
+	if count <= n or buckets < 1:
+		return np.arange(count)
+	edges = np.linspace(0, count, buckets + 1).astype(np.int64)
+	bucket = np.repeat(np.arange(buckets), np.diff(edges))
+	low = np.minimum.reduceat(y, edges[:-1])[bucket]
+	high = np.maximum.reduceat(y, edges[:-1])[bucket]
+	picked = []
+	for extreme in (low, high):
+		# first sample of each bucket equal to its extreme
+		candidates = np.flatnonzero(y == extreme)
+		picked.append(candidates[np.unique(bucket[candidates], return_index=True)[1]])
+	# a flat bucket has the same sample as minimum and maximum
+	return np.unique(np.concatenate(picked))
+
+class History:
+	"""Time and value columns of a set of channels, time in s from the first sample"""
+
+	def __init__(self, channels, limit=LIMIT):
+		self.channels = tuple(channels)
+		self.limit = limit
+		self.start_ns = None		# receive time of the session start
+		self.count = 0
+		self.dropped = 0			# samples discarded at the limit
+		self.time = np.empty(INITIAL_SIZE)
+		self.values = {name: np.empty(INITIAL_SIZE, dtype=np.float32) for name in self.channels}
+
+	def seconds(self, t_ns):
+		"""Session time of a receive time, the first asked for or added starts the session"""
+		if self.start_ns is None:
+			self.start_ns = t_ns
+		return (t_ns - self.start_ns) / 1e9
+
+	def clear(self):
+		self.count = 0
+		self.start_ns = None
+
+	def _reserve(self, extra):
+		count = self.count
+		if count + extra > self.limit:
+			drop = min(count, max(count + extra - self.limit, self.limit // 4))
+			for column in (self.time, *self.values.values()):
+				column[:count - drop] = column[drop:count]
+			count = self.count = count - drop
+			self.dropped += drop
+		needed = count + extra
+		if needed > len(self.time):
+			size = max(needed, min(2 * len(self.time), self.limit))
+			self.time = self._grown(self.time, size)
+			self.values = {name: self._grown(column, size) for name, column in self.values.items()}
+
+	def _grown(self, column, size):
+		grown = np.empty(size, dtype=column.dtype)
+		grown[:self.count] = column[:self.count]
+		return grown
+
+	def extend(self, t_ns, columns):
+		"""Add samples received at the times in t_ns (ns), columns has an array of values per channel"""
+		t_ns = np.asarray(t_ns, dtype=np.int64)
+		n = len(t_ns)
+		if not n:
+			return
+		if self.start_ns is None:
+			self.start_ns = int(t_ns[0])
+		self._reserve(n)
+		start = self.count
+		self.time[start:start + n] = (t_ns - self.start_ns) / 1e9
+		for name in self.channels:
+			self.values[name][start:start + n] = columns[name]
+		self.count = start + n
+
+	def append(self, t_ns, values):
+		"""Add one sample, values maps every channel to its value"""
+		self.extend((t_ns,), values)
+
+	def window(self, start=None, end=None, channels=None):
+		"""Copy of the samples from start to end (s) as (times, {name: values})
+
+		One sample either side of the range is included, so lines run to the edges of the
+		plot. Copying is quick, so this is the part to do under a lock shared with the
+		writer, and downsample() the part to do after it.
+		"""
+		channels = self.channels if channels is None else tuple(channels)
+		unknown = [name for name in channels if name not in self.values]
+		if unknown:
+			raise ValueError(f'unknown channels: {", ".join(unknown)}')
+		count = self.count
+		times = self.time[:count]
+		lo = 0 if start is None else max(0, int(np.searchsorted(times, start, 'left')) - 1)
+		hi = count if end is None else min(count, int(np.searchsorted(times, end, 'right')) + 1)
+		return times[lo:hi].copy(), {name: self.values[name][lo:hi].copy() for name in channels}
+
+	def view(self, start=None, end=None, width=1000, method='lttb', channels=None):
+		"""Samples from start to end (s) downsampled to about width points per channel, see downsample()"""
+		return dict(downsample(*self.window(start, end, channels), width, method), start=start, end=end)
+
+def downsample(times, columns, width=1000, method='lttb'):
+	"""About width points of each column of a window, as {'count', 'method', 'channels': {name: [times, values]}}
+
+	count is the number of samples in the window.
+	"""
+	if method not in METHODS:
+		raise ValueError(f'unknown method {method}, one of {", ".join(METHODS)}')
+	result = {}
+	for name, values in columns.items():
+		if len(times) <= width:
+			picked = slice(None)
+		elif method == 'lttb':
+			picked = lttb(times, values, width)
+		else:
+			picked = minmax(values, width)
+		result[name] = [times[picked].round(3).tolist(), values[picked].astype(np.float64).round(3).tolist()]
+	return {'count': len(times), 'method': method, 'channels': result}
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+if __name__ == '__main__':
+	import argparse
+	import time
+
+	parser = argparse.ArgumentParser(description='Time the downsampled views of a synthetic session')
+	parser.add_argument('--minutes', type=float, default=30, help='session length at 60 samples per second (default: 30)')
+	parser.add_argument('--width', type=int, default=800, help='points per channel (default: 800)')
+	args = parser.parse_args()
+
+	samples = int(args.minutes * 60 * 60)
+	t_ns = np.arange(samples, dtype=np.int64) * 16_666_667
+	rng = np.random.default_rng(1)
+	speed = 40 + 30 * np.sin(np.arange(samples) / 900) + rng.normal(0, 2, samples)
+	history = History(('speed',))
+	history.extend(t_ns, {'speed': speed})
+	for method in METHODS:
+		t0 = time.perf_counter()
+		view = history.view(width=args.width, method=method)
+		elapsed = time.perf_counter() - t0
+		times, values = view['channels']['speed']
+		print(f'{method:6s}  {samples} samples -> {len(times)} points in {elapsed * 1000:.1f} ms, '
+			f'max {max(values):.2f} of {speed.max():.2f}')
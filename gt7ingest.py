@@ -0,0 +1,260 @@
+import asyncio
+import socket
+import time
+from collections import namedtuple
+import gt7link
+import gt7packet
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# asyncio UDP ingestion shared by gt7telemetry.py and dashboard.py.
+#
+# IngestCore owns the telemetry socket and the heartbeat. Heartbeats run on their own
+# timer instead of every 100 packets, and are resent quickly whenever the stream goes
+# quiet. Whenever the socket is readable, everything the kernel has queued is drained in
+# one go, so datagrams never pile up there behind a slow consumer. Received datagrams are
+# handed to subscriptions, each consumed by its own task: raw subscriptions see every
+# datagram (recording), frame subscriptions see decoded packets (analysis, fan-out) and
+# latest subscriptions only ever hold the newest decoded packet (display). Decoding itself
+# is one more consumer of the raw stream, and feeds every decoded packet ID to core.link
+# (gt7link.LinkQuality).
+#
+# Given several console IPs, each one is heartbeated and watched for silence on its own,
+# and packet.addr tells the consoles apart (see gt7multi.py); core.link is then only
+# meaningful for a single console.
+#
+#   core = IngestCore(ip)
+#   frames = core.subscribe()
+#   async for packet in frames:
+#       print(packet.frame.packet_id)
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+# ports for send and receive data
+SendPort = 33739
+ReceivePort = 33740
+
+# t_ns: monotonic receive time, addr: sender, data: raw datagram, frame: TelemetryFrame (None when raw)
+Packet = namedtuple('Packet', 't_ns addr data frame')
+
+class Subscription:
+	"""Packet queue for one consumer, dropping the oldest packet when full (maxsize 0: unbounded)"""
+
+	def __init__(self, maxsize):
+		self.queue = asyncio.Queue(maxsize)
+		self.received = 0
+		self.dropped = 0
+
+	def put(self, packet):
+		self.received += 1
+		if self.queue.full():
+			self.queue.get_nowait()
+			self.dropped += 1
+		self.queue.put_nowait(packet)
+
+	async def get(self):
+		return await self.queue.get()
+
+	def __aiter__(self):
+		return self
+
+	async def __anext__(self):
+		return await self.queue.get()
+
+class TelemetryProtocol(asyncio.DatagramProtocol):
+	def __init__(self, core):
+		self.core = core
+
+	def datagram_received(self, data, addr):
+		self.core._received(data, addr)
+
+	def error_received(self, exc):
+		self.core.errors += 1
+
+class IngestCore:
+	"""Receives and decodes GT7 telemetry, keeping the stream alive with heartbeats
+
+	ip is one console address or a list of them.
+	"""
+
+	def __init__(self, ip, bind='0.0.0.0', port=ReceivePort, heartbeat='B',
+			heartbeat_interval=1.0, silence_timeout=0.5, retry_interval=0.25,
+			rcvbuf=1 << 20, batch=256, metrics=None):
+		self.ips = [ip] if isinstance(ip, str) else list(ip)
+		self.ip = self.ips[0]
+		self.bind = bind
+		self.port = port
+		self.heartbeat = heartbeat.encode('utf-8')
+		self.heartbeat_interval = heartbeat_interval	# while packets are flowing
+		self.silence_timeout = silence_timeout			# no packets for this long counts as silence
+		self.retry_interval = retry_interval			# heartbeat period while silent
+		self.rcvbuf = rcvbuf							# kernel receive buffer, room for a few seconds of packets
+		self.batch = batch								# most datagrams read per wakeup before yielding to the loop
+		self.decrypt = gt7packet.PacketDecryptor().decrypt
+		self.link = gt7link.LinkQuality()				# sees every decoded packet, before any subscription drops
+		self.metrics = metrics							# optional gt7metrics.Metrics for stage timing
+
+		self.loop = None
+		self.sock = None
+		self.transport = None
+		self.raw_subscriptions = []
+		self.frame_subscriptions = []
+		self.tasks = []
+		self.last_packet = 0.0
+		self.last_seen = {}		# console IP -> monotonic time of its last datagram
+		self.last_heartbeat = {}
+		self.packets = 0
+		self.invalid = 0
+		self.heartbeats = 0
+		self.errors = 0
+		self.batches = 0
+		self.max_batch = 0
+
+		if metrics is not None:
+			for stage in ('recv', 'queue', 'decrypt', 'decode'):
+				metrics.stage(stage)
+			metrics.counter('packets_total', lambda: self.packets, 'Datagrams received.')
+			metrics.counter('invalid_total', lambda: self.invalid, 'Datagrams that failed to decrypt or decode.')
+			metrics.counter('heartbeats_total', lambda: self.heartbeats, 'Heartbeats sent.')
+			metrics.counter('socket_errors_total', lambda: self.errors, 'Socket errors.')
+			metrics.gauge('packets_lost', lambda: self.link.lost, 'Packet IDs missing so far, less those that turned up late.')
+			metrics.counter('packets_late_total', lambda: self.link.late, 'Packets received out of order.')
+			metrics.gauge('jitter_seconds', lambda: self.link.jitter_ns / 1e9, 'Interarrival jitter.')
+
+	def subscribe_raw(self, maxsize=1024):
+		"""Every datagram as received, frame is None; maxsize 0 never drops any, e.g. for recording"""
+		sub = Subscription(maxsize)
+		self.raw_subscriptions.append(sub)
+		return sub
+
+	def subscribe(self, maxsize=64):
+		"""Decoded packets, datagrams that are not GT7 telemetry are left out"""
+		sub = Subscription(maxsize)
+		self.frame_subscriptions.append(sub)
+		return sub
+
+	def subscribe_latest(self):
+		"""Only the newest decoded packet, older ones still waiting are counted as dropped"""
+		return self.subscribe(maxsize=1)
+
+	def _received(self, data, addr, t_ns=None):
+		self.last_packet = self.last_seen[addr[0]] = time.monotonic()
+		self.packets += 1
+		packet = Packet(t_ns or time.monotonic_ns(), addr, data, None)
+		for sub in self.raw_subscriptions:
+			sub.put(packet)
+
+	def _drain(self):
+		# read until the socket would block, at most one batch per wakeup
+		recvfrom = self.sock.recvfrom
+		recv_stage = self.metrics.stage('recv') if self.metrics is not None else None
+		count = 0
+		while count < self.batch:
+			t0 = time.monotonic_ns()
+			try:
+				data, addr = recvfrom(4096)
+			except (BlockingIOError, InterruptedError):
+				break
+			except OSError:
+				self.errors += 1
+				break
+			t_ns = time.monotonic_ns()
+			if recv_stage is not None:
+				recv_stage.observe(t_ns - t0)
+			self._received(data, addr, t_ns)
+			count += 1
+		if count:
+			self.batches += 1
+			self.max_batch = max(self.max_batch, count)
+
+	def send_hb(self, ip=None):
+		"""Heartbeat one console, or all of them"""
+		for ip in (ip,) if ip else self.ips:
+			try:
+				if self.transport is not None:
+					self.transport.sendto(self.heartbeat, (ip, SendPort))
+				elif self.sock is not None:
+					self.sock.sendto(self.heartbeat, (ip, SendPort))
+				else:
+					return
+			except OSError:
+				self.errors += 1
+				continue
+			self.last_heartbeat[ip] = time.monotonic()
+			self.heartbeats += 1
+
+	async def _heartbeat_loop(self):
+		# every console on its own schedule, quicker while it is silent
+		while True:
+			now = time.monotonic()
+			for ip in self.ips:
+				# a single console may be given by name, anything received is from it
+				seen = self.last_seen.get(ip, 0.0) if len(self.ips) > 1 else self.last_packet
+				silent = now - seen > self.silence_timeout
+				due = self.retry_interval if silent else self.heartbeat_interval
+				if now - self.last_heartbeat.get(ip, 0.0) >= due:
+					self.send_hb(ip)
+			await asyncio.sleep(self.retry_interval / 2)
+
+	async def _decode_loop(self, raw):
+		decrypt = self.decrypt
+		decode = gt7packet.decode
+		link = self.link.update
+		metrics = self.metrics
+		if metrics is not None:
+			queue_stage = metrics.stage('queue')
+			decrypt_stage = metrics.stage('decrypt')
+			decode_stage = metrics.stage('decode')
+		async for packet in raw:
+			if metrics is None:
+				frame = decode(decrypt(packet.data))
+			else:
+				# time waiting for this task, then the decrypt and decode themselves
+				t0 = time.monotonic_ns()
+				queue_stage.observe(t0 - packet.t_ns)
+				data = decrypt(packet.data)
+				t1 = time.monotonic_ns()
+				frame = decode(data)
+				decode_stage.observe(time.monotonic_ns() - t1)
+				decrypt_stage.observe(t1 - t0)
+			if frame is None:
+				self.invalid += 1
+				continue
+			link(frame.packet_id, packet.t_ns)
+			packet = packet._replace(frame=frame)
+			for sub in self.frame_subscriptions:
+				sub.put(packet)
+
+	async def start(self):
+		self.loop = asyncio.get_running_loop()
+		sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		if self.rcvbuf:
+			sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+		sock.bind((self.bind, self.port))
+		sock.setblocking(False)
+		try:
+			self.loop.add_reader(sock, self._drain)
+			self.sock = sock
+		except NotImplementedError:
+			# no readiness callbacks (Windows proactor loop), take one callback per datagram instead
+			self.transport, _ = await self.loop.create_datagram_endpoint(lambda: TelemetryProtocol(self), sock=sock)
+		if self.frame_subscriptions:
+			self.tasks.append(asyncio.create_task(self._decode_loop(self.subscribe_raw())))
+		self.tasks.append(asyncio.create_task(self._heartbeat_loop()))
+
+	async def run(self):
+		"""Start receiving and run until cancelled"""
+		await self.start()
+		try:
+			await asyncio.gather(*self.tasks)
+		finally:
+			self.close()
+
+	def close(self):
+		for task in self.tasks:
+			task.cancel()
+		if self.transport is not None:
+			self.transport.close()
+			self.transport = None
+		if self.sock is not None:
+			self.loop.remove_reader(self.sock)
+			self.sock.close()
+			self.sock = None
@@ -0,0 +1,134 @@
+from collections import namedtuple
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Lap timing on the packet clock.
+#
+# The console sends one packet per simulation frame at a fixed 60 Hz and numbers them, so
+# the time between two packets is the difference of their IDs divided by the packet rate,
+# however late they arrive and whatever speed a replay runs at. A lap starts with the
+# first packet carrying the new lap number and ends with the first packet of the next
+# lap. Frames with the paused or loading flag don't count towards the lap time. After a
+# lap ends, the console's own time for it (last lap time at 0x7C) is picked up as a cross
+# check, and compared with its best lap time (0x78) to tell a new best lap. Feed every
+# packet in order of arrival:
+#
+#   laps = LapTracker()
+#   for event in laps.update(frame):
+#       print(event)
+#   print(laps.lap_ms())
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+PACKET_RATE = 60.0
+
+# kind: start, end, official, best, pause, resume, loading, loaded or reset; ms: lap time at the event
+LapEvent = namedtuple('LapEvent', 'kind lap packet_id ms')
+
+# start_id/end_id: first packet of this lap and of the next one, gap: packets missing right
+# before end_id (the uncertainty of the boundary), partial: timing started mid-lap, best:
+# the console's best lap time is this lap's official time
+Lap = namedtuple('Lap', 'lap start_id end_id frames paused_frames ms official_ms gap partial best')
+
+# packets to wait after a lap change for the console's last lap time to update, a time
+# that doesn't change by then is the same as the lap before
+OFFICIAL_WAIT = 120
+
+# a packet ID jump bigger than this (either way) is a new stream
+RESYNC = 1000
+
+class LapTracker:
+	"""Lap segmentation and timing from packet IDs"""
+
+	def __init__(self, rate=PACKET_RATE):
+		self.frame_ms = 1000.0 / rate
+		self.laps = []			# completed laps, oldest first
+		self.resets = 0
+		self.reset()
+
+	def reset(self):
+		"""Forget the current lap, the next packet starts over"""
+		self.lap = None			# lap number of the last packet, None before the first one
+		self.start_id = None	# first packet of the current lap, None while not on a lap
+		self.last_id = None
+		self.partial = False
+		self.paused_frames = 0
+		self.paused = False
+		self.loading = False
+		self.last_lap_ms = None
+		self.pending = None		# [index into laps, last lap time before the change, packets waited]
+
+	def lap_frames(self, packet_id=None):
+		"""Frames driven on the current lap, up to the given or the last packet"""
+		if self.start_id is None:
+			return 0
+		packet_id = self.last_id if packet_id is None else packet_id
+		return max(0, packet_id - self.start_id - self.paused_frames)
+
+	def lap_ms(self, packet_id=None):
+		return self.lap_frames(packet_id) * self.frame_ms
+
+	def update(self, frame):
+		"""Advance with one packet, returns the LapEvents it caused"""
+		events = []
+		packet_id = frame.packet_id
+		last_id = self.last_id
+		if last_id is not None:
+			if abs(packet_id - last_id) > RESYNC:
+				self.resets += 1
+				self.reset()
+				events.append(LapEvent('reset', frame.current_lap, packet_id, 0.0))
+				last_id = None
+			elif packet_id <= last_id:
+				return events	# duplicate or late, the lap has moved on already
+		step = packet_id - last_id if last_id is not None else 0
+		lap = self.lap
+
+		# pausing and loading stop the lap clock
+		paused = frame.is_paused
+		loading = frame.is_loading
+		if paused or loading:
+			self.paused_frames += step
+		if paused != self.paused:
+			self.paused = paused
+			events.append(LapEvent('pause' if paused else 'resume', lap, packet_id, self.lap_ms(packet_id)))
+		if loading != self.loading:
+			self.loading = loading
+			events.append(LapEvent('loading' if loading else 'loaded', lap, packet_id, self.lap_ms(packet_id)))
+		self.last_id = packet_id
+
+		current = frame.current_lap
+		if current != lap:
+			if lap and self.start_id is not None and current == lap + 1:
+				frames = packet_id - self.start_id - self.paused_frames
+				done = Lap(lap, self.start_id, packet_id, frames, self.paused_frames,
+					frames * self.frame_ms, None, step - 1, self.partial, False)
+				self.laps.append(done)
+				events.append(LapEvent('end', lap, packet_id, done.ms))
+				self.pending = [len(self.laps) - 1, self.last_lap_ms, 0]
+			self.lap = current
+			self.paused_frames = 0
+			if current > 0:
+				# without seeing the lap change, timing starts from the first packet seen
+				self.partial = lap is None
+				self.start_id = packet_id
+				events.append(LapEvent('start', current, packet_id, 0.0))
+			else:
+				self.start_id = None
+
+		# the console's own time for the lap just completed, with or shortly after the change
+		pending = self.pending
+		if pending is not None:
+			index, before, waited = pending
+			official = frame.last_lap_ms
+			if official > 0 and (official != before or waited >= OFFICIAL_WAIT):
+				best = official == frame.best_lap_ms
+				done = self.laps[index] = self.laps[index]._replace(official_ms=official, best=best)
+				events.append(LapEvent('official', done.lap, packet_id, float(official)))
+				if best:
+					events.append(LapEvent('best', done.lap, packet_id, float(official)))
+				self.pending = None
+			elif waited >= OFFICIAL_WAIT:
+				self.pending = None
+			else:
+				pending[2] += 1
+		self.last_lap_ms = frame.last_lap_ms
+		return events
@@ -0,0 +1,327 @@
+import argparse
+import math
+import os
+import sqlite3
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+from datetime import datetime as dt
+import gt7capture
+import gt7laps
+import gt7packet
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Columnar per-lap telemetry store with an sqlite catalog.
+#
+# Every completed lap is one file of column arrays, one value per packet of the lap:
+#
+#   header     <8sIH     magic, frames, number of columns
+#   directory  <16scQ    per column: name, array typecode, file offset of its data
+#   data                 the columns back to back, little-endian
+#
+# so loading one trace reads a few hundred bytes of directory and that column, nothing
+# else. catalog.sqlite in the same directory holds one row per lap (track, car, date,
+# lap time, file) with indexes for "best laps of this car on this track" style queries.
+#
+#   store = LapStore('laps')
+#   for entry in store.best_laps(track=847, car=3343):
+#       speed = store.load(entry, ['speed'])['speed']
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+LAP_MAGIC = b'GT7LAP\x00\x01'
+LAP_HEADER = struct.Struct('<8sIH')
+LAP_COLUMN = struct.Struct('<16scQ')
+
+CATALOG = 'catalog.sqlite'
+
+# (column, array typecode, frame field or None when derived while recording)
+COLUMNS = (
+	('time', 'f', None),				# s since the lap started, on the packet clock
+	('distance', 'f', None),			# m driven since the lap started
+	('packet_id', 'i', 'packet_id'),
+	('throttle', 'f', None),			# %
+	('brake', 'f', None),				# %
+	('speed', 'f', 'speed'),			# m/s
+	('rpm', 'f', 'rpm'),
+	('gear', 'b', None),				# 0 reverse, as the displays read it
+	('position_x', 'f', 'position_x'),
+	('position_y', 'f', 'position_y'),
+	('position_z', 'f', 'position_z'),
+	('accel_sway', 'f', 'accel_sway'),
+	('accel_heave', 'f', 'accel_heave'),
+	('accel_surge', 'f', 'accel_surge'),
+	('fuel_level', 'f', 'fuel_level'),
+)
+COLUMN_NAMES = tuple(name for name, _, _ in COLUMNS)
+
+LapEntry = namedtuple('LapEntry', 'id session recorded track car lap lap_ms official_ms frames partial file')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS laps (
+	id INTEGER PRIMARY KEY,
+	session TEXT NOT NULL,
+	recorded TEXT NOT NULL,
+	track INTEGER,
+	car INTEGER NOT NULL,
+	lap INTEGER NOT NULL,
+	lap_ms REAL NOT NULL,
+	official_ms INTEGER,
+	frames INTEGER NOT NULL,
+	partial INTEGER NOT NULL,
+	file TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS laps_track_car_time ON laps (track, car, partial, lap_ms);
+CREATE INDEX IF NOT EXISTS laps_car_time ON laps (car, partial, lap_ms);
+CREATE INDEX IF NOT EXISTS laps_recorded ON laps (recorded);
+CREATE INDEX IF NOT EXISTS laps_session ON laps (session);
+'''
+
+def write_lap_file(filename, columns):
+	"""Write a dict of column name -> array as one lap file"""
+	names = [name for name in COLUMN_NAMES if name in columns]
+	frames = len(columns[names[0]]) if names else 0
+	offset = LAP_HEADER.size + LAP_COLUMN.size * len(names)
+	directory = []
+	for name in names:
+		directory.append(LAP_COLUMN.pack(name.encode(), columns[name].typecode.encode(), offset))
+		offset += len(columns[name]) * columns[name].itemsize
+	with open(filename, 'wb') as f:
+		f.write(LAP_HEADER.pack(LAP_MAGIC, frames, len(names)))
+		f.write(b''.join(directory))
+		for name in names:
+			data = columns[name]
+			if sys.byteorder == 'big':
+				data = array(data.typecode, data)
+				data.byteswap()
+			f.write(data.tobytes())
+
+def read_lap_file(filename, names=None):
+	"""Read the named columns (all by default) of a lap file into a dict of arrays"""
+	with open(filename, 'rb') as f:
+		magic, frames, count = LAP_HEADER.unpack(f.read(LAP_HEADER.size))
+		if magic != LAP_MAGIC:
+			raise ValueError(f'{filename} is not a GT7 lap file')
+		directory = {}
+		for name, typecode, offset in LAP_COLUMN.iter_unpack(f.read(LAP_COLUMN.size * count)):
+			directory[name.rstrip(b'\x00').decode()] = (typecode.decode(), offset)
+
+		columns = {}
+		for name in (names if names is not None else directory):
+			typecode, offset = directory[name]
+			data = array(typecode)
+			f.seek(offset)
+			data.frombytes(f.read(frames * data.itemsize))
+			if sys.byteorder == 'big':
+				data.byteswap()
+			columns[name] = data
+		return columns
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+class LapStore:
+	"""Directory of lap files plus their catalog"""
+
+	def __init__(self, path):
+		self.path = path
+		os.makedirs(path, exist_ok=True)
+		# written from the ingest thread, queried from request handlers
+		self.db = sqlite3.connect(os.path.join(path, CATALOG), check_same_thread=False)
+		self.db.executescript(_SCHEMA)
+
+	def add(self, lap, columns, car, track=None, session='', recorded=None):
+		"""Store a completed gt7laps.Lap with its columns, returns the catalog entry"""
+		recorded = recorded or dt.now()
+		with self.db:
+			cursor = self.db.execute(
+				'INSERT INTO laps (session, recorded, track, car, lap, lap_ms, official_ms, frames, partial, file) '
+				'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+				(session, recorded.isoformat(timespec='seconds'), track, car, lap.lap, lap.ms,
+					lap.official_ms, lap.frames, int(lap.partial), ''))
+			lap_id = cursor.lastrowid
+			file = f'{lap_id:08d}.gt7lap'
+			write_lap_file(os.path.join(self.path, file), columns)
+			self.db.execute('UPDATE laps SET file = ? WHERE id = ?', (file, lap_id))
+		return self.get(lap_id)
+
+	def set_official(self, lap_id, official_ms):
+		with self.db:
+			self.db.execute('UPDATE laps SET official_ms = ? WHERE id = ?', (official_ms, lap_id))
+
+	def set_track(self, session, track):
+		"""Fill in the track of a session's laps stored before it was detected"""
+		with self.db:
+			self.db.execute('UPDATE laps SET track = ? WHERE session = ? AND track IS NULL', (track, session))
+
+	def get(self, lap_id):
+		row = self.db.execute(f'SELECT {", ".join(LapEntry._fields)} FROM laps WHERE id = ?', (lap_id,)).fetchone()
+		return LapEntry(*row) if row else None
+
+	def query(self, track=None, car=None, since=None, until=None, complete=True, order='lap_ms', limit=None):
+		"""Catalog entries matching all given filters, fastest first by default"""
+		where = []
+		args = []
+		for column, op, value in (('track', '=', track), ('car', '=', car), ('recorded', '>=', since), ('recorded', '<', until)):
+			if value is not None:
+				where.append(f'{column} {op} ?')
+				args.append(value.isoformat(timespec='seconds') if isinstance(value, dt) else value)
+		if complete:
+			where.append('partial = 0')
+		if order not in ('lap_ms', 'recorded', 'id'):
+			raise ValueError(f'cannot order by {order}')
+		sql = f'SELECT {", ".join(LapEntry._fields)} FROM laps'
+		if where:
+			sql += ' WHERE ' + ' AND '.join(where)
+		sql += f' ORDER BY {order}'
+		if limit is not None:
+			sql += ' LIMIT ?'
+			args.append(limit)
+		return [LapEntry(*row) for row in self.db.execute(sql, args)]
+
+	def best_laps(self, track, car, count=5):
+		return self.query(track=track, car=car, limit=count)
+
+	def load(self, entry, names=None):
+		"""Columns of a stored lap (entry or id), only the named ones if given"""
+		if not isinstance(entry, LapEntry):
+			entry = self.get(entry)
+		return read_lap_file(os.path.join(self.path, entry.file), names)
+
+	def close(self):
+		self.db.close()
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+class LapRecorder:
+	"""Collects the packets of each lap into columns and stores completed laps
+
+	Call update() with every packet and the events its LapTracker returned for it.
+	"""
+
+	def __init__(self, store, tracker, detector=None, session=None):
+		self.store = store
+		self.tracker = tracker
+		self.detector = detector		# gt7trackdetect.TrackDetector, optional
+		self.session = session or dt.now().strftime('%Y%m%d-%H%M%S')
+		self.track = None
+		self.stored = {}				# lap number -> catalog id, for the official time
+		self.clear()
+
+	def clear(self):
+		self.columns = {name: array(typecode) for name, typecode, _ in COLUMNS}
+		self.last_position = None
+		self.distance = 0.0
+
+	def update(self, frame, events, recorded=None):
+		"""Returns the catalog entry of a lap stored by this packet, else None"""
+		# the detector decides on the packet that ends the first lap, before that lap is stored
+		if self.detector is not None and not (frame.is_paused or frame.is_loading) and frame.current_lap > 0:
+			self.detector.update(frame.current_lap, frame.position_x, frame.position_z)
+			if self.detector.track != self.track:
+				self.track = self.detector.track
+				if self.track is not None:
+					self.store.set_track(self.session, self.track)
+
+		entry = None
+		for event in events:
+			if event.kind == 'end' and len(self.columns['time']):
+				lap = self.tracker.laps[-1]
+				entry = self.store.add(lap, self.columns, frame.car_id, self.track, self.session, recorded)
+				self.stored[lap.lap] = entry.id
+			elif event.kind == 'official' and event.lap in self.stored:
+				self.store.set_official(self.stored.pop(event.lap), int(event.ms))
+			if event.kind in ('start', 'reset'):
+				self.clear()
+
+		if self.tracker.start_id is not None and not (frame.is_paused or frame.is_loading):
+			self._append(frame)
+		return entry
+
+	def _append(self, frame):
+		columns = self.columns
+		position = (frame.position_x, frame.position_y, frame.position_z)
+		if self.last_position is not None:
+			self.distance += math.dist(position, self.last_position)
+		self.last_position = position
+
+		columns['time'].append(self.tracker.lap_ms(frame.packet_id) / 1000)
+		columns['distance'].append(self.distance)
+		columns['throttle'].append(frame.throttle)
+		columns['brake'].append(frame.brake)
+		columns['gear'].append(min(frame.current_gear, 15))
+		for name, _, field in COLUMNS:
+			if field is not None:
+				columns[name].append(getattr(frame, field))
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+def import_capture(store, filename, detect=True):
+	"""Store every lap of a capture file, returns the number of laps stored"""
+	tracker = gt7laps.LapTracker()
+	detector = None
+	if detect:
+		import gt7trackdetect
+		detector = gt7trackdetect.TrackDetector()
+	session = os.path.basename(filename)
+	recorded = dt.fromtimestamp(os.path.getmtime(filename))
+	recorder = LapRecorder(store, tracker, detector, session=session)
+	decrypt = gt7packet.PacketDecryptor().decrypt
+	stored = 0
+	with gt7capture.CaptureReader(filename) as capture:
+		for _, data in capture.records():
+			frame = gt7packet.decode(decrypt(data))
+			if frame is None:
+				continue
+			if recorder.update(frame, tracker.update(frame), recorded) is not None:
+				stored += 1
+	return stored
+
+def format_laptime(ms):
+	minutes, seconds = divmod(ms / 1000, 60)
+	return f'{int(minutes)}:{seconds:06.3f}'
+
+def print_entries(entries):
+	for entry in entries:
+		official = format_laptime(entry.official_ms) if entry.official_ms else '-'
+		track = entry.track if entry.track is not None else '?'
+		print(f'{entry.id:6d}  {entry.recorded}  track {track:>5}  car {entry.car:>5}  lap {entry.lap:3d}  '
+			f'{format_laptime(entry.lap_ms)} (console {official}){"  partial" if entry.partial else ""}')
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Per-lap telemetry store')
+	parser.add_argument('--store', default='laps', help='store directory (default: laps)')
+	commands = parser.add_subparsers(dest='command', required=True)
+	command = commands.add_parser('import', help='store the laps of capture files')
+	command.add_argument('captures', nargs='+', metavar='CAPTURE')
+	command.add_argument('--no-detect', action='store_true', help='skip track detection')
+	for name, description in (('list', 'list stored laps'), ('best', 'fastest complete laps')):
+		command = commands.add_parser(name, help=description)
+		command.add_argument('--track', type=int)
+		command.add_argument('--car', type=int)
+		command.add_argument('-n', '--count', type=int, default=5 if name == 'best' else None)
+	command = commands.add_parser('show', help='print columns of a stored lap')
+	command.add_argument('id', type=int)
+	command.add_argument('columns', nargs='*', metavar='COLUMN', help=f'any of {", ".join(COLUMN_NAMES)}')
+	args = parser.parse_args()
+
+	store = LapStore(args.store)
+	if args.command == 'import':
+		for filename in args.captures:
+			print(f'{filename}: {import_capture(store, filename, not args.no_detect)} laps stored')
+	elif args.command in ('list', 'best'):
+		start = time.perf_counter()
+		if args.command == 'best':
+			entries = store.query(track=args.track, car=args.car, limit=args.count)
+		else:
+			entries = store.query(track=args.track, car=args.car, complete=False, order='id', limit=args.count)
+		elapsed = time.perf_counter() - start
+		print_entries(entries)
+		print(f'{len(entries)} laps ({elapsed * 1000:.2f} ms)')
+	elif args.command == 'show':
+		names = args.columns or ['time', 'distance', 'speed', 'throttle', 'brake', 'gear']
+		columns = store.load(args.id, names)
+		print(' '.join(f'{name:>10}' for name in names))
+		for row in zip(*(columns[name] for name in names)):
+			print(' '.join(f'{value:10.3f}' if isinstance(value, float) else f'{value:10d}' for value in row))
+	store.close()
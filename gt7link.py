@@ -0,0 +1,149 @@
+import time
+from collections import deque
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Link quality from the packet ID at 0x70, which the console increments once per packet.
+#
+# Every packet updates a 64 bit receive bitmap behind the highest ID seen so far, so gaps,
+# duplicates and late (out of order) packets are told apart in constant time and memory.
+# A gap counts as lost until the missing ID turns up late. Jitter is the RFC 3550
+# interarrival jitter, measured against the console's nominal 60 Hz spacing. Counters are
+# kept per window (one second by default), the last few completed windows are kept for
+# rolling figures:
+#
+#   link = LinkQuality()
+#   link.update(frame.packet_id, packet.t_ns)
+#   print(link.summary())
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+PACKET_INTERVAL_NS = 1e9 / 60
+
+# IDs tracked behind the newest one, older stragglers count as late but can't be matched
+HISTORY = 64
+HISTORY_MASK = (1 << HISTORY) - 1
+
+# a jump bigger than this (either way) is a new stream, e.g. the game or console restarted
+RESYNC = 1000
+
+class LinkWindow:
+	"""Counters for one window of packets"""
+
+	__slots__ = ('start_ns', 'end_ns', 'received', 'lost', 'duplicates', 'late', 'jitter_ns', 'max_jitter_ns')
+
+	def __init__(self, start_ns):
+		self.start_ns = start_ns
+		self.end_ns = start_ns
+		self.received = 0
+		self.lost = 0
+		self.duplicates = 0
+		self.late = 0
+		self.jitter_ns = 0.0
+		self.max_jitter_ns = 0.0
+
+class LinkQuality:
+	"""Streaming gap, duplicate, reordering and jitter analysis of packet IDs"""
+
+	def __init__(self, window=1.0, windows=10, interval_ns=PACKET_INTERVAL_NS):
+		self.window_ns = int(window * 1e9)
+		self.interval_ns = interval_ns
+		self.windows = deque(maxlen=windows)	# completed windows, newest last
+		self.current = None
+		self.reset()
+
+		# totals since start
+		self.received = 0
+		self.lost = 0
+		self.duplicates = 0
+		self.late = 0
+		self.resyncs = 0
+
+	def reset(self):
+		"""Forget the ID history, the next packet starts a new stream"""
+		self.highest = None
+		self.first = None		# first ID of the stream, older ones were never part of a gap
+		self.bitmap = 0			# bit n set: ID highest - n was received
+		self.last_arrival = None
+		self.last_id = None
+		self.jitter_ns = 0.0
+
+	def _window(self, t_ns):
+		current = self.current
+		if current is None:
+			current = self.current = LinkWindow(t_ns)
+		elif t_ns - current.start_ns >= self.window_ns:
+			self.windows.append(current)
+			current = self.current = LinkWindow(t_ns)
+		current.end_ns = t_ns
+		return current
+
+	def update(self, packet_id, t_ns=None):
+		if t_ns is None:
+			t_ns = time.monotonic_ns()
+		window = self._window(t_ns)
+		window.received += 1
+		self.received += 1
+
+		highest = self.highest
+		if highest is not None and abs(packet_id - highest) > RESYNC:
+			self.resyncs += 1
+			self.reset()
+			highest = None
+		if highest is None:
+			self.highest = packet_id
+			self.first = packet_id
+			self.bitmap = 1
+		elif packet_id > highest:
+			gap = packet_id - highest - 1
+			if gap:
+				window.lost += gap
+				self.lost += gap
+			self.bitmap = ((self.bitmap << (gap + 1)) | 1) & HISTORY_MASK
+			self.highest = packet_id
+		else:
+			age = highest - packet_id
+			bit = 1 << age if age < HISTORY else 0
+			if self.bitmap & bit:
+				window.duplicates += 1
+				self.duplicates += 1
+				return
+			# late, it was counted as lost when the gap opened
+			self.bitmap |= bit
+			window.late += 1
+			self.late += 1
+			if bit and packet_id > self.first:
+				window.lost -= 1
+				self.lost -= 1
+			return
+
+		# RFC 3550 jitter, only between packets arriving in order
+		if self.last_arrival is not None:
+			transit = (t_ns - self.last_arrival) - (packet_id - self.last_id) * self.interval_ns
+			self.jitter_ns += (abs(transit) - self.jitter_ns) / 16
+			window.jitter_ns = self.jitter_ns
+			if self.jitter_ns > window.max_jitter_ns:
+				window.max_jitter_ns = self.jitter_ns
+		self.last_arrival = t_ns
+		self.last_id = packet_id
+
+	def summary(self, windows=None):
+		"""Rates over the last completed windows (all kept ones by default), as a dict"""
+		recent = list(self.windows)[-windows:] if windows else list(self.windows)
+		if not recent and self.current is not None:
+			recent = [self.current]
+		received = sum(w.received for w in recent)
+		lost = max(0, sum(w.lost for w in recent))
+		duplicates = sum(w.duplicates for w in recent)
+		late = sum(w.late for w in recent)
+		span_ns = recent[-1].end_ns - recent[0].start_ns if recent else 0
+		expected = received - duplicates + lost
+		return {
+			'rate': received * 1e9 / span_ns if span_ns > 0 else 0.0,
+			'received': received,
+			'lost': lost,
+			'duplicates': duplicates,
+			'late': late,
+			'loss_pct': 100.0 * lost / expected if expected else 0.0,
+			'late_pct': 100.0 * late / expected if expected else 0.0,
+			'jitter_ms': recent[-1].jitter_ns / 1e6 if recent else 0.0,
+			'max_jitter_ms': max(w.max_jitter_ns for w in recent) / 1e6 if recent else 0.0,
+		}
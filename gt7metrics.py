@@ -0,0 +1,112 @@
+from bisect import bisect_left
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Cheap pipeline timing.
+#
+# Each stage gets a fixed-bucket histogram of nanosecond durations. Observing is a bisect
+# and a few integer adds, so the probes can stay on all the time. Probes are written as
+#
+#   t0 = time.monotonic_ns()
+#   ...
+#   decrypt_stage.observe(time.monotonic_ns() - t0)
+#
+# Metrics.render() produces the Prometheus text format for a /metrics route,
+# Metrics.summary() a one line p50/p99 overview for the terminal.
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+# upper bucket bounds in ns, 1 µs to 1 s, anything slower lands in the overflow bucket
+BUCKETS_NS = (
+	1_000, 2_000, 5_000, 10_000, 20_000, 50_000, 100_000, 200_000, 500_000,
+	1_000_000, 2_000_000, 5_000_000, 10_000_000, 20_000_000, 50_000_000,
+	100_000_000, 200_000_000, 500_000_000, 1_000_000_000,
+)
+
+class Histogram:
+	"""Fixed-bucket histogram of durations in ns"""
+
+	__slots__ = ('name', 'bounds', 'counts', 'count', 'sum_ns', 'max_ns')
+
+	def __init__(self, name, bounds=BUCKETS_NS):
+		self.name = name
+		self.bounds = bounds
+		self.counts = [0] * (len(bounds) + 1)
+		self.count = 0
+		self.sum_ns = 0
+		self.max_ns = 0
+
+	def observe(self, ns):
+		self.counts[bisect_left(self.bounds, ns)] += 1
+		self.count += 1
+		self.sum_ns += ns
+		if ns > self.max_ns:
+			self.max_ns = ns
+
+	def quantile(self, q):
+		"""Upper bound of the bucket holding quantile q, the maximum for the overflow bucket"""
+		if not self.count:
+			return 0
+		rank = q * self.count
+		seen = 0
+		for bound, count in zip(self.bounds, self.counts):
+			seen += count
+			if seen >= rank:
+				return min(bound, self.max_ns)
+		return self.max_ns
+
+	def mean(self):
+		return self.sum_ns / self.count if self.count else 0.0
+
+class Metrics:
+	"""Named stage histograms plus counters and gauges read when rendered"""
+
+	def __init__(self, prefix='gt7'):
+		self.prefix = prefix
+		self.stages = {}
+		self.values = {}	# name -> (kind, help, function)
+
+	def stage(self, name):
+		"""Histogram for a pipeline stage, created on first use"""
+		hist = self.stages.get(name)
+		if hist is None:
+			hist = self.stages[name] = Histogram(name)
+		return hist
+
+	def counter(self, name, function, help=''):
+		self.values[name] = ('counter', help, function)
+
+	def gauge(self, name, function, help=''):
+		self.values[name] = ('gauge', help, function)
+
+	def render(self):
+		"""Prometheus text exposition format"""
+		prefix = self.prefix
+		lines = []
+		# stages may be added from other threads while rendering
+		stages = list(self.stages.items())
+		if stages:
+			name = f'{prefix}_stage_seconds'
+			lines.append(f'# HELP {name} Time spent per pipeline stage.')
+			lines.append(f'# TYPE {name} histogram')
+			for stage, hist in stages:
+				cumulative = 0
+				for bound, count in zip(hist.bounds, hist.counts):
+					cumulative += count
+					lines.append(f'{name}_bucket{{stage="{stage}",le="{bound / 1e9:g}"}} {cumulative}')
+				lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+				lines.append(f'{name}_sum{{stage="{stage}"}} {hist.sum_ns / 1e9:.9f}')
+				lines.append(f'{name}_count{{stage="{stage}"}} {hist.count}')
+		for key, (kind, help, function) in list(self.values.items()):
+			name = f'{prefix}_{key}'
+			if help:
+				lines.append(f'# HELP {name} {help}')
+			lines.append(f'# TYPE {name} {kind}')
+			lines.append(f'{name} {function()}')
+		return '\n'.join(lines) + '\n'
+
+	def summary(self):
+		"""p50/p99 per stage on one line, in µs"""
+		parts = []
+		for stage, hist in list(self.stages.items()):
+			if hist.count:
+				parts.append(f'{stage} {hist.quantile(0.5) / 1000:.0f}/{hist.quantile(0.99) / 1000:.0f}')
+		return 'p50/p99 µs: ' + '  '.join(parts) if parts else ''
@@ -0,0 +1,502 @@
+import argparse
+import asyncio
+import math
+import os
+import socket
+import struct
+import threading
+import time
+import numpy as np
+import gt7packet
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Motion cueing for a motion rig.
+#
+# The car's accelerations (accel_sway, accel_heave, accel_surge) and angular velocities are
+# turned into a seat pose with the classic washout algorithm, stepped once per packet on
+# the 60 Hz packet clock:
+#   - translation: third-order high-pass of the acceleration, integrated twice, so onsets
+#     are felt and the seat creeps back to centre even under a sustained acceleration
+#   - rotation: second-order high-pass of the angular velocity, integrated once
+#   - tilt coordination: the low-passed surge and sway accelerations tilt the seat, rate
+#     limited, so gravity keeps pushing the driver back or sideways under sustained loads
+#
+# Every packet gets a jitter-free time (its packet ID on the 60 Hz clock, plus the
+# smallest recent transit delay). The output runs on its own fixed rate and reads the
+# pose a playout delay (a little over a packet interval) in the past, interpolated
+# between packets, or extrapolated along the last segment for a while when a packet is
+# late. After that it holds, then fades back to neutral.
+#
+# Each output frame is 18 bytes, little-endian (MOTION_FRAME):
+#
+#   uint8 sync (0xA5), uint8 seq, uint8 flags (FLAG_*), uint16 source packet ID,
+#   int16 surge, sway, heave, roll, pitch, yaw (-32767..32767 of the rig's travel),
+#   uint8 checksum (all 18 bytes sum to 0 mod 256)
+#
+# sent as UDP datagrams or written to a serial port:
+#
+#   python3 gt7motion.py 192.168.1.123 --udp 192.168.1.50:33760
+#   python3 gt7motion.py --relay --serial /dev/ttyUSB0 --baud 115200
+#   python3 gt7motion.py --bench serial
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+PACKET_RATE = 60.0
+GRAVITY = 9.81
+
+RATE = 250.0				# output frames per second
+# s playout delay: one packet interval (16.7 ms) plus about 8 ms for jitter, so the pose is
+# interpolated between packets that arrive on time, and only extrapolated for one later than that
+DELAY = 0.025
+MAX_EXTRAPOLATION = 0.050	# s past the newest packet the pose is extrapolated
+STALE = 0.5					# s without packets before the pose fades to neutral
+FADE = 0.5					# s time constant of that fade
+MAX_GAP = 30				# packets a gap in packet IDs is stepped through at most
+CLOCK_RISE = 0.002			# s per s the transit delay estimate may grow by
+
+# pose axes, in frame order: translations in m, rotations in rad
+AXES = ('surge', 'sway', 'heave', 'roll', 'pitch', 'yaw')
+
+# travel of the rig either side of neutral, mapped to full scale setpoints
+LIMITS = dict(surge=0.10, sway=0.10, heave=0.08, roll=0.25, pitch=0.25, yaw=0.20)
+
+# washout tuning: (gain, natural frequency rad/s, damping) of each high-pass, the
+# translational break frequency, and the tilt coordination low-pass and rate limit
+TRANSLATION = dict(surge=(0.08, 2.5, 1.0), sway=(0.08, 2.5, 1.0), heave=(0.05, 3.0, 1.0))
+TRANSLATION_BREAK = 0.5
+ROTATION = dict(roll=(0.5, 1.0, 1.0), pitch=(0.5, 1.0, 1.0), yaw=(0.3, 0.8, 1.0))
+TILT = dict(pitch=(0.3, 5.0, 1.0), roll=(0.3, 5.0, 1.0))
+TILT_RATE = 0.1				# rad/s, stays below what the inner ear notices
+
+# fields used, for a prefix decryptor or a gt7relay subscription
+MOTION_FIELDS = ('packet_id', 'flags', 'accel_sway', 'accel_heave', 'accel_surge',
+	'angular_vel_x', 'angular_vel_y', 'angular_vel_z')
+
+SYNC = 0xA5
+FLAG_ACTIVE = 1 << 0		# car on track and not paused
+FLAG_EXTRAPOLATED = 1 << 1	# pose extrapolated past the newest packet
+FLAG_STALE = 1 << 2			# no packets for a while, holding or fading
+MOTION_FRAME = struct.Struct('<BBBH6hB')
+
+def _bilinear(num, den, dt):
+	"""Discrete (b, a) of the continuous num(s)/den(s), coefficients highest power first"""
+	order = len(den) - 1
+	num = [0.0] * (order + 1 - len(num)) + list(num)
+	k = 2.0 / dt
+	b = np.zeros(order + 1)
+	a = np.zeros(order + 1)
+	# s = k (z - 1) / (z + 1), multiplied through by (z + 1)^order
+	for i in range(order + 1):
+		power = order - i
+		term = (np.poly1d([k, -k]) ** power * np.poly1d([1.0, 1.0]) ** (order - power)).coeffs
+		b += num[i] * term
+		a += den[i] * term
+	return b / a[0], a / a[0]
+
+class Filter:
+	"""Discrete transfer function, one sample per call (direct form II transposed)"""
+
+	def __init__(self, num, den, dt=1.0 / PACKET_RATE):
+		b, a = _bilinear(num, den, dt)
+		self.b = b.tolist()
+		self.a = a.tolist()
+		self.state = [0.0] * (len(a) - 1)
+
+	def reset(self):
+		self.state = [0.0] * len(self.state)
+
+	def __call__(self, x):
+		b = self.b
+		a = self.a
+		state = self.state
+		y = b[0] * x + state[0]
+		last = len(state) - 1
+		for i in range(last):
+			state[i] = b[i + 1] * x - a[i + 1] * y + state[i + 1]
+		state[last] = b[last + 1] * x - a[last + 1] * y
+		return y
+
+def translation_filter(gain, omega, zeta, omega_b=TRANSLATION_BREAK, dt=1.0 / PACKET_RATE):
+	"""Position from acceleration: third-order high-pass, integrated twice"""
+	den = np.polymul([1.0, 2 * zeta * omega, omega * omega], [1.0, omega_b])
+	return Filter([gain, 0.0], den, dt)
+
+def rotation_filter(gain, omega, zeta, dt=1.0 / PACKET_RATE):
+	"""Angle from angular velocity: second-order high-pass, integrated once"""
+	return Filter([gain, 0.0], [1.0, 2 * zeta * omega, omega * omega], dt)
+
+def tilt_filter(gain, omega, zeta, dt=1.0 / PACKET_RATE):
+	"""Sustained part of an acceleration: second-order low-pass"""
+	return Filter([gain * omega * omega], [1.0, 2 * zeta * omega, omega * omega], dt)
+
+class Washout:
+	"""Classic washout with tilt coordination, stepped once per packet"""
+
+	def __init__(self, dt=1.0 / PACKET_RATE):
+		self.dt = dt
+		self.translation = {axis: translation_filter(*TRANSLATION[axis], dt=dt) for axis in ('surge', 'sway', 'heave')}
+		self.rotation = {axis: rotation_filter(*ROTATION[axis], dt=dt) for axis in ('roll', 'pitch', 'yaw')}
+		self.tilt_filters = {axis: tilt_filter(*TILT[axis], dt=dt) for axis in ('pitch', 'roll')}
+		self.tilt = dict(pitch=0.0, roll=0.0)
+
+	def _tilt(self, axis, accel):
+		# the angle at which gravity alone would give this acceleration, approached at a limited rate
+		target = math.asin(max(-1.0, min(1.0, self.tilt_filters[axis](accel) / GRAVITY)))
+		step = TILT_RATE * self.dt
+		current = self.tilt[axis]
+		current += max(-step, min(step, target - current))
+		self.tilt[axis] = current
+		return current
+
+	def step(self, surge, sway, heave, roll_rate, pitch_rate, yaw_rate):
+		"""Pose (AXES order) after one packet of accelerations (m/s²) and angular velocities (rad/s)"""
+		translation = self.translation
+		rotation = self.rotation
+		return (
+			translation['surge'](surge),
+			translation['sway'](sway),
+			translation['heave'](heave),
+			rotation['roll'](roll_rate) + self._tilt('roll', sway),
+			rotation['pitch'](pitch_rate) + self._tilt('pitch', surge),
+			rotation['yaw'](yaw_rate),
+		)
+
+class PacketClock:
+	"""Jitter-free packet times: the packet ID on the 60 Hz clock plus the smallest recent transit delay"""
+
+	def __init__(self, rise=CLOCK_RISE):
+		self.rise = rise
+		self.offset = None
+		self.last_id = None
+
+	def time(self, packet_id, t_ns):
+		"""Seconds on the time.monotonic() clock"""
+		ideal = packet_id / PACKET_RATE
+		sample = t_ns / 1e9 - ideal
+		if self.offset is None or packet_id < self.last_id or sample < self.offset:
+			self.offset = sample
+		else:
+			# let the estimate grow slowly, in case the route got slower for good
+			self.offset = min(sample, self.offset + self.rise * (packet_id - self.last_id) / PACKET_RATE)
+		self.last_id = packet_id
+		return ideal + self.offset
+
+class MotionCueing:
+	"""Washout of every packet, with the resulting poses readable at any time from another thread"""
+
+	def __init__(self, delay=DELAY):
+		self.delay = delay
+		self.washout = Washout()
+		self.clock = PacketClock()
+		self.poses = ()			# newest (time, packet ID, pose, active) last, replaced in one go
+		self.last_id = None
+		self.packets = 0
+
+	def update(self, frame, t_ns):
+		"""Feed one decoded packet (anything with the MOTION_FIELDS) received at monotonic t_ns"""
+		packet_id = frame.packet_id
+		steps = 1
+		if self.last_id is not None:
+			steps = packet_id - self.last_id
+			if steps <= 0 and steps > -PACKET_RATE:
+				return	# duplicate or late, a newer packet was already stepped
+			if steps <= 0 or steps > MAX_GAP:
+				steps = 1	# restarted or out for a while, carry on from here
+		self.last_id = packet_id
+		flags = frame.flags
+		active = bool(flags & gt7packet.FLAG_CAR_ON_TRACK) and not flags & (gt7packet.FLAG_PAUSED | gt7packet.FLAG_LOADING)
+		if active:
+			# car frame: x to the right, y up, z forward; rotation about z is roll, about x pitch
+			values = (frame.accel_surge, frame.accel_sway, frame.accel_heave,
+				frame.angular_vel_z, frame.angular_vel_x, frame.angular_vel_y)
+		else:
+			values = (0.0,) * 6		# let the washout bring the seat back
+		step = self.washout.step
+		for _ in range(steps):
+			pose = step(*values)
+		self.packets += 1
+		self.poses = self.poses[-3:] + ((self.clock.time(packet_id, t_ns), packet_id, pose, active),)
+
+	def pose_at(self, t):
+		"""(pose, source packet ID, flags) at monotonic time t (s), None before the first packet"""
+		poses = self.poses
+		if not poses:
+			return None
+		t -= self.delay
+		t1, source, pose1, active = poses[-1]
+		flags = FLAG_ACTIVE if active else 0
+		if t <= t1:
+			# between two packets, or further back than kept
+			for t0, _, pose0, _ in reversed(poses[:-1]):
+				if t0 <= t:
+					f = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+					return tuple(p0 + f * (p1 - p0) for p0, p1 in zip(pose0, pose1)), source, flags
+				t1, pose1 = t0, pose0
+			return pose1, source, flags
+		late = t - t1
+		if late <= MAX_EXTRAPOLATION and len(poses) > 1:
+			t0, _, pose0, _ = poses[-2]
+			f = late / (t1 - t0) if t1 > t0 else 0.0
+			return tuple(p1 + f * (p1 - p0) for p0, p1 in zip(pose0, pose1)), source, flags | FLAG_EXTRAPOLATED
+		if late <= STALE:
+			return pose1, source, flags | FLAG_STALE
+		fade = math.exp(-(late - STALE) / FADE)
+		return tuple(p * fade for p in pose1), source, flags | FLAG_STALE
+
+def setpoints(pose, limits=LIMITS):
+	"""Pose scaled to full-scale int16 actuator setpoints, clipped at the rig's travel"""
+	return [int(round(32767 * max(-1.0, min(1.0, value / limits[axis])))) for axis, value in zip(AXES, pose)]
+
+def pack_frame(seq, flags, source, values):
+	data = bytearray(MOTION_FRAME.pack(SYNC, seq & 0xFF, flags, source & 0xFFFF, *values, 0))
+	data[-1] = -sum(data) & 0xFF
+	return bytes(data)
+
+class FrameParser:
+	"""Rig side of the protocol: finds and checks frames in a byte stream"""
+
+	def __init__(self):
+		self.buffer = bytearray()
+		self.errors = 0
+
+	def feed(self, data):
+		"""Complete frames in data as (seq, flags, source, setpoints)"""
+		buffer = self.buffer
+		buffer += data
+		frames = []
+		size = MOTION_FRAME.size
+		while len(buffer) >= size:
+			if buffer[0] != SYNC or sum(buffer[:size]) & 0xFF:
+				self.errors += 1
+				start = buffer.find(SYNC, 1)
+				del buffer[:start if start > 0 else len(buffer)]
+				continue
+			values = MOTION_FRAME.unpack_from(buffer)
+			frames.append((values[1], values[2], values[3], values[4:10]))
+			del buffer[:size]
+		return frames
+
+class UdpSink:
+	def __init__(self, host, port):
+		self.addr = (host, port)
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.dropped = 0
+
+	def write(self, data):
+		try:
+			self.sock.sendto(data, self.addr)
+		except OSError:
+			self.dropped += 1
+
+	def close(self):
+		self.sock.close()
+
+class SerialSink:
+	"""Raw serial port (or pty) at a fixed baud rate, frames the port can't take are dropped"""
+
+	def __init__(self, device, baud=115200):
+		import termios
+		import tty
+		self.fd = os.open(device, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+		tty.setraw(self.fd)
+		attrs = termios.tcgetattr(self.fd)
+		attrs[4] = attrs[5] = getattr(termios, f'B{baud}')
+		termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+		self.dropped = 0
+
+	def write(self, data):
+		try:
+			if os.write(self.fd, data) < len(data):
+				self.dropped += 1	# partial frame, the rig resyncs on the next one
+		except BlockingIOError:
+			self.dropped += 1
+
+	def close(self):
+		os.close(self.fd)
+
+class MotionOutput:
+	"""Writes a frame of the current pose to a sink at a fixed rate, on its own thread"""
+
+	def __init__(self, cueing, sink, rate=RATE, limits=LIMITS):
+		self.cueing = cueing
+		self.sink = sink
+		self.period = 1.0 / rate
+		self.limits = limits
+		self.seq = 0
+		self.late = 0			# frames that went out more than a period late
+		self.stop = threading.Event()
+		self.thread = None
+
+	def frame(self, now):
+		state = self.cueing.pose_at(now)
+		if state is None:
+			return pack_frame(self.seq, FLAG_STALE, 0, (0,) * 6)
+		pose, source, flags = state
+		return pack_frame(self.seq, flags, source, setpoints(pose, self.limits))
+
+	def run(self):
+		period = self.period
+		due = time.monotonic()
+		while not self.stop.is_set():
+			now = time.monotonic()
+			self.sink.write(self.frame(now))
+			self.seq += 1
+			due += period
+			if due < now:
+				self.late += 1
+				due = now + period	# don't burst to catch up, the rig wants an even rate
+			delay = due - time.monotonic()
+			if delay > 0:
+				time.sleep(delay)
+
+	def start(self):
+		self.thread = threading.Thread(target=self.run, name='gt7-motion', daemon=True)
+		self.thread.start()
+
+	def close(self):
+		self.stop.set()
+		if self.thread is not None:
+			self.thread.join()
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+async def follow_console(ip, cueing):
+	import gt7ingest
+	core = gt7ingest.IngestCore(ip)
+	frames = core.subscribe(maxsize=64)
+
+	async def feed():
+		async for packet in frames:
+			cueing.update(packet.frame, packet.t_ns)
+
+	await asyncio.gather(core.run(), feed())
+
+def follow_relay(host, cueing):
+	import gt7relay
+	client = gt7relay.RelayClient(MOTION_FIELDS, host=host)
+	try:
+		for frame in client:
+			cueing.update(frame, time.monotonic_ns())
+	finally:
+		client.close()
+
+def bench(kind, seconds, jitter_ms, rate, delay):
+	"""Latency from an encrypted packet arriving to the rig reading the first frame it shaped"""
+	import random
+	import gt7synth
+
+	cueing = MotionCueing(delay)
+	if kind == 'serial':
+		import pty
+		master, slave = pty.openpty()
+		sink = SerialSink(os.ttyname(slave), 115200)
+		read = lambda: os.read(master, 4096)
+	else:
+		rig = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		rig.bind(('127.0.0.1', 0))
+		sink = UdpSink(*rig.getsockname())
+		read = lambda: rig.recv(4096)
+	output = MotionOutput(cueing, sink, rate)
+
+	sent = {}			# packet ID & 0xFFFF -> arrival time
+	latencies = []
+	intervals = []
+	extrapolated = 0
+	frames_read = 0
+	done = threading.Event()
+
+	def rig_side():
+		nonlocal extrapolated, frames_read
+		parser = FrameParser()
+		seen = None
+		last = None
+		while not done.is_set():
+			data = read()
+			now = time.monotonic_ns()
+			for _, flags, source, _ in parser.feed(data):
+				frames_read += 1
+				if last is not None:
+					intervals.append(now - last)
+				last = now
+				if flags & FLAG_EXTRAPOLATED:
+					extrapolated += 1
+				if source != seen and source in sent:
+					seen = source
+					latencies.append(now - sent[source])
+
+	reader = threading.Thread(target=rig_side, daemon=True)
+	reader.start()
+	output.start()
+
+	count = int(seconds * PACKET_RATE)
+	packets = list(gt7synth.encrypted_packets(gt7synth.SyntheticSession(seed=1).frames(count), seed=1))
+	decryptor = gt7packet.PacketDecryptor()
+	rnd = random.Random(1)
+	start = time.monotonic() + 0.1
+	for i, data in enumerate(packets):
+		# console schedule plus a random network delay
+		arrival = start + i / PACKET_RATE + rnd.uniform(0, jitter_ms / 1000)
+		wait = arrival - time.monotonic()
+		if wait > 0:
+			time.sleep(wait)
+		t_ns = time.monotonic_ns()
+		frame = gt7packet.decode(decryptor.decrypt(data))
+		sent[frame.packet_id & 0xFFFF] = t_ns
+		cueing.update(frame, t_ns)
+	time.sleep(0.2)
+	output.close()
+	done.set()
+	sink.close()
+
+	latencies = np.array(latencies) / 1e6
+	intervals = np.array(intervals) / 1e6
+	print(f'{kind} rig, {count} packets with up to {jitter_ms:g} ms jitter, {rate:g} Hz output, {delay * 1000:g} ms playout delay')
+	print(f'  frames read     {frames_read} ({extrapolated} extrapolated, {sink.dropped} dropped, {output.late} late)')
+	if len(latencies):
+		print('  input to output  p50 {:6.2f} ms  p90 {:6.2f} ms  p99 {:6.2f} ms  max {:6.2f} ms'.format(
+			*np.percentile(latencies, [50, 90, 99]), latencies.max()))
+	if len(intervals):
+		print('  frame interval   p50 {:6.2f} ms  p99 {:6.2f} ms  max {:6.2f} ms'.format(
+			*np.percentile(intervals, [50, 99]), intervals.max()))
+	print(f'  pose latency     add the {delay * 1000:g} ms playout delay for a packet to be reached in full')
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Motion cueing for a motion rig from GT7 telemetry')
+	parser.add_argument('ip', nargs='?', help='PlayStation IP address')
+	parser.add_argument('--relay', nargs='?', const='127.0.0.1', metavar='HOST', help='read frames from a gt7relay.py instead (default host: 127.0.0.1)')
+	parser.add_argument('--udp', metavar='HOST:PORT', help='send frames to the rig as UDP datagrams')
+	parser.add_argument('--serial', metavar='DEVICE', help='write frames to the rig on a serial port')
+	parser.add_argument('--baud', type=int, default=115200, help='serial baud rate (default: 115200)')
+	parser.add_argument('--rate', type=float, default=RATE, help=f'output frames per second (default: {RATE:g})')
+	parser.add_argument('--delay', type=float, default=DELAY * 1000, help=f'playout delay in ms (default: {DELAY * 1000:g})')
+	parser.add_argument('--bench', choices=('serial', 'udp'), help='measure latency against a local pty or UDP stand-in for the rig')
+	parser.add_argument('--seconds', type=float, default=10.0, help='bench length (default: 10)')
+	parser.add_argument('--jitter', type=float, default=5.0, help='bench network jitter in ms (default: 5)')
+	args = parser.parse_args()
+
+	if args.bench:
+		bench(args.bench, args.seconds, args.jitter, args.rate, args.delay / 1000)
+		exit(0)
+	if not args.ip and not args.relay:
+		parser.error('an IP address, --relay or --bench is required')
+	if bool(args.udp) == bool(args.serial):
+		parser.error('give the rig as either --udp HOST:PORT or --serial DEVICE')
+
+	if args.udp:
+		host, _, port = args.udp.rpartition(':')
+		sink = UdpSink(host, int(port))
+	else:
+		sink = SerialSink(args.serial, args.baud)
+	cueing = MotionCueing(args.delay / 1000)
+	output = MotionOutput(cueing, sink, args.rate)
+	output.start()
+	print(f'Motion frames at {args.rate:g} Hz to {args.udp or args.serial}')
+	try:
+		if args.relay:
+			follow_relay(args.relay, cueing)
+		else:
+			asyncio.run(follow_console(args.ip, cueing))
+	except KeyboardInterrupt:
+		pass
+	finally:
+		output.close()
+		sink.close()
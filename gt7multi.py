@@ -0,0 +1,208 @@
+import asyncio
+import multiprocessing
+import queue
+import socket
+import struct
+import threading
+from collections import namedtuple
+from multiprocessing.connection import wait
+import gt7ingest
+import gt7laps
+import gt7link
+import gt7packet
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Several consoles at once, one worker process per console.
+#
+# All consoles send to the same port, so one IngestCore owns the socket and heartbeats
+# every console. The datagrams are told apart by source address and piped, still
+# encrypted, to that console's worker process, which decrypts and decodes them and keeps
+# the console's lap timing (gt7laps.LapTracker) and link quality (gt7link.LinkQuality).
+# Decryption, the bulk of the per-packet work, so scales across cores. Workers send back
+# a summary of their newest packet (made by a summarize(frame, laps) function given by the
+# caller, which must be picklable), lap events and a link summary once a second:
+#
+#   multi = MultiIngest(['192.168.1.10', '192.168.1.11'], summarize)
+#   updates = multi.subscribe()
+#   async for update in updates:
+#       print(update.console, update.kind)
+#
+# A worker that falls behind still times laps with every packet, but only summarizes the
+# newest one waiting. Datagrams go to each worker through a bounded queue and a writer
+# thread, so one stalled worker loses its oldest datagrams instead of holding up the
+# socket and heartbeats of every console.
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+# kind: 'frame' (data: summarize() of the newest packet), 'event' (data: (LapEvent, Lap or None)),
+# 'link' (data: LinkQuality.summary() plus skipped summaries); t_ns: receive time of the packet
+ConsoleUpdate = namedtuple('ConsoleUpdate', 'console kind data t_ns')
+
+LINK_INTERVAL = 1.0		# s between link summaries
+BACKLOG = 256			# datagrams queued for a worker before the oldest are dropped, about 4 s
+
+_STAMP = struct.Struct('<q')
+
+def console_worker(inbox, outbox, summarize):
+	"""Worker process main: decrypt, decode and time the datagrams of one console"""
+	decrypt = gt7packet.PacketDecryptor().decrypt
+	decode = gt7packet.decode
+	laps = gt7laps.LapTracker()
+	link = gt7link.LinkQuality()
+	interval_ns = int(LINK_INTERVAL * 1e9)
+	next_link = 0
+	skipped = 0
+	try:
+		while True:
+			try:
+				message = inbox.recv_bytes()
+			except EOFError:
+				break
+			if not message:
+				break	# stop request
+			t_ns = _STAMP.unpack_from(message)[0]
+			frame = decode(decrypt(message[_STAMP.size:]))
+			if frame is None:
+				continue
+			link.update(frame.packet_id, t_ns)
+			for event in laps.update(frame):
+				lap = laps.laps[-1] if event.kind in ('end', 'official') else None
+				outbox.send(('event', (event, lap), t_ns))
+			if inbox.poll():
+				skipped += 1	# newer packets are waiting, summarize the newest only
+			else:
+				outbox.send(('frame', summarize(frame, laps), t_ns))
+			if t_ns >= next_link:
+				next_link = t_ns + interval_ns
+				status = link.summary()
+				status['skipped'] = skipped
+				outbox.send(('link', status, t_ns))
+	except KeyboardInterrupt:
+		pass
+
+class MultiIngest:
+	"""One socket and heartbeat for several consoles, a worker process for each"""
+
+	def __init__(self, consoles, summarize, maxsize=1024, **options):
+		self.consoles = list(consoles)
+		self.summarize = summarize
+		# datagrams come from numeric addresses, consoles may be given by name
+		self.addresses = {socket.gethostbyname(console): console for console in self.consoles}
+		# heartbeats and last_seen go by the numeric addresses the datagrams come from
+		self.core = gt7ingest.IngestCore(list(self.addresses), **options)
+		self.raw = self.core.subscribe_raw(maxsize)
+		self.subscriptions = []
+		self.processes = {}		# console -> worker process
+		self.inboxes = {}		# console -> pipe end the datagrams go into
+		self.backlogs = {}		# console -> queue of stamped datagrams for the writer thread
+		self.writers = {}		# console -> thread writing the backlog into the pipe
+		self.forwarded = dict.fromkeys(self.consoles, 0)
+		self.dropped = dict.fromkeys(self.consoles, 0)		# datagrams a busy worker never got
+		self.unknown = 0		# datagrams from addresses that are not one of the consoles
+
+	def subscribe(self, maxsize=256):
+		"""ConsoleUpdates of every console"""
+		sub = gt7ingest.Subscription(maxsize)
+		self.subscriptions.append(sub)
+		return sub
+
+	def _deliver(self, update):
+		for sub in self.subscriptions:
+			sub.put(update)
+
+	def start_workers(self):
+		"""Start one worker per console, returns {results connection: console}"""
+		results = {}
+		for console in self.consoles:
+			inbox_recv, inbox_send = multiprocessing.Pipe(duplex=False)
+			outbox_recv, outbox_send = multiprocessing.Pipe(duplex=False)
+			process = multiprocessing.Process(target=console_worker, args=(inbox_recv, outbox_send, self.summarize),
+				name=f'gt7-{console}', daemon=True)
+			process.start()
+			# the worker holds its own ends now
+			inbox_recv.close()
+			outbox_send.close()
+			self.processes[console] = process
+			self.inboxes[console] = inbox_send
+			self.backlogs[console] = queue.Queue(BACKLOG)
+			writer = threading.Thread(target=self._write, args=(self.backlogs[console], inbox_send),
+				name=f'gt7-{console}-writer', daemon=True)
+			writer.start()
+			self.writers[console] = writer
+			results[outbox_recv] = console
+		return results
+
+	def _write(self, backlog, inbox):
+		# blocking pipe writes on a thread of their own, b'' asks the worker to stop
+		while True:
+			message = backlog.get()
+			try:
+				inbox.send_bytes(message)
+			except OSError:
+				return	# worker gone
+			if not message:
+				return
+
+	def _enqueue(self, console, message):
+		backlog = self.backlogs[console]
+		while True:
+			try:
+				backlog.put_nowait(message)
+				return
+			except queue.Full:
+				pass
+			try:
+				backlog.get_nowait()	# the worker is behind, drop its oldest datagram
+				self.dropped[console] += 1
+			except queue.Empty:
+				pass
+
+	def _collect(self, loop, results):
+		# blocking reads of every worker's results on a thread, handed to the event loop
+		while results:
+			for connection in wait(list(results)):
+				try:
+					kind, data, t_ns = connection.recv()
+				except (EOFError, OSError):
+					del results[connection]
+					continue
+				update = ConsoleUpdate(results[connection], kind, data, t_ns)
+				try:
+					loop.call_soon_threadsafe(self._deliver, update)
+				except RuntimeError:
+					return	# event loop closed
+
+	async def _demux(self):
+		addresses = self.addresses
+		enqueue = self._enqueue
+		forwarded = self.forwarded
+		stamp = _STAMP.pack
+		async for packet in self.raw:
+			console = addresses.get(packet.addr[0])
+			if console is None:
+				self.unknown += 1
+				continue
+			enqueue(console, stamp(packet.t_ns) + packet.data)
+			forwarded[console] += 1
+
+	async def run(self):
+		"""Start the workers and receive until cancelled"""
+		results = self.start_workers()
+		collector = threading.Thread(target=self._collect, args=(asyncio.get_running_loop(), results), daemon=True)
+		collector.start()
+		try:
+			await asyncio.gather(self.core.run(), self._demux())
+		finally:
+			self.close()
+
+	def close(self):
+		# forked workers hold copies of each other's pipe ends, so ask them to stop instead of relying on EOF
+		for console in self.backlogs:
+			self._enqueue(console, b'')
+		for writer in self.writers.values():
+			writer.join(1.0)
+		for process in self.processes.values():
+			process.join(1.0)
+			if process.is_alive():
+				process.terminate()
+		for inbox in self.inboxes.values():
+			inbox.close()
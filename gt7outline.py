@@ -0,0 +1,304 @@
+import json
+import os
+import numpy as np
+import gt7trackdetect
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Track outlines built from driven laps, cached on disk per track ID.
+#
+# Every complete lap starts and ends on the start line, so laps are resampled to a fixed
+# number of stations by the fraction of their own length and averaged station by station
+# into a centerline. The offsets of each lap to either side of the centerline widen its
+# edges. A lap is only merged when its start line crossing and bounding box match the
+# track in gt7trackdetect's table and its length is close to the outline's, so laps
+# on other layouts, off-track excursions and shortcuts are left out.
+#
+#   outlines = OutlineStore('outlines')
+#   builder = OutlineBuilder(outlines, laps)
+#   if builder.update(frame, laps.update(frame), track) and builder.current():
+#       draw(builder.current().compact())
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+STEP = 5.0					# m between outline stations
+MAX_STATIONS = 2000
+LENGTH_TOLERANCE = 0.1		# laps more than this fraction longer or shorter are not merged
+MAX_WIDTH = 20.0			# m, offsets farther from the centerline don't widen the edges
+MIN_WIDTH = 3.0				# m, drawn either side of the centerline at least
+SMOOTH = 2					# stations either side averaged into the drawn centerline
+
+def lap_length(x, z):
+	return float(np.hypot(np.diff(x), np.diff(z)).sum())
+
+def resample(x, z, stations):
+	"""Positions at equal distances along a lap, from its first to its last point"""
+	x = np.asarray(x, dtype=np.float64)
+	z = np.asarray(z, dtype=np.float64)
+	distance = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(z)))))
+	at = np.linspace(0.0, distance[-1], stations)
+	return np.interp(at, distance, x), np.interp(at, distance, z)
+
+def _smooth(values, width):
+	# circular moving average, the lap is a closed loop
+	if width <= 0:
+		return values
+	kernel = np.ones(2 * width + 1) / (2 * width + 1)
+	padded = np.concatenate((values[-width:], values, values[:width]))
+	return np.convolve(padded, kernel, mode='valid')
+
+def start_line(track_bounds, track):
+	"""((P1X, P1Y), (P2X, P2Y)) of a track's start line in the track table, None if unknown"""
+	rows = track_bounds.rows if isinstance(track_bounds, gt7trackdetect.TrackTable) else track_bounds
+	for row in rows:
+		if row.TRACK == track:
+			return (row.P1X, row.P1Y), (row.P2X, row.P2Y)
+	return None
+
+class TrackOutline:
+	"""Mean path of the laps driven on one track, with how far they strayed either side"""
+
+	def __init__(self, track, length, x, z, left, right, laps=1, start=None):
+		self.track = track
+		self.length = length		# m, mean lap length
+		self.x = np.asarray(x, dtype=np.float64)
+		self.z = np.asarray(z, dtype=np.float64)
+		self.left = np.asarray(left, dtype=np.float64)		# m to the left edge, per station
+		self.right = np.asarray(right, dtype=np.float64)	# m to the right edge, per station
+		self.laps = laps
+		self.start = start		# start line from the track table
+
+	@classmethod
+	def from_lap(cls, track, x, z, start=None):
+		length = lap_length(x, z)
+		stations = int(min(MAX_STATIONS, max(16, length / STEP)))
+		x, z = resample(x, z, stations)
+		zeros = np.zeros(stations)
+		return cls(track, length, x, z, zeros, zeros.copy(), 1, start)
+
+	def __len__(self):
+		return len(self.x)
+
+	def matches_length(self, length):
+		return abs(length - self.length) <= self.length * LENGTH_TOLERANCE
+
+	def centerline(self):
+		return _smooth(self.x, SMOOTH), _smooth(self.z, SMOOTH)
+
+	def _normals(self, x, z):
+		# unit normals pointing left of the driving direction
+		dx = np.gradient(x)
+		dz = np.gradient(z)
+		norm = np.hypot(dx, dz)
+		norm[norm == 0] = 1.0
+		return -dz / norm, dx / norm
+
+	def merge(self, x, z):
+		"""Add one lap to the mean path and the edges, False when its length is off"""
+		length = lap_length(x, z)
+		if not self.matches_length(length):
+			return False
+		lx, lz = resample(x, z, len(self))
+		cx, cz = self.centerline()
+		nx, nz = self._normals(cx, cz)
+		offset = (lx - cx) * nx + (lz - cz) * nz
+		offset = np.where(np.abs(offset) <= MAX_WIDTH, offset, 0.0)
+		self.left = np.maximum(self.left, offset)
+		self.right = np.maximum(self.right, -offset)
+
+		laps = self.laps
+		self.x = (self.x * laps + lx) / (laps + 1)
+		self.z = (self.z * laps + lz) / (laps + 1)
+		self.length = (self.length * laps + length) / (laps + 1)
+		self.laps = laps + 1
+		return True
+
+	def edges(self):
+		"""(left x, left z, right x, right z) of the driven width, at least MIN_WIDTH either side"""
+		cx, cz = self.centerline()
+		nx, nz = self._normals(cx, cz)
+		left = np.maximum(_smooth(self.left, SMOOTH), MIN_WIDTH)
+		right = np.maximum(_smooth(self.right, SMOOTH), MIN_WIDTH)
+		return cx + nx * left, cz + nz * left, cx - nx * right, cz - nz * right
+
+	def compact(self, flip_z=True):
+		"""Closed polylines for drawing, rounded to 0.1 m, z negated like the position plot"""
+		sign = -1.0 if flip_z else 1.0
+		points = lambda x, z: [[round(float(a), 1), round(float(sign * b), 1)] for a, b in zip(x, z)] + \
+			[[round(float(x[0]), 1), round(float(sign * z[0]), 1)]]
+		cx, cz = self.centerline()
+		left_x, left_z, right_x, right_z = self.edges()
+		outline = {
+			'track': self.track,
+			'laps': self.laps,
+			'length': round(self.length, 1),
+			'centerline': points(cx, cz),
+			'left': points(left_x, left_z),
+			'right': points(right_x, right_z),
+			'start': None,
+		}
+		if self.start is not None:
+			outline['start'] = [[p[0], sign * p[1]] for p in self.start]
+		return outline
+
+	def to_json(self):
+		return {
+			'track': self.track,
+			'length': self.length,
+			'laps': self.laps,
+			'start': self.start,
+			'x': np.round(self.x, 2).tolist(),
+			'z': np.round(self.z, 2).tolist(),
+			'left': np.round(self.left, 2).tolist(),
+			'right': np.round(self.right, 2).tolist(),
+		}
+
+	@classmethod
+	def from_json(cls, data):
+		start = tuple(tuple(p) for p in data['start']) if data.get('start') else None
+		return cls(data['track'], data['length'], data['x'], data['z'], data['left'], data['right'], data['laps'], start)
+
+class OutlineStore:
+	"""Outlines as one JSON file per track ID in a directory, loaded once"""
+
+	def __init__(self, path):
+		self.path = path
+		os.makedirs(path, exist_ok=True)
+		self.outlines = {}		# track -> TrackOutline or None
+
+	def _filename(self, track):
+		return os.path.join(self.path, f'{track}.json')
+
+	def get(self, track):
+		if track not in self.outlines:
+			try:
+				with open(self._filename(track)) as f:
+					self.outlines[track] = TrackOutline.from_json(json.load(f))
+			except (OSError, ValueError, KeyError):
+				self.outlines[track] = None
+		return self.outlines[track]
+
+	def save(self, outline):
+		self.outlines[outline.track] = outline
+		filename = self._filename(outline.track)
+		tmp = filename + '.tmp'
+		with open(tmp, 'w') as f:
+			json.dump(outline.to_json(), f, separators=(',', ':'))
+		os.replace(tmp, filename)
+
+	def tracks(self):
+		return sorted(int(name[:-5]) for name in os.listdir(self.path) if name.endswith('.json') and name[:-5].isdigit())
+
+def lap_belongs(track_bounds, track, x, z, crossing):
+	"""Whether a lap crosses this track's start line, inside a matching area"""
+	x0, z0, x1, z1 = crossing
+	matches = gt7trackdetect.find_matching_track(x0, z0, x1, z1, min(x), min(z), max(x), max(z), track_bounds)
+	return bool(matches) and any(match[1] == track for match in matches)
+
+def add_lap(store, track_bounds, track, x, z, crossing):
+	"""Merge a complete lap into the track's stored outline, returns the outline or None if rejected"""
+	if len(x) < 16 or not lap_belongs(track_bounds, track, x, z, crossing):
+		return None
+	outline = store.get(track)
+	if outline is None:
+		outline = TrackOutline.from_lap(track, x, z, start_line(track_bounds, track))
+	elif not outline.merge(x, z):
+		return None
+	store.save(outline)
+	return outline
+
+def build_from_store(store, lap_store, track_bounds, track=None):
+	"""Merge the complete laps of a gt7lapstore.LapStore into outlines, returns (merged, rejected)"""
+	merged = rejected = 0
+	for entry in lap_store.query(track=track, complete=True):
+		if entry.track is None:
+			continue
+		columns = lap_store.load(entry, ['position_x', 'position_z'])
+		x = columns['position_x']
+		z = columns['position_z']
+		# the lap starts just past the start line and ends just before it
+		crossing = (x[-1], z[-1], x[0], z[0]) if len(x) else None
+		if crossing and add_lap(store, track_bounds, entry.track, x, z, crossing):
+			merged += 1
+		else:
+			rejected += 1
+	return merged, rejected
+
+class OutlineBuilder:
+	"""Merges every complete lap of the detected track into its stored outline
+
+	Call update() with every packet, the events its LapTracker returned and the detected
+	track, e.g. a gt7lapstore.LapRecorder's. Without one, pass a gt7trackdetect.TrackDetector
+	for the builder to feed itself.
+	"""
+
+	def __init__(self, store, tracker, detector=None, track_bounds=None):
+		self.store = store
+		self.tracker = tracker
+		self.detector = detector
+		if track_bounds is None:
+			track_bounds = detector.track_bounds if detector is not None else gt7trackdetect.load_track_table(gt7trackdetect.TRACK_BOUNDS_FILE)
+		self.track_bounds = track_bounds
+		self.track = None
+		self.rejected = 0
+		self.clear()
+
+	def clear(self):
+		self.x = []
+		self.z = []
+
+	def current(self):
+		"""Stored outline of the current track, None before detection or the first lap"""
+		return self.store.get(self.track) if self.track is not None else None
+
+	def update(self, frame, events, track=None):
+		"""True when the outline to draw (current()) changed with this packet"""
+		driving = not (frame.is_paused or frame.is_loading) and frame.current_lap > 0
+		if self.detector is not None:
+			if driving:
+				self.detector.update(frame.current_lap, frame.position_x, frame.position_z)
+			track = self.detector.track
+
+		changed = False
+		if track != self.track:
+			self.track = track
+			changed = True
+
+		for event in events:
+			if event.kind == 'end' and self.x and track is not None:
+				crossing = (self.x[-1], self.z[-1], frame.position_x, frame.position_z)
+				outline = None
+				if not self.tracker.laps[-1].partial:
+					outline = add_lap(self.store, self.track_bounds, track, self.x, self.z, crossing)
+				if outline is None:
+					self.rejected += 1
+				else:
+					changed = True
+			if event.kind in ('start', 'reset'):
+				self.clear()
+
+		if driving and self.tracker.start_id is not None:
+			self.x.append(frame.position_x)
+			self.z.append(frame.position_z)
+		return changed
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+if __name__ == '__main__':
+	import argparse
+	import gt7lapstore
+
+	parser = argparse.ArgumentParser(description='Build track outlines from the laps in a lap store')
+	parser.add_argument('--store', default='laps', help='lap store directory (default: laps)')
+	parser.add_argument('--outlines', default='outlines', help='outline directory (default: outlines)')
+	parser.add_argument('--track', type=int, help='only this track')
+	args = parser.parse_args()
+
+	outlines = OutlineStore(args.outlines)
+	lap_store = gt7lapstore.LapStore(args.store)
+	table = gt7trackdetect.load_track_table(gt7trackdetect.TRACK_BOUNDS_FILE)
+	merged, rejected = build_from_store(outlines, lap_store, table, args.track)
+	lap_store.close()
+	print(f'{merged} laps merged, {rejected} rejected')
+	for track in outlines.tracks():
+		outline = outlines.get(track)
+		if outline is not None:
+			print(f'track {track:>5}  {outline.laps:4d} laps  {outline.length:7.0f} m  {len(outline)} stations')
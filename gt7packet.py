@@ -0,0 +1,251 @@
+import struct
+from collections import namedtuple
+from Crypto.Cipher import Salsa20
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Decrypted GT7 telemetry packet layout, shared by gt7telemetry.py and dashboard.py.
+#
+# Every field is described once, in packet order, as (name, struct code). Padding and
+# fields we do not know the meaning of are unnamed (None) and skipped by the decoder.
+# The layouts are compiled into one struct.Struct per packet variant so a packet is
+# decoded with a single unpack_from() call instead of one slice + unpack per field.
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+MAGIC = 0x47375330
+MAGIC_BYTES = struct.pack('<I', MAGIC)
+
+# Salsa20 key and IV scheme, the IV seed is always located at 0x40
+KEY = b'Simulator Interface Packet GT7 ver 0.0'[0:32]
+IV_OFFSET = 0x40
+IV_MASK = 0xDEADBEEF
+
+# Packet variant 'A' (296 bytes), the base layout
+_LAYOUT_A = (
+	('magic', 'I'),					# 0x00
+	('position_x', 'f'),			# 0x04
+	('position_y', 'f'),			# 0x08
+	('position_z', 'f'),			# 0x0C
+	('velocity_x', 'f'),			# 0x10
+	('velocity_y', 'f'),			# 0x14
+	('velocity_z', 'f'),			# 0x18
+	('rotation_pitch', 'f'),		# 0x1C
+	('rotation_yaw', 'f'),			# 0x20
+	('rotation_roll', 'f'),			# 0x24
+	('orientation_north', 'f'),		# 0x28
+	('angular_vel_x', 'f'),			# 0x2C
+	('angular_vel_y', 'f'),			# 0x30
+	('angular_vel_z', 'f'),			# 0x34
+	('ride_height', 'f'),			# 0x38
+	('rpm', 'f'),					# 0x3C
+	(None, '4x'),					# 0x40 IV seed, garbage once decrypted
+	('fuel_level', 'f'),			# 0x44
+	('fuel_capacity', 'f'),			# 0x48
+	('speed', 'f'),					# 0x4C m/s
+	('boost', 'f'),					# 0x50
+	('oil_pressure', 'f'),			# 0x54
+	('water_temp', 'f'),			# 0x58
+	('oil_temp', 'f'),				# 0x5C
+	('tyre_temp_fl', 'f'),			# 0x60
+	('tyre_temp_fr', 'f'),			# 0x64
+	('tyre_temp_rl', 'f'),			# 0x68
+	('tyre_temp_rr', 'f'),			# 0x6C
+	('packet_id', 'i'),				# 0x70
+	('current_lap', 'h'),			# 0x74
+	('total_laps', 'h'),			# 0x76
+	('best_lap_ms', 'i'),			# 0x78
+	('last_lap_ms', 'i'),			# 0x7C
+	('time_of_day_ms', 'i'),		# 0x80
+	('current_position', 'h'),		# 0x84
+	('total_positions', 'h'),		# 0x86
+	('rev_warning_rpm', 'H'),		# 0x88
+	('rev_limiter_rpm', 'H'),		# 0x8A
+	('est_top_speed', 'h'),			# 0x8C
+	('flags', 'H'),					# 0x8E
+	('gears', 'B'),					# 0x90 current gear (low nibble) / suggested gear (high nibble)
+	('throttle_raw', 'B'),			# 0x91
+	('brake_raw', 'B'),				# 0x92
+	(None, 'x'),					# 0x93
+	('road_plane_x', 'f'),			# 0x94
+	('road_plane_y', 'f'),			# 0x98
+	('road_plane_z', 'f'),			# 0x9C
+	('road_plane_distance', 'f'),	# 0xA0
+	('wheel_rps_fl', 'f'),			# 0xA4
+	('wheel_rps_fr', 'f'),			# 0xA8
+	('wheel_rps_rl', 'f'),			# 0xAC
+	('wheel_rps_rr', 'f'),			# 0xB0
+	('tyre_diam_fl', 'f'),			# 0xB4
+	('tyre_diam_fr', 'f'),			# 0xB8
+	('tyre_diam_rl', 'f'),			# 0xBC
+	('tyre_diam_rr', 'f'),			# 0xC0
+	('suspension_fl', 'f'),			# 0xC4
+	('suspension_fr', 'f'),			# 0xC8
+	('suspension_rl', 'f'),			# 0xCC
+	('suspension_rr', 'f'),			# 0xD0
+	(None, '32x'),					# 0xD4
+	('clutch', 'f'),				# 0xF4
+	('clutch_engaged', 'f'),		# 0xF8
+	('rpm_after_clutch', 'f'),		# 0xFC
+	('gear_unknown', 'f'),			# 0x100
+	('gear_ratio_1', 'f'),			# 0x104
+	('gear_ratio_2', 'f'),			# 0x108
+	('gear_ratio_3', 'f'),			# 0x10C
+	('gear_ratio_4', 'f'),			# 0x110
+	('gear_ratio_5', 'f'),			# 0x114
+	('gear_ratio_6', 'f'),			# 0x118
+	('gear_ratio_7', 'f'),			# 0x11C
+	('gear_ratio_8', 'f'),			# 0x120
+	('car_id', 'i'),				# 0x124
+)
+
+# Packet variant 'B' (316 bytes), requested with the 'B' heartbeat
+_LAYOUT_B = _LAYOUT_A + (
+	('wheel_rotation', 'f'),		# 0x128
+	('unknown_b', 'f'),				# 0x12C
+	('accel_sway', 'f'),			# 0x130 X axis
+	('accel_heave', 'f'),			# 0x134 Y axis
+	('accel_surge', 'f'),			# 0x138 Z axis
+)
+
+def _compile(layout):
+	return struct.Struct('<' + ''.join(code for _, code in layout))
+
+def _offsets(layout):
+	offsets = {}
+	fmt = '<'
+	for name, code in layout:
+		if name is not None:
+			offsets[name] = (struct.calcsize(fmt), code)
+		fmt += code
+	return offsets
+
+PACKET_A = _compile(_LAYOUT_A)
+PACKET_B = _compile(_LAYOUT_B)
+PACKET_A_SIZE = PACKET_A.size
+PACKET_B_SIZE = PACKET_B.size
+
+FIELDS = tuple(name for name, _ in _LAYOUT_B if name is not None)
+
+# name -> (offset, struct code), for consumers that only need a handful of fields
+FIELD_OFFSETS = _offsets(_LAYOUT_B)
+
+# 'A' packets do not carry the variant 'B' fields, pad them with zeros
+_B_DEFAULTS = (0.0,) * (len(FIELDS) - len(_offsets(_LAYOUT_A)))
+
+# flag bits at 0x8E
+FLAG_CAR_ON_TRACK = 1 << 0
+FLAG_PAUSED = 1 << 1
+FLAG_LOADING = 1 << 2
+FLAG_IN_GEAR = 1 << 3
+FLAG_HAS_TURBO = 1 << 4
+FLAG_REV_LIMITER = 1 << 5
+FLAG_HANDBRAKE = 1 << 6
+FLAG_LIGHTS = 1 << 7
+FLAG_HIGH_BEAM = 1 << 8
+FLAG_LOW_BEAM = 1 << 9
+FLAG_ASM_ACTIVE = 1 << 10
+FLAG_TCS_ACTIVE = 1 << 11
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+class TelemetryFrame(namedtuple('_TelemetryFrame', FIELDS)):
+	"""One decoded telemetry packet, raw field values plus a few derived helpers"""
+	__slots__ = ()
+
+	@property
+	def current_gear(self):
+		return self.gears & 0b00001111
+
+	@property
+	def suggested_gear(self):
+		return self.gears >> 4
+
+	@property
+	def throttle(self):
+		return self.throttle_raw / 2.55
+
+	@property
+	def brake(self):
+		return self.brake_raw / 2.55
+
+	@property
+	def cars_on_track(self):
+		return bool(self.flags & FLAG_CAR_ON_TRACK)
+
+	@property
+	def is_paused(self):
+		return bool(self.flags & FLAG_PAUSED)
+
+	@property
+	def is_loading(self):
+		return bool(self.flags & FLAG_LOADING)
+
+_make_frame = TelemetryFrame._make
+
+# struct code of every field and derived value, for fixed-layout copies of frames (gt7relay, gt7ring)
+CHANNELS = dict((name, code) for name, (_, code) in FIELD_OFFSETS.items())
+CHANNELS.update(throttle='f', brake='f', current_gear='B', suggested_gear='B')
+
+def decode(ddata):
+	"""Decode a decrypted packet into a TelemetryFrame, or None if it is too short"""
+	n = len(ddata)
+	if n >= PACKET_B_SIZE:
+		return _make_frame(PACKET_B.unpack_from(ddata))
+	if n >= PACKET_A_SIZE:
+		return _make_frame(PACKET_A.unpack_from(ddata) + _B_DEFAULTS)
+	return None
+
+def encode(frame):
+	"""Pack a TelemetryFrame back into a plain variant 'B' packet"""
+	return PACKET_B.pack(*frame)
+
+def read_field(ddata, name):
+	"""Read a single field from a decrypted (or partially decrypted) packet"""
+	offset, code = FIELD_OFFSETS[name]
+	return struct.unpack_from('<' + code, ddata, offset)[0]
+
+def prefix_length(fields):
+	"""Number of leading packet bytes needed to read all the given fields"""
+	end = len(MAGIC_BYTES)
+	for name in fields:
+		offset, code = FIELD_OFFSETS[name]
+		end = max(end, offset + struct.calcsize(code))
+	return end
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+_IV_SEED = struct.Struct('<I')
+_NONCE = struct.Struct('<II')
+
+class PacketDecryptor:
+	"""Salsa20 packet decryption with the constant key work done once
+
+	When fields are given only the keystream prefix covering them is decrypted,
+	which is enough for read_field() but not for decode().
+	"""
+
+	def __init__(self, fields=None):
+		self.limit = prefix_length(fields) if fields else None
+
+	def decrypt(self, dat):
+		"""Return the decrypted packet (or prefix), or empty bytes if it is not a GT7 packet"""
+		if len(dat) < PACKET_A_SIZE:
+			return b''
+		iv1 = _IV_SEED.unpack_from(dat, IV_OFFSET)[0]
+		cipher = Salsa20.new(key=KEY, nonce=_NONCE.pack(iv1 ^ IV_MASK, iv1))
+		if self.limit is None:
+			ddata = cipher.decrypt(dat)
+		else:
+			ddata = cipher.decrypt(dat[:self.limit])
+		if not ddata.startswith(MAGIC_BYTES):
+			return b''
+		return ddata
+
+# data stream decoding, drop-in for the per-script salsa20_dec() helpers
+salsa20_dec = PacketDecryptor().decrypt
+
+def salsa20_enc(ddata, iv1):
+	"""Encrypt a plain packet the way the console does, seeding the IV with iv1"""
+	cipher = Salsa20.new(key=KEY, nonce=_NONCE.pack(iv1 ^ IV_MASK, iv1))
+	dat = bytearray(cipher.encrypt(bytes(ddata)))
+	_IV_SEED.pack_into(dat, IV_OFFSET, iv1)
+	return bytes(dat)
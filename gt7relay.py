@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import time
+from collections import namedtuple
+from operator import attrgetter
+import gt7ingest
+import gt7packet
+import gt7wire
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Decrypt-once relay for local consumers.
+#
+# The relay is the only process talking to the console: it heartbeats it, decrypts and
+# decodes every packet once (gt7ingest.IngestCore) and republishes the decoded frames as
+# compact gt7wire records. Subscribers ask for the channels they need by sending
+#
+#   {"channels": ["current_lap", "position_x", "position_z"]}
+#
+# to the relay's control port, and get a schema message back, then one record per packet.
+# Like the console's heartbeat, the request has to be repeated every few seconds or the
+# subscription lapses. The same records can also go to a multicast group, with the schema
+# repeated once a second, for any number of listeners that don't ask for anything.
+#
+# Every datagram starts with <BH: kind (KIND_*) and layout ID; a schema carries
+# gt7wire.WireFormat.schema() plus 'channels' as JSON, an error message {"error": text}.
+#
+#   python3 gt7relay.py 192.168.1.123 --multicast 239.255.73.40
+#
+#   for frame in RelayClient(['speed', 'rpm']):
+#       print(frame.speed, frame.rpm)
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+RELAY_PORT = 33750					# control port subscribers send their requests to
+MULTICAST_PORT = 33751
+SUBSCRIPTION_TIMEOUT = 10.0			# s without a renewed request before a subscriber is dropped
+RENEW_INTERVAL = 2.0				# s between requests from a subscriber
+
+KIND_FRAME = 1
+KIND_SCHEMA = 2
+KIND_ERROR = 3
+
+HEADER = struct.Struct('<BH')
+
+# every packet field plus the derived values of TelemetryFrame
+CHANNELS = gt7packet.CHANNELS
+
+class Layout:
+	"""Wire format of one channel selection, packed once per packet for all its subscribers"""
+
+	def __init__(self, layout_id, channels):
+		self.id = layout_id
+		self.channels = channels
+		self.wire = gt7wire.WireFormat([(name, CHANNELS[name]) for name in channels])
+		self.get = attrgetter(*channels) if len(channels) > 1 else (lambda frame, get=attrgetter(channels[0]): (get(frame),))
+		self.header = HEADER.pack(KIND_FRAME, layout_id)
+		schema = dict(self.wire.schema(), channels=list(channels))
+		self.schema = HEADER.pack(KIND_SCHEMA, layout_id) + json.dumps(schema).encode()
+
+	def pack(self, frame):
+		return self.header + self.wire.pack_values(self.get(frame))
+
+class RelayProtocol(asyncio.DatagramProtocol):
+	def __init__(self, relay):
+		self.relay = relay
+
+	def datagram_received(self, data, addr):
+		self.relay._request(data, addr)
+
+	def error_received(self, exc):
+		self.relay.errors += 1
+
+class Relay:
+	"""Republishes an IngestCore's decoded frames to subscribers and a multicast group"""
+
+	def __init__(self, core, bind='127.0.0.1', port=RELAY_PORT, multicast=None, multicast_port=MULTICAST_PORT,
+			multicast_channels=None, ttl=1):
+		self.core = core
+		self.bind = bind
+		self.port = port
+		self.multicast = multicast
+		self.multicast_port = multicast_port
+		self.ttl = ttl
+		self.layouts = {}			# channel tuple -> Layout
+		self.subscribers = {}		# address -> [Layout, last request (monotonic)]
+		self.transport = None
+		self.multicast_sock = None
+		self.multicast_layout = self.layout(tuple(multicast_channels or CHANNELS)) if multicast else None
+		self.frames = core.subscribe(maxsize=1024)
+		self.sent = 0
+		self.errors = 0
+
+	def layout(self, channels):
+		layout = self.layouts.get(channels)
+		if layout is None:
+			layout = self.layouts[channels] = Layout(len(self.layouts) + 1, channels)
+		return layout
+
+	def _request(self, data, addr):
+		try:
+			channels = tuple(json.loads(data)['channels'])
+			unknown = [name for name in channels if name not in CHANNELS]
+			if not channels or unknown:
+				raise ValueError(f'unknown channels: {", ".join(unknown)}' if unknown else 'no channels')
+		except (ValueError, KeyError, TypeError) as e:
+			self.transport.sendto(HEADER.pack(KIND_ERROR, 0) + json.dumps({'error': str(e)}).encode(), addr)
+			return
+		layout = self.layout(channels)
+		subscriber = self.subscribers.get(addr)
+		if subscriber is None:
+			print(f'Subscriber {addr[0]}:{addr[1]}: {len(channels)} channels, {layout.wire.size + HEADER.size} bytes per packet')
+		self.subscribers[addr] = [layout, time.monotonic()]
+		# the schema answers every request, so a lost one is made up for by the next renewal
+		self.transport.sendto(layout.schema, addr)
+
+	async def _publish(self):
+		async for packet in self.frames:
+			frame = packet.frame
+			packed = {}
+			for addr, (layout, _) in list(self.subscribers.items()):
+				data = packed.get(layout.id)
+				if data is None:
+					data = packed[layout.id] = layout.pack(frame)
+				self.transport.sendto(data, addr)
+				self.sent += 1
+			if self.multicast_sock is not None:
+				try:
+					self.multicast_sock.sendto(packed.get(self.multicast_layout.id) or self.multicast_layout.pack(frame),
+						(self.multicast, self.multicast_port))
+				except OSError:
+					self.errors += 1
+
+	async def _housekeeping(self):
+		# drop lapsed subscribers, repeat the multicast schema for late joiners
+		while True:
+			now = time.monotonic()
+			for addr, (_, last) in list(self.subscribers.items()):
+				if now - last > SUBSCRIPTION_TIMEOUT:
+					del self.subscribers[addr]
+					print(f'Subscriber {addr[0]}:{addr[1]} lapsed')
+			if self.multicast_sock is not None:
+				try:
+					self.multicast_sock.sendto(self.multicast_layout.schema, (self.multicast, self.multicast_port))
+				except OSError:
+					self.errors += 1
+			await asyncio.sleep(1.0)
+
+	async def run(self):
+		loop = asyncio.get_running_loop()
+		self.transport, _ = await loop.create_datagram_endpoint(lambda: RelayProtocol(self), local_addr=(self.bind, self.port))
+		if self.multicast:
+			sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+			sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.ttl)
+			sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+			sock.setblocking(False)
+			self.multicast_sock = sock
+		try:
+			await asyncio.gather(self.core.run(), self._publish(), self._housekeeping())
+		finally:
+			self.transport.close()
+			if self.multicast_sock is not None:
+				self.multicast_sock.close()
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+class RelayClient:
+	"""Blocking reader of relayed frames, as namedtuples of the requested channels
+
+	With channels, subscribes at the relay's control port and keeps renewing. Without,
+	listens to the multicast group given instead.
+	"""
+
+	def __init__(self, channels=None, host='127.0.0.1', port=RELAY_PORT, multicast=None, multicast_port=MULTICAST_PORT,
+			timeout=1.0):
+		self.relay = (host, port)
+		self.channels = list(channels) if channels else None
+		if self.channels is None and not multicast:
+			raise ValueError('either channels to subscribe to or a multicast group to listen to is needed')
+		self.timeout = timeout
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		if self.channels is None:
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+			self.sock.bind(('', multicast_port))
+			membership = struct.pack('4s4s', socket.inet_aton(multicast), socket.inet_aton('0.0.0.0'))
+			self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+		else:
+			self.sock.bind(('127.0.0.1' if host in ('127.0.0.1', 'localhost') else '0.0.0.0', 0))
+		self.sock.settimeout(timeout)
+		self.layout_id = None
+		self.unpack = None
+		self.make = None
+		self.last_request = 0.0
+		self.received = 0
+
+	def _renew(self):
+		now = time.monotonic()
+		if self.channels is not None and now - self.last_request >= RENEW_INTERVAL:
+			self.last_request = now
+			self.sock.sendto(json.dumps({'channels': self.channels}).encode(), self.relay)
+
+	def _schema(self, layout_id, schema):
+		self.layout_id = layout_id
+		self.unpack = struct.Struct('<' + ''.join(code for _, code, _ in schema['fields'])).unpack_from
+		self.make = namedtuple('RelayFrame', schema['channels'])._make
+
+	def recv(self):
+		"""Next frame, None when nothing arrived within the timeout"""
+		while True:
+			self._renew()
+			try:
+				data = self.sock.recv(4096)
+			except socket.timeout:
+				return None
+			if len(data) < HEADER.size:
+				continue
+			kind, layout_id = HEADER.unpack_from(data)
+			if kind == KIND_FRAME and layout_id == self.layout_id:
+				self.received += 1
+				return self.make(self.unpack(data, HEADER.size))
+			if kind == KIND_SCHEMA and layout_id != self.layout_id:
+				self._schema(layout_id, json.loads(data[HEADER.size:]))
+			elif kind == KIND_ERROR:
+				raise ValueError(json.loads(data[HEADER.size:])['error'])
+
+	def __iter__(self):
+		while True:
+			frame = self.recv()
+			if frame is not None:
+				yield frame
+
+	def close(self):
+		self.sock.close()
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Decrypt GT7 telemetry once and relay decoded frames to local consumers')
+	parser.add_argument('ip', help='LAN IP address of the PlayStation')
+	parser.add_argument('--bind', default='127.0.0.1', help='address subscribers reach the relay on (default: 127.0.0.1)')
+	parser.add_argument('--port', type=int, default=RELAY_PORT, help=f'control port (default: {RELAY_PORT})')
+	parser.add_argument('--multicast', metavar='GROUP', help='also publish every frame to this multicast group')
+	parser.add_argument('--multicast-port', type=int, default=MULTICAST_PORT)
+	parser.add_argument('--multicast-channels', nargs='+', metavar='CHANNEL', help='channels for the group (default: all)')
+	parser.add_argument('--ttl', type=int, default=1, help='multicast TTL, 1 keeps it on the local network')
+	args = parser.parse_args()
+
+	core = gt7ingest.IngestCore(args.ip)
+	relay = Relay(core, args.bind, args.port, args.multicast, args.multicast_port, args.multicast_channels, args.ttl)
+	print(f'Relaying {args.ip} on {args.bind}:{args.port}' + (f' and {args.multicast}:{args.multicast_port}' if args.multicast else ''))
+	try:
+		asyncio.run(relay.run())
+	except KeyboardInterrupt:
+		pass
@@ -0,0 +1,206 @@
+import argparse
+import heapq
+import random
+import socket
+import sys
+import time
+import gt7capture
+import gt7packet
+import gt7synth
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Local PlayStation stand-in.
+#
+# Listens for the 'B' heartbeat on the console's port and streams encrypted telemetry to
+# every client that heartbeated recently, just like GT7 does. Packets come from a capture
+# file or from the synthetic session in gt7synth. Point a client at 127.0.0.1:
+#
+#   python3 gt7replay.py --capture session.gt7cap --speed 2
+#   python3 gt7telemetry.py 127.0.0.1
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+# ports for send and receive data, seen from the console side
+SendPort = 33740
+ReceivePort = 33739
+
+def capture_source(filename, raw=False, loop=False, start_lap=None):
+	"""Yield (seconds since start, datagram) from a capture file
+
+	Unless raw, packets are decrypted, renumbered with continuous packet IDs and
+	re-encrypted with fresh IV seeds so looping replays look like one stream.
+	"""
+	rnd = random.Random()
+	packet_id = 0
+	offset = 0.0
+	with gt7capture.CaptureReader(filename) as capture:
+		if len(capture) == 0:
+			return
+		first = capture.seek_lap(start_lap) if start_lap is not None else 0
+		t0 = capture.timestamps[first]
+		while True:
+			sent = 0
+			for t_ns, data in capture.records(first):
+				t = offset + (t_ns - t0) / 1e9
+				if raw:
+					sent += 1
+					yield t, bytes(data)
+					continue
+				frame = gt7packet.decode(gt7packet.salsa20_dec(data))
+				if frame is None:
+					continue
+				frame = frame._replace(packet_id=packet_id)
+				packet_id += 1
+				sent += 1
+				yield t, gt7packet.salsa20_enc(gt7packet.encode(frame), rnd.getrandbits(32))
+			if not loop or not sent:
+				return		# also when nothing in the capture decodes, looping would only spin
+			offset = t + 1.0 / gt7synth.PACKET_RATE
+
+def synthetic_source(seed=None):
+	"""Yield (seconds since start, datagram) from an endless synthetic session"""
+	dt = 1.0 / gt7synth.PACKET_RATE
+	frames = gt7synth.SyntheticSession(seed=seed).frames()
+	for n, data in enumerate(gt7synth.encrypted_packets(frames, seed)):
+		yield n * dt, data
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+class ReplayServer:
+	"""Streams packets to heartbeating clients with optional loss, reordering and jitter"""
+
+	def __init__(self, sock, speed=1.0, loss=0.0, reorder=0.0, jitter=0.0, hb_timeout=10.0, seed=None):
+		self.sock = sock
+		self.speed = speed			# None sends as fast as possible
+		self.loss = loss
+		self.reorder = reorder
+		self.jitter = jitter		# seconds of extra random delay per packet
+		self.hb_timeout = hb_timeout
+		self.random = random.Random(seed)
+		self.clients = {}			# ip -> time of last heartbeat
+		self.sent = 0
+		self.dropped = 0
+		self.reordered = 0
+
+	def poll_heartbeats(self, timeout=0.0):
+		self.sock.settimeout(timeout)
+		while True:
+			try:
+				data, address = self.sock.recvfrom(64)
+			except (BlockingIOError, socket.timeout):
+				break
+			if data[:1] in (b'A', b'B', b'~'):
+				if address[0] not in self.clients:
+					print(f'Client {address[0]} connected ({data[:1].decode()} heartbeat)')
+				self.clients[address[0]] = time.monotonic()
+			self.sock.settimeout(0.0)
+
+		now = time.monotonic()
+		for client, last in list(self.clients.items()):
+			if now - last > self.hb_timeout:
+				print(f'Client {client} timed out')
+				del self.clients[client]
+
+	def send(self, data):
+		for client in self.clients:
+			self.sock.sendto(data, (client, SendPort))
+		self.sent += 1
+
+	def run(self, source, stats_interval=5.0):
+		pending = []		# heap of (send time, sequence, datagram), for jitter and reordering
+		held = None			# datagram held back to swap with the next one
+		seq = 0
+		start = None
+		last_stats = time.monotonic()
+		last_sent = 0
+
+		# nothing is streamed until someone asks for it
+		while not self.clients:
+			self.poll_heartbeats(1.0)
+		print('Streaming')
+
+		for t, data in source:
+			if seq % 16 == 0 or self.speed is not None:
+				self.poll_heartbeats()
+			while not self.clients:
+				self.poll_heartbeats(1.0)
+				start = None
+
+			now = time.monotonic()
+			if start is None:
+				start = now - (t / self.speed if self.speed else 0.0)
+			nominal = start + t / self.speed if self.speed else now
+
+			if self.loss and self.random.random() < self.loss:
+				self.dropped += 1
+				continue
+			if self.reorder and held is None and self.random.random() < self.reorder:
+				held = data
+				self.reordered += 1
+				continue
+			due = nominal + self.random.uniform(0.0, self.jitter) if self.jitter else nominal
+			heapq.heappush(pending, (due, seq, data))
+			seq += 1
+			if held is not None:
+				heapq.heappush(pending, (due, seq, held))
+				seq += 1
+				held = None
+
+			# send everything due by now, later (jittered) packets wait for the next round
+			while pending and pending[0][0] <= nominal:
+				wait = pending[0][0] - time.monotonic()
+				if wait > 0:
+					time.sleep(wait)
+				self.send(heapq.heappop(pending)[2])
+
+			if now - last_stats >= stats_interval:
+				rate = (self.sent - last_sent) / (now - last_stats)
+				print(f'sent {self.sent} ({rate:.1f} Hz), dropped {self.dropped}, reordered {self.reordered}, clients {len(self.clients)}')
+				last_stats = now
+				last_sent = self.sent
+
+		for _, _, data in sorted(pending):
+			self.send(data)
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+def parse_speed(value):
+	if value == 'max':
+		return None
+	speed = float(value)
+	if speed <= 0:
+		raise argparse.ArgumentTypeError('speed must be positive or "max"')
+	return speed
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Stand-in for a PlayStation streaming GT7 telemetry')
+	parser.add_argument('--capture', metavar='FILE', help='replay a capture file (default: synthetic laps)')
+	parser.add_argument('--raw', action='store_true', help='send captured datagrams untouched instead of re-encrypting them')
+	parser.add_argument('--loop', action='store_true', help='restart the capture when it ends')
+	parser.add_argument('--lap', type=int, help='start the capture at this lap')
+	parser.add_argument('--speed', type=parse_speed, default=1.0, help='playback speed multiplier, or "max" (default: 1)')
+	parser.add_argument('--loss', type=float, default=0.0, help='fraction of packets to drop')
+	parser.add_argument('--reorder', type=float, default=0.0, help='fraction of packets to swap with their successor')
+	parser.add_argument('--jitter', type=float, default=0.0, help='maximum extra delay per packet in ms')
+	parser.add_argument('--bind', default='0.0.0.0', help='address to listen for heartbeats on')
+	parser.add_argument('--hb-timeout', type=float, default=10.0, help='seconds without heartbeat before a client is dropped')
+	parser.add_argument('--seed', type=int, help='random seed for synthetic data and impairments')
+	args = parser.parse_args()
+
+	if args.capture:
+		source = capture_source(args.capture, raw=args.raw, loop=args.loop, start_lap=args.lap)
+	else:
+		source = synthetic_source(args.seed)
+
+	sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+	sock.bind((args.bind, ReceivePort))
+
+	server = ReplayServer(sock, speed=args.speed, loss=args.loss, reorder=args.reorder,
+		jitter=args.jitter / 1000, hb_timeout=args.hb_timeout, seed=args.seed)
+	print(f'Waiting for heartbeat on {args.bind}:{ReceivePort}')
+	try:
+		server.run(source)
+	except KeyboardInterrupt:
+		pass
+	print(f'sent {server.sent}, dropped {server.dropped}, reordered {server.reordered}')
+	sock.close()
+	sys.exit(0)
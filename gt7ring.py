@@ -0,0 +1,191 @@
+import math
+from collections import namedtuple
+from multiprocessing import shared_memory
+from operator import attrgetter
+import numpy as np
+import gt7packet
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Shared memory ring of decoded frames for consumers on the same host.
+#
+# One writer (the ingestion side) copies every decoded packet into the next slot of a
+# multiprocessing.shared_memory block as a fixed-layout record (RECORD: a sequence number,
+# the receive time, the lap time and delta worked out for it, then every packet field and
+# derived value), and only then bumps the count of records written in the header. Readers
+# attach by name and get NumPy views straight onto the records, no copying and no
+# syscalls. A record is only overwritten a whole ring later, so a reader that falls
+# further behind than that has been overrun, which it can tell from the sequence numbers:
+#
+#   ring = FrameRing('gt7', create=True)
+#   ring.write(frame, t_ns, lap_ms)
+#
+#   ring = FrameRing('gt7')
+#   reader = RingReader(ring)
+#   for records in reader.poll():
+#       print(records['speed'].max())
+#   print(ring.latest().speed, reader.lost)
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+CAPACITY = 1 << 15		# records, a little over 9 minutes at 60 packets per second
+
+MAGIC = 0x47543752494E4731		# 'GT7RING1'
+
+# header words
+_MAGIC = 0
+_CAPACITY = 1
+_RECORD_SIZE = 2
+_WRITTEN = 3			# records written so far, the sequence number of the next one
+HEADER_SIZE = 64
+
+# seq: number of the record, t_ns: monotonic receive time, lap_ms: lap time on the packet
+# clock, delta: s to the reference lap (NaN without one), then gt7packet.CHANNELS
+_PREFIX = (('seq', '<u8'), ('t_ns', '<i8'), ('lap_ms', '<i4'), ('delta', '<f4'))
+RECORD = np.dtype(list(_PREFIX) + [(name, '<' + code) for name, code in gt7packet.CHANNELS.items()])
+
+# python copy of one record, field access like a TelemetryFrame
+RingFrame = namedtuple('RingFrame', RECORD.names)
+
+class Overrun(Exception):
+	"""Records asked for were already overwritten by the writer"""
+
+def _open(name, create, size):
+	if create:
+		return shared_memory.SharedMemory(name, create=True, size=size)
+	try:
+		return shared_memory.SharedMemory(name, track=False)
+	except TypeError:
+		# before Python 3.13 every attaching process registers the block and unlinks it
+		# at exit, taking it away from the writer
+		from multiprocessing import resource_tracker
+		shm = shared_memory.SharedMemory(name)
+		resource_tracker.unregister(shm._name, 'shared_memory')
+		return shm
+
+class FrameRing:
+	"""Fixed-size ring of RECORDs in shared memory, one writer and any number of readers"""
+
+	def __init__(self, name=None, capacity=CAPACITY, create=False):
+		self.shm = _open(name, create, HEADER_SIZE + capacity * RECORD.itemsize)
+		self.name = self.shm.name
+		self.owner = create
+		self.header = np.ndarray((HEADER_SIZE // 8,), dtype='<u8', buffer=self.shm.buf)
+		if create:
+			self.header[:] = 0
+			self.header[_MAGIC] = MAGIC
+			self.header[_CAPACITY] = capacity
+			self.header[_RECORD_SIZE] = RECORD.itemsize
+		elif self.header[_MAGIC] != MAGIC or self.header[_RECORD_SIZE] != RECORD.itemsize:
+			self.header = None
+			self.shm.close()
+			raise ValueError(f'{name} is not a frame ring of this version')
+		self.capacity = int(self.header[_CAPACITY])
+		self.records = np.ndarray((self.capacity,), dtype=RECORD, buffer=self.shm.buf, offset=HEADER_SIZE)
+		self._values = attrgetter(*gt7packet.CHANNELS)
+
+	@property
+	def seq(self):
+		"""Records written so far, the sequence number of the next one"""
+		return int(self.header[_WRITTEN])
+
+	@property
+	def oldest(self):
+		"""Sequence number of the oldest record not overwritten yet"""
+		return max(0, self.seq - self.capacity)
+
+	def write(self, frame, t_ns, lap_ms=0, delta=None):
+		seq = int(self.header[_WRITTEN])
+		self.records[seq % self.capacity] = (seq, t_ns, lap_ms, math.nan if delta is None else delta) + self._values(frame)
+		# readers only look at records below the count, so the record is complete before it counts
+		self.header[_WRITTEN] = seq + 1
+
+	def latest(self):
+		"""Copy of the newest record as a RingFrame, None before the first"""
+		seq = self.seq - 1
+		if seq < 0:
+			return None
+		record = self.records[seq % self.capacity].item()
+		return RingFrame._make(record) if record[0] == seq else None
+
+	def overrun(self, start):
+		"""Whether the record with this sequence number has been overwritten"""
+		return start < self.seq - self.capacity
+
+	def views(self, start, stop):
+		"""Records start to stop (sequence numbers) as one or two views, without copying
+
+		The views change under the reader once the writer comes round again, check
+		overrun(start) after reading them when that matters.
+		"""
+		if self.overrun(start):
+			raise Overrun(f'record {start} was overwritten, the oldest is {self.oldest}')
+		stop = min(stop, self.seq)
+		if stop <= start:
+			return ()
+		first = start % self.capacity
+		last = first + (stop - start)
+		if last <= self.capacity:
+			return (self.records[first:last],)
+		return (self.records[first:], self.records[:last - self.capacity])
+
+	def read(self, start, stop):
+		"""Copy of records start to stop, raises Overrun when they were overwritten while copying"""
+		views = self.views(start, stop)
+		records = np.concatenate(views) if len(views) != 1 else views[0].copy()
+		if self.overrun(start):
+			raise Overrun(f'record {start} was overwritten while reading')
+		return records
+
+	def close(self):
+		# views onto the buffer have to go before it can be closed
+		self.records = None
+		self.header = None
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+
+class RingReader:
+	"""Follows a FrameRing from a position, skipping ahead and counting records when overrun"""
+
+	def __init__(self, ring, start=None):
+		self.ring = ring
+		self.next = ring.seq if start is None else start
+		self.lost = 0
+
+	def poll(self):
+		"""Views of the records written since the last poll"""
+		ring = self.ring
+		seq = ring.seq
+		oldest = seq - ring.capacity
+		if self.next < oldest:
+			self.lost += oldest - self.next
+			self.next = oldest
+		views = ring.views(self.next, seq)
+		self.next = seq
+		return views
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+if __name__ == '__main__':
+	import argparse
+	import time
+
+	parser = argparse.ArgumentParser(description='Follow a frame ring written by the dashboard')
+	parser.add_argument('name', help='shared memory name of the ring')
+	args = parser.parse_args()
+
+	ring = FrameRing(args.name)
+	reader = RingReader(ring)
+	print(f'{args.name}: {ring.capacity} records of {RECORD.itemsize} bytes, {ring.seq} written')
+	try:
+		while True:
+			time.sleep(1)
+			count = sum(len(records) for records in reader.poll())
+			frame = ring.latest()
+			if frame is not None:
+				print(f'{count:3d} packets/s  lap {frame.current_lap}  {frame.lap_ms / 1000:8.3f} s  '
+					f'{frame.speed * 3.6:5.1f} km/h  lost {reader.lost}')
+	except KeyboardInterrupt:
+		pass
+	finally:
+		reader = None
+		ring.close()
@@ -0,0 +1,66 @@
+import sys
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Diffing terminal screen model.
+#
+# Text is put into cells addressed by (row, column). Nothing is written until render(),
+# which emits only the cells whose text or attributes changed since the last render, as
+# one batched write and one flush.
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+# ansi prefix
+pref = "\033["
+
+def _sgr(reverse, bold, underline):
+	# always reset first so a cell never inherits attributes from whatever was drawn before it
+	codes = '0'
+	if reverse:
+		codes += ';7'
+	if bold:
+		codes += ';1'
+	if underline:
+		codes += ';4'
+	return f'{pref}{codes}m'
+
+_SGR = {(r, b, u): _sgr(r, b, u) for r in (0, 1) for b in (0, 1) for u in (0, 1)}
+
+class Screen:
+	def __init__(self, out=None):
+		self.out = out if out is not None else sys.stdout
+		self.shown = {}		# (row, column) -> (text, attributes) currently on the terminal
+		self.pending = {}	# cells changed since the last render
+		self.writes = 0
+		self.cells_written = 0
+
+	def put(self, text, row=1, column=1, bold=0, underline=0, reverse=0):
+		key = (row, column)
+		cell = (text, (1 if reverse else 0, 1 if bold else 0, 1 if underline else 0))
+		if self.shown.get(key) != cell:
+			self.pending[key] = cell
+		else:
+			self.pending.pop(key, None)
+
+	def render(self):
+		"""Write all changed cells in one go, returns the number of cells written"""
+		pending = self.pending
+		if not pending:
+			return 0
+		parts = []
+		for (row, column), (text, attrs) in pending.items():
+			parts.append(f'{pref}{row};{column}H')
+			parts.append(_SGR[attrs])
+			parts.append(text)
+		self.out.write(''.join(parts))
+		self.out.flush()
+		count = len(pending)
+		self.shown.update(pending)
+		pending.clear()
+		self.writes += 1
+		self.cells_written += count
+		return count
+
+	def invalidate(self):
+		"""Redraw everything on the next render, e.g. after the terminal was cleared"""
+		for key, cell in self.shown.items():
+			self.pending.setdefault(key, cell)
+		self.shown.clear()
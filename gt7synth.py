@@ -0,0 +1,180 @@
+import math
+import random
+import time
+import gt7packet
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Synthetic telemetry, a car lapping an elliptical circuit at the console packet rate.
+#
+# The ellipse, the car's pace, sensor noise and pause breaks are parameters, and packets
+# come out encrypted like the console's, as variant 'A' or 'B'. Sessions can be written
+# to capture files for gt7replay.py, gt7capture.py and gt7trackdetect.py --batch:
+#
+#   python3 gt7synth.py synth.gt7cap --seconds 300 --pause-every 60 --seed 1
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+PACKET_RATE = 60.0
+
+GEAR_RATIOS = (3.2, 2.3, 1.8, 1.45, 1.2, 1.0, 0.85, 0.75)
+FINAL_DRIVE = 4.1
+TYRE_RADIUS = 0.33
+
+class SyntheticSession:
+	"""Plain telemetry frames for a car lapping an ellipse, slower at the tight ends"""
+
+	def __init__(self, radius_x=400.0, radius_z=250.0, top_speed=70.0, corner_speed=30.0,
+			car_id=3343, total_laps=5, seed=None, center=(0.0, 0.0), noise=1.0, pause_every=None, pause_length=5.0):
+		self.radius_x = radius_x
+		self.radius_z = radius_z
+		self.top_speed = top_speed
+		self.corner_speed = corner_speed
+		self.car_id = car_id
+		self.total_laps = total_laps
+		self.random = random.Random(seed)
+		self.center = center				# (x, z) of the ellipse
+		self.noise = noise					# scale of the accelerometer noise, 0 for none
+		self.pause_every = pause_every		# s of driving between pauses, None for no pauses
+		self.pause_length = pause_length	# s per pause
+
+	def _target_speed(self, angle):
+		# fast along the long sides of the ellipse, slow around both ends
+		blend = abs(math.sin(angle))
+		return self.corner_speed + (self.top_speed - self.corner_speed) * blend * blend
+
+	def frames(self, count=None, packet_id=0):
+		"""Yield TelemetryFrames, forever unless count is given"""
+		dt = 1.0 / PACKET_RATE
+		base = dict.fromkeys(gt7packet.FIELDS, 0)
+		base.update(
+			magic=gt7packet.MAGIC, car_id=self.car_id, total_laps=self.total_laps,
+			current_position=1, total_positions=1, fuel_capacity=100.0, fuel_level=100.0,
+			rev_warning_rpm=7000, rev_limiter_rpm=8000, est_top_speed=260,
+			best_lap_ms=-1, last_lap_ms=-1, oil_temp=110.0, water_temp=85.0, oil_pressure=5.0,
+			ride_height=0.08, clutch_engaged=1.0,
+			tyre_diam_fl=TYRE_RADIUS, tyre_diam_fr=TYRE_RADIUS, tyre_diam_rl=TYRE_RADIUS, tyre_diam_rr=TYRE_RADIUS,
+			flags=gt7packet.FLAG_CAR_ON_TRACK | gt7packet.FLAG_IN_GEAR,
+		)
+		for n, ratio in enumerate(GEAR_RATIOS):
+			base[f'gear_ratio_{n + 1}'] = ratio
+
+		angle = -math.pi / 2	# start/finish on the long side
+		speed = self.corner_speed
+		lap = 1
+		lap_frames = 0
+		best = -1
+		heading = None
+		time_of_day = 14 * 3600 * 1000
+		fuel = 100.0
+		emitted = 0
+		driven = 0
+		pause_every = int(self.pause_every * PACKET_RATE) if self.pause_every else None
+		cx, cz = self.center
+		gauss = self.random.gauss
+		noise = lambda mu, sigma: gauss(mu, sigma * self.noise) if self.noise else mu
+		while count is None or emitted < count:
+			target = self._target_speed(angle)
+			accel = max(-12.0, min(6.0, (target - speed) * 2.0))
+			speed += accel * dt
+
+			# advance along the ellipse by arc length
+			dx = -self.radius_x * math.sin(angle)
+			dz = self.radius_z * math.cos(angle)
+			angle += speed * dt / math.hypot(dx, dz)
+			if angle >= 3 * math.pi / 2:
+				angle -= 2 * math.pi
+				lap_ms = int(lap_frames * dt * 1000)
+				best = lap_ms if best == -1 else min(best, lap_ms)
+				base.update(last_lap_ms=lap_ms, best_lap_ms=best)
+				lap += 1
+				lap_frames = 0
+			lap_frames += 1
+
+			x = cx + self.radius_x * math.cos(angle)
+			z = cz + self.radius_z * math.sin(angle)
+			tangent = math.hypot(dx, dz)
+			vx = speed * dx / tangent
+			vz = speed * dz / tangent
+			new_heading = math.atan2(vx, vz)
+			yaw_rate = 0.0 if heading is None else (new_heading - heading + math.pi) % (2 * math.pi) - math.pi
+			heading = new_heading
+
+			wheel_rps = speed / TYRE_RADIUS
+			gear = 1
+			for g, ratio in enumerate(GEAR_RATIOS):
+				gear = g + 1
+				if wheel_rps * ratio * FINAL_DRIVE * 60 / (2 * math.pi) < 6800:
+					break
+			rpm = max(900.0, wheel_rps * GEAR_RATIOS[gear - 1] * FINAL_DRIVE * 60 / (2 * math.pi))
+			throttle = 255 if accel > 0.5 else int(max(0.0, accel) * 255 / 0.5)
+			brake = int(min(1.0, -accel / 12.0) * 255) if accel < -0.5 else 0
+			fuel = max(0.0, fuel - 0.0005)
+
+			frame = gt7packet.TelemetryFrame(**dict(base,
+				position_x=x, position_y=1.0, position_z=z,
+				velocity_x=vx, velocity_y=0.0, velocity_z=vz,
+				rotation_yaw=heading / math.pi, angular_vel_y=yaw_rate / dt,
+				rpm=rpm, speed=speed, fuel_level=fuel, boost=1.0,
+				packet_id=packet_id + emitted, current_lap=lap,
+				time_of_day_ms=time_of_day + int(emitted * dt * 1000),
+				gears=gear | ((gear + 1 if rpm > 6500 and gear < 8 else gear) << 4),
+				throttle_raw=throttle, brake_raw=brake,
+				wheel_rps_fl=wheel_rps, wheel_rps_fr=wheel_rps, wheel_rps_rl=wheel_rps, wheel_rps_rr=wheel_rps,
+				rpm_after_clutch=rpm,
+				accel_sway=speed * yaw_rate / dt + noise(0, 0.05),
+				accel_heave=noise(0, 0.2),
+				accel_surge=accel + noise(0, 0.05),
+			))
+			yield frame
+			emitted += 1
+			driven += 1
+
+			if pause_every and driven % pause_every == 0:
+				# paused: the console keeps sending the same values, flagged, with rising packet IDs
+				paused = frame._replace(flags=frame.flags | gt7packet.FLAG_PAUSED)
+				for _ in range(int(self.pause_length * PACKET_RATE)):
+					if count is not None and emitted >= count:
+						return
+					yield paused._replace(packet_id=packet_id + emitted)
+					emitted += 1
+
+def encrypted_packets(frames, seed=None, variant='B'):
+	"""Encrypt frames the way the console does, with a fresh IV seed per packet"""
+	rnd = random.Random(seed)
+	size = gt7packet.PACKET_A_SIZE if variant == 'A' else gt7packet.PACKET_B_SIZE
+	for frame in frames:
+		yield gt7packet.salsa20_enc(gt7packet.encode(frame)[:size], rnd.getrandbits(32))
+
+def packets(count, seed=None, variant='B', **options):
+	"""count encrypted packets of a SyntheticSession(seed=seed, **options)"""
+	return list(encrypted_packets(SyntheticSession(seed=seed, **options).frames(count), seed, variant))
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+if __name__ == '__main__':
+	import argparse
+	import gt7capture
+
+	parser = argparse.ArgumentParser(description='Write a synthetic session to a capture file')
+	parser.add_argument('output', help='capture file to write')
+	parser.add_argument('--seconds', type=float, default=300.0, help='session length (default: 300)')
+	parser.add_argument('--variant', choices=('A', 'B'), default='B', help='packet variant (default: B)')
+	parser.add_argument('--radius', type=float, nargs=2, default=(400.0, 250.0), metavar=('X', 'Z'), help='ellipse radii in m')
+	parser.add_argument('--center', type=float, nargs=2, default=(0.0, 0.0), metavar=('X', 'Z'), help='ellipse center in m')
+	parser.add_argument('--speed', type=float, nargs=2, default=(70.0, 30.0), metavar=('TOP', 'CORNER'), help='speeds in m/s')
+	parser.add_argument('--noise', type=float, default=1.0, help='accelerometer noise scale (default: 1)')
+	parser.add_argument('--pause-every', type=float, metavar='SECONDS', help='pause after this much driving')
+	parser.add_argument('--pause-length', type=float, default=5.0, metavar='SECONDS')
+	parser.add_argument('--car', type=int, default=3343, help='car ID')
+	parser.add_argument('--seed', type=int, help='random seed for noise and IVs')
+	args = parser.parse_args()
+
+	session = SyntheticSession(args.radius[0], args.radius[1], args.speed[0], args.speed[1], car_id=args.car,
+		seed=args.seed, center=tuple(args.center), noise=args.noise, pause_every=args.pause_every,
+		pause_length=args.pause_length)
+	count = int(args.seconds * PACKET_RATE)
+	# receive times on the console's schedule, as if captured live
+	t0 = time.monotonic_ns()
+	with gt7capture.CaptureWriter(args.output) as writer:
+		for n, data in enumerate(encrypted_packets(session.frames(count), args.seed, args.variant)):
+			writer.write(data, t0 + int(n * 1e9 / PACKET_RATE))
+	print(f'{count} packets written to {args.output}')
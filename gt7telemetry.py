@@ -1,24 +1,48 @@
+import argparse
+import asyncio
 import signal
-from datetime import datetime as dt
 from datetime import timedelta as td
-import socket
 import sys
-import struct
 import time
-from Crypto.Cipher import Salsa20
+import gt7capture
+import gt7delta
+import gt7ingest
+import gt7laps
+import gt7lapstore
+import gt7metrics
+import gt7screen
+import gt7trackdetect
 
 # ansi prefix
 pref = "\033["
 
-# ports for send and receive data
-SendPort = 33739
-ReceivePort = 33740
+# get ip address and options from command line
+parser = argparse.ArgumentParser(usage='python3 gt7telemetry.py <playstation-ip> [--record FILE] [--store DIR [--reference LAP]] [--fps N] [--metrics SECONDS]')
+parser.add_argument('ip', help='LAN IP address of the PlayStation')
+parser.add_argument('--record', metavar='FILE', help='append the raw packet stream to a capture file')
+parser.add_argument('--store', metavar='DIR', help='keep every completed lap in this lap store')
+parser.add_argument('--reference', type=int, metavar='LAP', help='stored lap to show the delta against (default: fastest for the track and car)')
+parser.add_argument('--fps', type=float, default=30.0, help='maximum display refresh rate (default: 30)')
+parser.add_argument('--metrics', type=float, metavar='SECONDS', help='show a pipeline timing summary on the bottom line, refreshed this often')
+args = parser.parse_args()
+ip = args.ip
+
+# optional raw packet recorder
+recorder = gt7capture.CaptureWriter(args.record) if args.record else None
+
+# optional stage timing
+metrics = gt7metrics.Metrics() if args.metrics else None
+
+# socket, heartbeat and decoding
+core = gt7ingest.IngestCore(ip, metrics=metrics)
 
 # ctrl-c handler
 def handler(signum, frame):
 	sys.stdout.write(f'{pref}?1049l')	# revert buffer
 	sys.stdout.write(f'{pref}?25h')		# restore cursor
 	sys.stdout.flush()
+	if recorder:
+		recorder.close()
 	exit(1)
 
 # handle ctrl-c
@@ -28,55 +52,12 @@ sys.stdout.write(f'{pref}?1049h')	# alt buffer
 sys.stdout.write(f'{pref}?25l')		# hide cursor
 sys.stdout.flush()
 
-# get ip address from command line
-if len(sys.argv) == 2:
-    ip = sys.argv[1]
-else:
-    print('Run like : python3 gt7telemetry.py <playstation-ip>')
-    exit(1)
-
-# Create a UDP socket and bind it
-s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-s.bind(('0.0.0.0', ReceivePort))
-s.settimeout(10)
-
-# data stream decoding
-def salsa20_dec(dat):
-	KEY = b'Simulator Interface Packet GT7 ver 0.0'
-	# Seed IV is always located here
-	oiv = dat[0x40:0x44]
-	iv1 = int.from_bytes(oiv, byteorder='little')
-	# Updated to use correct magic number for GT7
-	iv2 = iv1 ^ 0xDEADBEEF
-	IV = bytearray()
-	IV.extend(iv2.to_bytes(4, 'little'))
-	IV.extend(iv1.to_bytes(4, 'little'))
-	
-	cipher = Salsa20.new(key=KEY[0:32], nonce=bytes(IV))
-	ddata = cipher.decrypt(dat)
-	
-	magic = int.from_bytes(ddata[0:4], byteorder='little')
-	if magic != 0x47375330:
-		return bytearray(b'')
-	return ddata
-
-# send heartbeat
-def send_hb(s):
-	send_data = 'B'
-	s.sendto(send_data.encode('utf-8'), (ip, SendPort))
+# screen model, only changed fields are written out once per rendered frame
+screen = gt7screen.Screen(sys.stdout)
 
 # generic print function
 def printAt(str, row=1, column=1, bold=0, underline=0, reverse=0):
-	sys.stdout.write('{}{};{}H'.format(pref, row, column))
-	if reverse:
-		sys.stdout.write('{}7m'.format(pref))
-	if bold:
-		sys.stdout.write('{}1m'.format(pref))
-	if underline:
-		sys.stdout.write('{}4m'.format(pref))
-	if not bold and not underline and not reverse:
-		sys.stdout.write('{}0m'.format(pref))
-	sys.stdout.write(str)
+	screen.put(str, row, column, bold, underline, reverse)
 
 def secondsToLaptime(seconds):
 	remaining = seconds
@@ -152,24 +133,27 @@ def accelBarChart(value, axis, barWidth=20):
 
 
 
-# start by sending heartbeat
-send_hb(s)
-
 printAt('GT7 Telemetry Display 0.7 (ctrl-c to quit)', 1, 1, bold=1)
 printAt('Packet ID:', 1, 73)
 printAt('Pkt Len:      bytes', 2, 73)
 printAt('RX Rate:      Hz', 3, 73)
+printAt('Dropped:', 4, 73)
+printAt('Loss:         %', 5, 73)
+printAt('Late:         %', 6, 73)
+printAt('Dupes:', 7, 73)
+printAt('Jitter:       ms', 8, 73)
 
 printAt('{:<92}'.format('Current Track Data'), 3, 1, reverse=1, bold=1)
-printAt('Time on track:', 3, 41, reverse=1)
+printAt('Time on track:', 3, 41, reverse=1, bold=1)
 printAt('Laps:    /', 5, 1)
 printAt('Position:   /', 5, 21)
 printAt('Best Lap Time:', 7, 1)
 printAt('Current Lap Time: ', 7, 31)
 printAt('Last Lap Time:', 8, 1)
+printAt('Delta:', 8, 31)
 
 printAt('{:<92}'.format('Current Car Data'), 10, 1, reverse=1, bold=1)
-printAt('Car ID:', 10, 41, reverse=1)
+printAt('Car ID:', 10, 41, reverse=1, bold=1)
 printAt('Throttle:    %', 12, 1)
 printAt('RPM:        rpm', 12, 21)
 printAt('Speed:        mph', 12, 41)
@@ -227,208 +211,271 @@ printAt('Surge:', 23, 61)
 
 printAt('N/S:', 30, 21)
 
-sys.stdout.flush()
+screen.render()
 
-prevlap = -1
-pktid = 0
-pknt = 0
-dt_start = dt.now()  # Initialize lap time tracking
-# Framerate tracking
-last_frame_time = time.time()
-frame_count = 0
+# per-packet bookkeeping on the newest packet, anything this falls behind on is skipped
+latest = None
 framerate = 0.0
-framerate_update_interval = 0.5  # Update framerate every 0.5 seconds
+dropped = 0
+
+async def receive(frames):
+	global latest, framerate, dropped
+	# Framerate tracking, counts every packet received, not just the ones seen here
+	last_frame_time = time.time()
+	last_received = 0
+	framerate_update_interval = 0.5  # Update framerate every 0.5 seconds
 
-while True:
-	try:
-		data, address = s.recvfrom(4096)
-		pknt = pknt + 1
-		
+	async for packet in frames:
 		# Calculate framerate
 		current_time = time.time()
-		frame_count += 1
 		time_elapsed = current_time - last_frame_time
-		
+
 		if time_elapsed >= framerate_update_interval:
-			framerate = frame_count / time_elapsed
-			frame_count = 0
+			framerate = (frames.received - last_received) / time_elapsed
+			last_received = frames.received
 			last_frame_time = current_time
-			printAt('{:6.2f}'.format(framerate), 3, 82)
-		
-		# Display packet length
-		printAt('{:4d}'.format(len(data)), 2, 82)
-		
-		ddata = salsa20_dec(data)
-		if len(ddata) > 0:
-			# Extract and display packet ID immediately, even if out of order
-			raw_pktid = struct.unpack('i', ddata[0x70:0x70+4])[0]
-			printAt('{:>10}'.format(raw_pktid), 1, 83)						# packet id
-			pktid = raw_pktid
-
-			bstlap = struct.unpack('i', ddata[0x78:0x78+4])[0]
-			lstlap = struct.unpack('i', ddata[0x7C:0x7C+4])[0]
-			curlap = struct.unpack('h', ddata[0x74:0x74+2])[0]
-			if curlap > 0:
-				dt_now = dt.now()
-				if curlap != prevlap:
-					prevlap = curlap
-					dt_start = dt_now
-				curLapTime = dt_now - dt_start
-				printAt('{:>9}'.format(secondsToLaptime(curLapTime.total_seconds())), 7, 49)
-			else:
-				curLapTime = 0
-				printAt('{:>9}'.format(''), 7, 49)
-					
-			cgear = struct.unpack('B', ddata[0x90:0x90+1])[0] & 0b00001111
-			sgear = struct.unpack('B', ddata[0x90:0x90+1])[0] >> 4
-			if cgear < 1:
-				cgear = 'R'
-			if sgear > 14:
-				sgear = '–'
-
-			fuelCapacity = struct.unpack('f', ddata[0x48:0x48+4])[0]
-			isEV = False if fuelCapacity > 0 else True
-			if isEV:
-				printAt('Charge:', 14, 1)
-				printAt('{:3.0f} kWh'.format(struct.unpack('f', ddata[0x44:0x44+4])[0]), 14, 11)		# charge remaining
-				printAt('??? kWh'.format(struct.unpack('f', ddata[0x48:0x48+4])[0]), 14, 29)			# max battery capacity
-			else:
-				printAt('Fuel:  ', 14, 1)
-				printAt('{:3.0f} lit'.format(struct.unpack('f', ddata[0x44:0x44+4])[0]), 14, 11)		# fuel
-				printAt('{:3.0f} lit'.format(struct.unpack('f', ddata[0x48:0x48+4])[0]), 14, 29)		# max fuel
-
-			boost = struct.unpack('f', ddata[0x50:0x50+4])[0] - 1
-			hasTurbo = True if boost > -1 else False
-
-
-			tyreDiamFL = struct.unpack('f', ddata[0xB4:0xB4+4])[0]
-			tyreDiamFR = struct.unpack('f', ddata[0xB8:0xB8+4])[0]
-			tyreDiamRL = struct.unpack('f', ddata[0xBC:0xBC+4])[0]
-			tyreDiamRR = struct.unpack('f', ddata[0xC0:0xC0+4])[0]
-
-			tyreSpeedFL = abs(2.23694 * tyreDiamFL * struct.unpack('f', ddata[0xA4:0xA4+4])[0])
-			tyreSpeedFR = abs(2.23694 * tyreDiamFR * struct.unpack('f', ddata[0xA8:0xA8+4])[0])
-			tyreSpeedRL = abs(2.23694 * tyreDiamRL * struct.unpack('f', ddata[0xAC:0xAC+4])[0])
-			tyreSpeedRR = abs(2.23694 * tyreDiamRR * struct.unpack('f', ddata[0xB0:0xB0+4])[0])
-
-			carSpeed = 2.23694 * struct.unpack('f', ddata[0x4C:0x4C+4])[0]  # Convert m/s to mph
-
-			if carSpeed > 0:
-				tyreSlipRatioFL = '{:6.2f}'.format(tyreSpeedFL / carSpeed)
-				tyreSlipRatioFR = '{:6.2f}'.format(tyreSpeedFR / carSpeed)
-				tyreSlipRatioRL = '{:6.2f}'.format(tyreSpeedRL / carSpeed)
-				tyreSlipRatioRR = '{:6.2f}'.format(tyreSpeedRR / carSpeed)
-			else:
-				tyreSlipRatioFL = '  –  '
-				tyreSlipRatioFR = '  –  '
-				tyreSlipRatioRL = '  -  '
-				tyreSlipRatioRR = '  –  '
-
-			printAt('{:>8}'.format(str(td(seconds=round(struct.unpack('i', ddata[0x80:0x80+4])[0] / 1000)))), 3, 56, reverse=1)	# time of day on track
-
-			printAt('{:3.0f}'.format(curlap), 5, 7)															# current lap
-			printAt('{:3.0f}'.format(struct.unpack('h', ddata[0x76:0x76+2])[0]), 5, 11)						# total laps
-
-			printAt('{:2.0f}'.format(struct.unpack('h', ddata[0x84:0x84+2])[0]), 5, 31)						# current position
-			printAt('{:2.0f}'.format(struct.unpack('h', ddata[0x86:0x86+2])[0]), 5, 34)						# total positions
-
-			if bstlap != -1:
-				printAt('{:>9}'.format(secondsToLaptime(bstlap / 1000)), 7, 16)		# best lap time
-			else:
-				printAt('{:>9}'.format(''), 7, 16)
-			if lstlap != -1:
-				printAt('{:>9}'.format(secondsToLaptime(lstlap / 1000)), 8, 16)		# last lap time
-			else:
-				printAt('{:>9}'.format(''), 8, 16)
-
-			printAt('{:5.0f}'.format(struct.unpack('i', ddata[0x124:0x124+4])[0]), 10, 48, reverse=1)		# car id
-
-			throttle = struct.unpack('B', ddata[0x91:0x91+1])[0] / 2.55
-			brake = struct.unpack('B', ddata[0x92:0x92+1])[0] / 2.55
-			
-			printAt('{:3.0f}'.format(throttle), 12, 11)														# throttle
-			printAt(percentBarChart(throttle, 10), 12, 61)													# throttle bar chart
-			printAt('{:7.0f}'.format(struct.unpack('f', ddata[0x3C:0x3C+4])[0]), 12, 25)					# rpm
-			printAt('{:7.1f}'.format(carSpeed), 12, 47)														# speed kph
-			printAt('{:5.0f}'.format(struct.unpack('H', ddata[0x88:0x88+2])[0]), 12, 83)					# rpm rev warning
-
-			printAt('{:3.0f}'.format(brake), 13, 11)														# brake
-			printAt(percentBarChart(brake, 10), 13, 61)														# brake bar chart
-			printAt('{}'.format(cgear), 13, 27)																# actual gear
-			printAt('{}'.format(sgear), 13, 30)																# suggested gear
-
-			if hasTurbo:
-				printAt('{:7.2f}'.format(struct.unpack('f', ddata[0x50:0x50+4])[0] - 1), 13, 47)			# boost
-			else:
-				printAt('{:>7}'.format('–'), 13, 47)														# no turbo
-
-			printAt('{:5.0f}'.format(struct.unpack('H', ddata[0x8A:0x8A+2])[0]), 13, 83)					# rpm rev limiter
-
-			printAt('{:5.0f}'.format(struct.unpack('h', ddata[0x8C:0x8C+2])[0]), 14, 83)					# estimated top speed
-
-			printAt('{:5.3f}'.format(struct.unpack('f', ddata[0xF4:0xF4+4])[0]), 15, 9)						# clutch
-			printAt('{:5.3f}'.format(struct.unpack('f', ddata[0xF8:0xF8+4])[0]), 15, 17)					# clutch engaged
-			printAt('{:7.0f}'.format(struct.unpack('f', ddata[0xFC:0xFC+4])[0]), 15, 48)					# rpm after clutch
-
-			printAt('{:6.1f}'.format(struct.unpack('f', ddata[0x5C:0x5C+4])[0]), 17, 17)					# oil temp
-			printAt('{:6.1f}'.format(struct.unpack('f', ddata[0x58:0x58+4])[0]), 17, 49)					# water temp
-
-			printAt('{:6.2f}'.format(struct.unpack('f', ddata[0x54:0x54+4])[0]), 18, 17)					# oil pressure
-			printAt('{:6.0f}'.format(1000 * struct.unpack('f', ddata[0x38:0x38+4])[0]), 18, 49)				# ride height
-
-			printAt('{:7.3f}'.format(struct.unpack('f', ddata[0x104:0x104+4])[0]), 21, 5)					# 1st gear
-			printAt('{:7.3f}'.format(struct.unpack('f', ddata[0x108:0x108+4])[0]), 22, 5)					# 2nd gear
-			printAt('{:7.3f}'.format(struct.unpack('f', ddata[0x10C:0x10C+4])[0]), 23, 5)					# 3rd gear
-			printAt('{:7.3f}'.format(struct.unpack('f', ddata[0x110:0x110+4])[0]), 24, 5)					# 4th gear
-			printAt('{:7.3f}'.format(struct.unpack('f', ddata[0x114:0x114+4])[0]), 25, 5)					# 5th gear
-			printAt('{:7.3f}'.format(struct.unpack('f', ddata[0x118:0x118+4])[0]), 26, 5)					# 6th gear
-			printAt('{:7.3f}'.format(struct.unpack('f', ddata[0x11C:0x11C+4])[0]), 27, 5)					# 7th gear
-			printAt('{:7.3f}'.format(struct.unpack('f', ddata[0x120:0x120+4])[0]), 28, 5)					# 8th gear
-
-			printAt('{:7.3f}'.format(struct.unpack('f', ddata[0x100:0x100+4])[0]), 30, 5)					# ??? gear
-
-			printAt('{:11.4f}'.format(struct.unpack('f', ddata[0x04:0x04+4])[0]), 21, 23)					# pos X
-			printAt('{:11.4f}'.format(struct.unpack('f', ddata[0x08:0x08+4])[0]), 22, 23)					# pos Y
-			printAt('{:11.4f}'.format(struct.unpack('f', ddata[0x0C:0x0C+4])[0]), 23, 23)					# pos Z
-
-			printAt('{:11.4f}'.format(struct.unpack('f', ddata[0x10:0x10+4])[0]), 21, 43)					# velocity X
-			printAt('{:11.4f}'.format(struct.unpack('f', ddata[0x14:0x14+4])[0]), 22, 43)					# velocity Y
-			printAt('{:11.4f}'.format(struct.unpack('f', ddata[0x18:0x18+4])[0]), 23, 43)					# velocity Z
-
-			printAt('{:9.4f}'.format(struct.unpack('f', ddata[0x1C:0x1C+4])[0]), 26, 23)					# rot Pitch
-			printAt('{:9.4f}'.format(struct.unpack('f', ddata[0x20:0x20+4])[0]), 27, 23)					# rot Yaw
-			printAt('{:9.4f}'.format(struct.unpack('f', ddata[0x24:0x24+4])[0]), 28, 23)					# rot Roll
-
-			printAt('{:9.4f}'.format(struct.unpack('f', ddata[0x2C:0x2C+4])[0]), 26, 43)					# angular velocity X
-			printAt('{:9.4f}'.format(struct.unpack('f', ddata[0x30:0x30+4])[0]), 27, 43)					# angular velocity Y
-			printAt('{:9.4f}'.format(struct.unpack('f', ddata[0x34:0x34+4])[0]), 28, 43)					# angular velocity Z
-
-			# Packet B fields (316 bytes) - acceleration data at end of packet
-			# wheelRotation at 0x128 (296)
-			# UNKNOWNFLOAT10 at 0x12C (300)
-			# sway (X axis accel) at 0x130 (304)
-			# heave (Y axis accel) at 0x134 (308)
-			# surge (Z axis accel) at 0x138 (312)
-			accelSway = struct.unpack('f', ddata[0x130:0x130+4])[0]
-			accelHeave = struct.unpack('f', ddata[0x134:0x134+4])[0]
-			accelSurge = struct.unpack('f', ddata[0x138:0x138+4])[0]
-			
-			printAt('{:9.4f}'.format(accelSway), 21, 67)														# accel Sway (lateral X)
-			printAt(accelBarChart(accelSway, 'sway'), 21, 77)													# accel Sway bar chart
-			printAt('{:9.4f}'.format(accelHeave), 22, 67)														# accel Heave (vertical Y)
-			printAt(accelBarChart(accelHeave, 'heave'), 22, 77)													# accel Heave bar chart
-			printAt('{:9.4f}'.format(accelSurge), 23, 67)														# accel Surge (longitudinal Z)
-			printAt(accelBarChart(accelSurge, 'surge'), 23, 77)													# accel Surge bar chart
-
-			printAt('{:7.4f}'.format(struct.unpack('f', ddata[0x28:0x28+4])[0]), 30, 25)					# rot ???
-
-		if pknt > 100:
-			send_hb(s)
-			pknt = 0
-	except Exception as e:
-		printAt('Exception: {}'.format(e), 41, 1, reverse=1)
-		send_hb(s)
-		pknt = 0
-		pass
+		dropped = frames.dropped
+		latest = packet
+
+# lap timing on the packet clock, needs every packet
+laps = gt7laps.LapTracker()
+
+# optional per-lap store, and the live delta to the reference lap from it
+lap_recorder = None
+live_delta = None
+if args.store:
+	lap_store = gt7lapstore.LapStore(args.store)
+	lap_recorder = gt7lapstore.LapRecorder(lap_store, laps, gt7trackdetect.TrackDetector())
+	references = gt7delta.ReferenceCache(lap_store)
+	if args.reference is not None:
+		references.select(args.reference)
+	live_delta = gt7delta.LiveDelta(references, lap_recorder)
+
+async def track_laps(frames):
+	async for packet in frames:
+		events = laps.update(packet.frame)
+		if lap_recorder:
+			stored = lap_recorder.update(packet.frame, events)
+			live_delta.update(packet.frame, events, stored)
+
+# format the newest packet into the screen model
+def draw(packet):
+	frame = packet.frame
+
+	printAt('{:6.2f}'.format(framerate), 3, 82)										# rx rate
+	printAt('{:4d}'.format(len(packet.data)), 2, 82)								# packet length
+	printAt('{:>10}'.format(dropped), 4, 83)										# skipped by the display
+
+	# link quality over the last few seconds, to tell network trouble from a slow display
+	linkq = core.link.summary()
+	printAt('{:6.2f}'.format(linkq['loss_pct']), 5, 82)							# lost packets
+	printAt('{:6.2f}'.format(linkq['late_pct']), 6, 82)							# out of order packets
+	printAt('{:6d}'.format(linkq['duplicates']), 7, 82)							# duplicate packets
+	printAt('{:6.2f}'.format(linkq['jitter_ms']), 8, 82)							# interarrival jitter
+
+	# Extract and display packet ID immediately, even if out of order
+	printAt('{:>10}'.format(frame.packet_id), 1, 83)						# packet id
+	pktid = frame.packet_id
+
+	bstlap = frame.best_lap_ms
+	lstlap = frame.last_lap_ms
+	curlap = frame.current_lap
+	if curlap > 0:
+		curLapTime = laps.lap_ms() / 1000
+		printAt('{:>9}'.format(secondsToLaptime(curLapTime)), 7, 49)
+	else:
+		curLapTime = 0
+		printAt('{:>9}'.format(''), 7, 49)
 
-	sys.stdout.flush()
+	delta = live_delta.delta if live_delta else None
+	if delta is not None:
+		printAt('{:>+9.3f}'.format(delta), 8, 49)													# delta to reference lap
+	else:
+		printAt('{:>9}'.format(''), 8, 49)
+
+	cgear = frame.current_gear
+	sgear = frame.suggested_gear
+	if cgear < 1:
+		cgear = 'R'
+	if sgear > 14:
+		sgear = '–'
+
+	fuelCapacity = frame.fuel_capacity
+	isEV = False if fuelCapacity > 0 else True
+	if isEV:
+		printAt('Charge:', 14, 1)
+		printAt('{:3.0f} kWh'.format(frame.fuel_level), 14, 11)		# charge remaining
+		printAt('??? kWh'.format(fuelCapacity), 14, 29)				# max battery capacity
+	else:
+		printAt('Fuel:  ', 14, 1)
+		printAt('{:3.0f} lit'.format(frame.fuel_level), 14, 11)		# fuel
+		printAt('{:3.0f} lit'.format(fuelCapacity), 14, 29)			# max fuel
+
+	boost = frame.boost - 1
+	hasTurbo = True if boost > -1 else False
+
+
+	tyreDiamFL = frame.tyre_diam_fl
+	tyreDiamFR = frame.tyre_diam_fr
+	tyreDiamRL = frame.tyre_diam_rl
+	tyreDiamRR = frame.tyre_diam_rr
+
+	tyreSpeedFL = abs(2.23694 * tyreDiamFL * frame.wheel_rps_fl)
+	tyreSpeedFR = abs(2.23694 * tyreDiamFR * frame.wheel_rps_fr)
+	tyreSpeedRL = abs(2.23694 * tyreDiamRL * frame.wheel_rps_rl)
+	tyreSpeedRR = abs(2.23694 * tyreDiamRR * frame.wheel_rps_rr)
+
+	carSpeed = 2.23694 * frame.speed  # Convert m/s to mph
+
+	if carSpeed > 0:
+		tyreSlipRatioFL = '{:6.2f}'.format(tyreSpeedFL / carSpeed)
+		tyreSlipRatioFR = '{:6.2f}'.format(tyreSpeedFR / carSpeed)
+		tyreSlipRatioRL = '{:6.2f}'.format(tyreSpeedRL / carSpeed)
+		tyreSlipRatioRR = '{:6.2f}'.format(tyreSpeedRR / carSpeed)
+	else:
+		tyreSlipRatioFL = '  –  '
+		tyreSlipRatioFR = '  –  '
+		tyreSlipRatioRL = '  -  '
+		tyreSlipRatioRR = '  –  '
+
+	printAt('{:>8}'.format(str(td(seconds=round(frame.time_of_day_ms / 1000)))), 3, 56, reverse=1, bold=1)	# time of day on track
+
+	printAt('{:3.0f}'.format(curlap), 5, 7)															# current lap
+	printAt('{:3.0f}'.format(frame.total_laps), 5, 11)												# total laps
+
+	printAt('{:2.0f}'.format(frame.current_position), 5, 31)										# current position
+	printAt('{:2.0f}'.format(frame.total_positions), 5, 34)											# total positions
+
+	if bstlap != -1:
+		printAt('{:>9}'.format(secondsToLaptime(bstlap / 1000)), 7, 16)		# best lap time
+	else:
+		printAt('{:>9}'.format(''), 7, 16)
+	if lstlap != -1:
+		printAt('{:>9}'.format(secondsToLaptime(lstlap / 1000)), 8, 16)		# last lap time
+	else:
+		printAt('{:>9}'.format(''), 8, 16)
+
+	printAt('{:5.0f}'.format(frame.car_id), 10, 48, reverse=1, bold=1)										# car id
+
+	throttle = frame.throttle
+	brake = frame.brake
+
+	printAt('{:3.0f}'.format(throttle), 12, 11)														# throttle
+	printAt(percentBarChart(throttle, 10), 12, 61)													# throttle bar chart
+	printAt('{:7.0f}'.format(frame.rpm), 12, 25)													# rpm
+	printAt('{:7.1f}'.format(carSpeed), 12, 47)														# speed kph
+	printAt('{:5.0f}'.format(frame.rev_warning_rpm), 12, 83)										# rpm rev warning
+
+	printAt('{:3.0f}'.format(brake), 13, 11)														# brake
+	printAt(percentBarChart(brake, 10), 13, 61)														# brake bar chart
+	printAt('{}'.format(cgear), 13, 27)																# actual gear
+	printAt('{}'.format(sgear), 13, 30)																# suggested gear
+
+	if hasTurbo:
+		printAt('{:7.2f}'.format(boost), 13, 47)													# boost
+	else:
+		printAt('{:>7}'.format('–'), 13, 47)														# no turbo
+
+	printAt('{:5.0f}'.format(frame.rev_limiter_rpm), 13, 83)										# rpm rev limiter
+
+	printAt('{:5.0f}'.format(frame.est_top_speed), 14, 83)											# estimated top speed
+
+	printAt('{:5.3f}'.format(frame.clutch), 15, 9)													# clutch
+	printAt('{:5.3f}'.format(frame.clutch_engaged), 15, 17)											# clutch engaged
+	printAt('{:7.0f}'.format(frame.rpm_after_clutch), 15, 48)										# rpm after clutch
+
+	printAt('{:6.1f}'.format(frame.oil_temp), 17, 17)												# oil temp
+	printAt('{:6.1f}'.format(frame.water_temp), 17, 49)												# water temp
+
+	printAt('{:6.2f}'.format(frame.oil_pressure), 18, 17)											# oil pressure
+	printAt('{:6.0f}'.format(1000 * frame.ride_height), 18, 49)										# ride height
+
+	printAt('{:7.3f}'.format(frame.gear_ratio_1), 21, 5)											# 1st gear
+	printAt('{:7.3f}'.format(frame.gear_ratio_2), 22, 5)											# 2nd gear
+	printAt('{:7.3f}'.format(frame.gear_ratio_3), 23, 5)											# 3rd gear
+	printAt('{:7.3f}'.format(frame.gear_ratio_4), 24, 5)											# 4th gear
+	printAt('{:7.3f}'.format(frame.gear_ratio_5), 25, 5)											# 5th gear
+	printAt('{:7.3f}'.format(frame.gear_ratio_6), 26, 5)											# 6th gear
+	printAt('{:7.3f}'.format(frame.gear_ratio_7), 27, 5)											# 7th gear
+	printAt('{:7.3f}'.format(frame.gear_ratio_8), 28, 5)											# 8th gear
+
+	printAt('{:7.3f}'.format(frame.gear_unknown), 30, 5)											# ??? gear
+
+	printAt('{:11.4f}'.format(frame.position_x), 21, 23)											# pos X
+	printAt('{:11.4f}'.format(frame.position_y), 22, 23)											# pos Y
+	printAt('{:11.4f}'.format(frame.position_z), 23, 23)											# pos Z
+
+	printAt('{:11.4f}'.format(frame.velocity_x), 21, 43)											# velocity X
+	printAt('{:11.4f}'.format(frame.velocity_y), 22, 43)											# velocity Y
+	printAt('{:11.4f}'.format(frame.velocity_z), 23, 43)											# velocity Z
+
+	printAt('{:9.4f}'.format(frame.rotation_pitch), 26, 23)											# rot Pitch
+	printAt('{:9.4f}'.format(frame.rotation_yaw), 27, 23)											# rot Yaw
+	printAt('{:9.4f}'.format(frame.rotation_roll), 28, 23)											# rot Roll
+
+	printAt('{:9.4f}'.format(frame.angular_vel_x), 26, 43)											# angular velocity X
+	printAt('{:9.4f}'.format(frame.angular_vel_y), 27, 43)											# angular velocity Y
+	printAt('{:9.4f}'.format(frame.angular_vel_z), 28, 43)											# angular velocity Z
+
+	# Packet B fields (316 bytes) - acceleration data at end of packet
+	accelSway = frame.accel_sway
+	accelHeave = frame.accel_heave
+	accelSurge = frame.accel_surge
+
+	printAt('{:9.4f}'.format(accelSway), 21, 67)														# accel Sway (lateral X)
+	printAt(accelBarChart(accelSway, 'sway'), 21, 77)													# accel Sway bar chart
+	printAt('{:9.4f}'.format(accelHeave), 22, 67)														# accel Heave (vertical Y)
+	printAt(accelBarChart(accelHeave, 'heave'), 22, 77)													# accel Heave bar chart
+	printAt('{:9.4f}'.format(accelSurge), 23, 67)														# accel Surge (longitudinal Z)
+	printAt(accelBarChart(accelSurge, 'surge'), 23, 77)													# accel Surge bar chart
+
+	printAt('{:7.4f}'.format(frame.orientation_north), 30, 25)										# rot ???
+
+# draw and flush the newest packet at a fixed frame rate, independent of packet reception
+async def render(fps):
+	interval = 1.0 / fps
+	drawn = None
+	next_frame = time.monotonic()
+	if metrics:
+		draw_stage = metrics.stage('draw')
+		write_stage = metrics.stage('write')
+		next_summary = next_frame
+	while True:
+		packet = latest
+		t0 = time.monotonic_ns()
+		if packet is not None and packet is not drawn:
+			try:
+				draw(packet)
+			except Exception as e:
+				printAt('Exception: {}'.format(e), 41, 1, reverse=1)
+			drawn = packet
+		t1 = time.monotonic_ns()
+		screen.render()
+
+		if metrics:
+			draw_stage.observe(t1 - t0)
+			write_stage.observe(time.monotonic_ns() - t1)
+			if time.monotonic() >= next_summary:
+				printAt('{:<92.92}'.format(metrics.summary()), 42, 1)
+				next_summary += args.metrics
+
+		next_frame += interval
+		delay = next_frame - time.monotonic()
+		if delay < 0:
+			next_frame = time.monotonic()
+			delay = 0
+		await asyncio.sleep(delay)
+
+# append every raw datagram to the capture file
+async def record(raw):
+	async for packet in raw:
+		recorder.write(packet.data, packet.t_ns)
+
+async def main():
+	consumers = [receive(core.subscribe_latest()), track_laps(core.subscribe(maxsize=1024)), render(args.fps)]
+	if recorder:
+		# unbounded, a capture keeps every datagram
+		consumers.append(record(core.subscribe_raw(maxsize=0)))
+	await asyncio.gather(core.run(), *consumers)
+
+asyncio.run(main())
@@ -1,7 +1,10 @@
+import os
 import time
-import sys
 import csv
-from gt_telem.turismo_client import TurismoClient
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 
 # ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
 
@@ -29,6 +32,9 @@ class TrackBounds:
 		return '\n'.join(prop_strings)
 
 
+# start/finish lines and bounding boxes of the known tracks, next to this file
+TRACK_BOUNDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gt7trackdetect.csv')
+
 def load_track_bounds(filename):
 	# Open the CSV file
 	with open(filename, 'r') as f:
@@ -74,9 +80,22 @@ def line_intersects(p0_x, p0_y, p1_x, p1_y, p2_x, p2_y, p3_x, p3_y):
 	s2_x = p3_x - p2_x
 	s2_y = p3_y - p2_y
 
-	s = (-s1_y * (p0_x - p2_x) + s1_x * (p0_y - p2_y)) / (-s2_x * s1_y + s1_x * s2_y)
-	t = (s2_x * (p0_y - p2_y) - s2_y * (p0_x - p2_x)) / (-s2_x * s1_y + s1_x * s2_y)
+	d = crossing_direction(s2_x, s2_y)
+
+	denominator = -s2_x * s1_y + s1_x * s2_y
+	if denominator == 0:
+		# Parallel or degenerate segments never cross
+		return (0, d)
+
+	s = (-s1_y * (p0_x - p2_x) + s1_x * (p0_y - p2_y)) / denominator
+	t = (s2_x * (p0_y - p2_y) - s2_y * (p0_x - p2_x)) / denominator
+
+	if s >= 0 and s <= 1 and t >= 0 and t <= 1:
+		# Collision detected
+		return (1, d)
+	return (0, d) # No collision
 
+def crossing_direction(s2_x, s2_y):
 	d = '--'
 	if s2_x > 0:
 		# Second set of coordinates has a positive x direction
@@ -93,11 +112,7 @@ def line_intersects(p0_x, p0_y, p1_x, p1_y, p2_x, p2_y, p3_x, p3_y):
 	else:
 		# Second set of coordinates has no discernible direction
 		d = '??'
-
-	if s >= 0 and s <= 1 and t >= 0 and t <= 1:
-		# Collision detected
-		return (1, d)
-	return (0, d) # No collision
+	return d
 
 # ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
 
@@ -129,6 +144,10 @@ def calculate_iou(outer_bounding_box, inner_bounding_box):
 	return iou
 
 def find_matching_track(L1X, L1Y, L2X, L2Y, MinX, MinY, MaxX, MaxY, track_bounds, max_matches=3, min_iou=0.02):
+	# A TrackTable answers from its start line index in one vectorized pass
+	if isinstance(track_bounds, TrackTable):
+		return track_bounds.find_matching_track(L1X, L1Y, L2X, L2Y, MinX, MinY, MaxX, MaxY, max_matches, min_iou)
+
 	# Calculate the outer bounding box for the line defined by L1X, L1Y, L2X and L2Y
 	outer_bounding_box = get_bounding_box(MinX, MinY, MaxX, MaxY)
 
@@ -174,22 +193,323 @@ def find_matching_track(L1X, L1Y, L2X, L2Y, MinX, MinY, MaxX, MaxY, track_bounds
 
 # ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
 
+class TrackTable:
+	"""Track bounds as column arrays, with a uniform grid over the start lines
+
+	A crossing only tests the start lines in the grid cells it touches, and does the
+	intersection and IoU maths for all of them at once. Results are the same as the
+	row by row loop in find_matching_track.
+	"""
+
+	def __init__(self, track_bounds=(), cell_size=64.0):
+		self.cell_size = cell_size
+		self.rows = []
+		self.extend(track_bounds)
+
+	def __len__(self):
+		return len(self.rows)
+
+	def extend(self, track_bounds):
+		"""Add layouts, e.g. user-added ones from another CSV, and rebuild the index"""
+		self.rows.extend(track_bounds)
+		rows = self.rows
+		column = lambda key: np.array([getattr(row, key) for row in rows], dtype=np.float64)
+		self.track = np.array([row.TRACK for row in rows], dtype=np.int64)
+		self.direction = np.array([row.DIRECTION for row in rows], dtype=object)
+		self.p1x, self.p1y, self.p2x, self.p2y = (column(key) for key in ('P1X', 'P1Y', 'P2X', 'P2Y'))
+		# bounding boxes normalised like get_bounding_box does
+		minx, miny, maxx, maxy = (column(key) for key in ('MINX', 'MINY', 'MAXX', 'MAXY'))
+		self.box = np.stack((np.minimum(minx, maxx), np.minimum(miny, maxy), np.maximum(minx, maxx), np.maximum(miny, maxy)))
+
+		grid = {}
+		c0, r0 = self._cells(np.minimum(self.p1x, self.p2x), np.minimum(self.p1y, self.p2y))
+		c1, r1 = self._cells(np.maximum(self.p1x, self.p2x), np.maximum(self.p1y, self.p2y))
+		for index in range(len(rows)):
+			for c in range(c0[index], c1[index] + 1):
+				for r in range(r0[index], r1[index] + 1):
+					grid.setdefault((c, r), []).append(index)
+		self.grid = {cell: np.array(indices, dtype=np.intp) for cell, indices in grid.items()}
+
+	def _cells(self, x, y):
+		return np.floor_divide(x, self.cell_size).astype(np.int64), np.floor_divide(y, self.cell_size).astype(np.int64)
+
+	def candidates(self, L1X, L1Y, L2X, L2Y):
+		"""Row indices, in table order, of start lines in the cells the crossing touches"""
+		size = self.cell_size
+		c0, c1 = int(min(L1X, L2X) // size), int(max(L1X, L2X) // size)
+		r0, r1 = int(min(L1Y, L2Y) // size), int(max(L1Y, L2Y) // size)
+		found = [self.grid[(c, r)] for c in range(c0, c1 + 1) for r in range(r0, r1 + 1) if (c, r) in self.grid]
+		if not found:
+			return np.empty(0, dtype=np.intp)
+		return np.unique(np.concatenate(found))
+
+	def find_matching_track(self, L1X, L1Y, L2X, L2Y, MinX, MinY, MaxX, MaxY, max_matches=3, min_iou=0.02):
+		index = self.candidates(L1X, L1Y, L2X, L2Y)
+		# The direction only depends on the crossing itself
+		s2_x = L2X - L1X
+		s2_y = L2Y - L1Y
+		index = index[self.direction[index] == crossing_direction(s2_x, s2_y)]
+		if len(index) == 0:
+			return None
+
+		# line_intersects for every candidate, parallel lines never cross
+		p0_x = self.p1x[index]
+		p0_y = self.p1y[index]
+		s1_x = self.p2x[index] - p0_x
+		s1_y = self.p2y[index] - p0_y
+		denominator = -s2_x * s1_y + s1_x * s2_y
+		with np.errstate(divide='ignore', invalid='ignore'):
+			s = (-s1_y * (p0_x - L1X) + s1_x * (p0_y - L1Y)) / denominator
+			t = (s2_x * (p0_y - L1Y) - s2_y * (p0_x - L1X)) / denominator
+		crossed = (denominator != 0) & (s >= 0) & (s <= 1) & (t >= 0) & (t <= 1)
+		index = index[crossed]
+		if len(index) == 0:
+			return None
+
+		# calculate_iou for every crossed start line
+		outer = get_bounding_box(MinX, MinY, MaxX, MaxY)
+		inner = self.box[:, index]
+		left = np.maximum(outer[0], inner[0])
+		top = np.maximum(outer[1], inner[1])
+		right = np.minimum(outer[2], inner[2])
+		bottom = np.minimum(outer[3], inner[3])
+		intersection = (right - left) * (bottom - top)
+		union = get_bounding_box_area(outer) + (inner[2] - inner[0]) * (inner[3] - inner[1]) - intersection
+		with np.errstate(divide='ignore', invalid='ignore'):
+			iou = np.where((left > right) | (top > bottom), 0.0, intersection / union)
+
+		# Highest IoU first, ties in table order, within min_iou of the best
+		order = np.argsort(-iou, kind='stable')
+		iou = iou[order]
+		tracks = self.track[index[order]]
+		keep = iou >= iou[0] * (1 - min_iou)
+		return [(float(i), int(track)) for i, track in zip(iou[keep][:max_matches], tracks[keep][:max_matches])]
+
+def load_track_table(*filenames):
+	"""TrackTable of the layouts in one or more track bounds CSV files"""
+	table = TrackTable()
+	for filename in filenames:
+		table.extend(load_track_bounds(filename))
+	return table
 
-if __name__ == "__main__":
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+class TrackDetector:
+	"""Finds the track from the area driven and the start line crossed on the first full lap"""
+
+	def __init__(self, track_bounds=None, min_confidence=0.96):
+		self.track_bounds = track_bounds if track_bounds is not None else load_track_table(TRACK_BOUNDS_FILE)
+		self.min_confidence = min_confidence
+		self.reset()
+
+	def reset(self):
+		self.prev_lap = 1
+		self.max_x = -999999.9
+		self.max_y = -999999.9
+		self.min_x = 999999.9
+		self.min_y = 999999.9
+		self.prev_position = None
+		self.track = None		# track ID once matched with enough confidence
+		self.confidence = 0.0
+
+	def update(self, lap, x, z):
+		"""Feed one position, returns the matches when a lap change was checked, else None"""
+		matches = None
+		if self.track is None:
+			self.max_x = max(self.max_x, x)
+			self.min_x = min(self.min_x, x)
+			self.max_y = max(self.max_y, z)
+			self.min_y = min(self.min_y, z)
+
+			if lap > self.prev_lap:
+				self.prev_lap = lap
+				if self.prev_position is not None:
+					old_x, old_z = self.prev_position
+					matches = find_matching_track(old_x, old_z, x, z, self.min_x, self.min_y, self.max_x, self.max_y, self.track_bounds)
+					if matches and len(matches) == 1:
+						self.confidence = matches[0][0]
+						if round(self.confidence * 100, 1) > self.min_confidence * 100:
+							self.track = matches[0][1]
+
+			self.prev_position = (x, z)
+
+		# back on an earlier lap, e.g. a restart, so possibly a different track
+		if lap < self.prev_lap:
+			self.reset()
+		return matches
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
 
-	# Load the track bounds from the CSV file
-	track_bounds = load_track_bounds('gt7trackdetect.csv')
 
-	prevLap = 1
-	maxX = -999999.9
-	maxY = -999999.9
-	minX = 999999.9
-	minY = 999999.9
-	gotTrack = -1
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Offline classification of recorded sessions (gt7capture files).
+#
+# Each capture is replayed through a TrackDetector with the same filtering as the live
+# loop below. Only the fields the detector needs are decrypted, records the capture index
+# puts before lap 1 are skipped without decrypting them, and a capture stops being read
+# as soon as its track is known. Captures are spread over a process pool:
+#
+#   python3 gt7trackdetect.py --batch captures/ --output sessions.csv
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+# track: matched with enough confidence, else None; confidence: of the last single match;
+# checks: start line crossings tested; matches: (iou, track) list of the last crossing
+SessionTrack = namedtuple('SessionTrack', 'session track confidence checks matches')
+
+DETECT_FIELDS = ('position_x', 'position_z', 'current_lap', 'flags')
+
+def classify_capture(filename, detector=None):
+	"""Replay one capture through a TrackDetector, returns a SessionTrack"""
+	import gt7capture
+	import gt7packet
+
+	if detector is None:
+		detector = TrackDetector()
+	detector.reset()
+	decrypt = gt7packet.PacketDecryptor(fields=DETECT_FIELDS).decrypt
+	read_field = gt7packet.read_field
+	confidence = 0.0
+	checks = 0
+	matches = None
+	with gt7capture.CaptureReader(filename) as capture:
+		laps = capture.laps
+		for i in range(len(capture)):
+			if laps[i] < 1:
+				continue
+			ddata = decrypt(capture[i][1])
+			if not ddata:
+				continue
+			flags = read_field(ddata, 'flags')
+			if flags & (gt7packet.FLAG_PAUSED | gt7packet.FLAG_LOADING) or not flags & gt7packet.FLAG_CAR_ON_TRACK:
+				continue
+			lap = read_field(ddata, 'current_lap')
+			found = detector.update(lap, read_field(ddata, 'position_x'), read_field(ddata, 'position_z'))
+			if found is not None:
+				checks += 1
+				matches = found
+				if len(found) == 1:
+					confidence = found[0][0]
+			if detector.track is not None:
+				break
+	return SessionTrack(os.path.basename(filename), detector.track, confidence, checks, matches or [])
+
+_batch_detector = None
+
+def _batch_init(bounds_files):
+	# one track table per worker process, shared by all the captures it classifies
+	global _batch_detector
+	_batch_detector = TrackDetector(load_track_table(*bounds_files))
+
+def _batch_classify(filename):
+	return classify_capture(filename, _batch_detector)
+
+def classify_captures(filenames, bounds_files=(TRACK_BOUNDS_FILE,), workers=None):
+	"""Classify captures in a process pool, yields (filename, SessionTrack or exception) as they finish"""
+	with ProcessPoolExecutor(max_workers=workers, initializer=_batch_init, initargs=(tuple(bounds_files),)) as executor:
+		futures = {executor.submit(_batch_classify, filename): filename for filename in filenames}
+		for future in as_completed(futures):
+			try:
+				yield futures[future], future.result()
+			except Exception as e:
+				yield futures[future], e
+
+def find_captures(directory):
+	"""Capture files in a directory, sorted by name"""
+	return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith('.gt7cap')]
+
+def run_batch(directory, output, bounds_files=(TRACK_BOUNDS_FILE,), workers=None):
+	filenames = find_captures(directory)
+	if not filenames:
+		print(f'No .gt7cap files in {directory}')
+		return 1
+	start = time.time()
+	results = {}
+	for done, (filename, result) in enumerate(classify_captures(filenames, bounds_files, workers), 1):
+		if isinstance(result, Exception):
+			print(f'[{done}/{len(filenames)}] {filename}: {result}')
+		elif result.track is not None:
+			print(f'[{done}/{len(filenames)}] {result.session}: track {result.track} ({round(result.confidence * 100, 1)}%)')
+		else:
+			print(f'[{done}/{len(filenames)}] {result.session}: no match after {result.checks} laps')
+		results[filename] = result
+
+	with open(output, 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(['SESSION', 'TRACK', 'CONFIDENCE', 'CHECKS', 'MATCHES', 'ERROR'])
+		for filename in filenames:
+			result = results[filename]
+			if isinstance(result, Exception):
+				writer.writerow([os.path.basename(filename), '', '', '', '', str(result)])
+				continue
+			matches = ' '.join(f'{track}:{iou:.3f}' for iou, track in result.matches)
+			track = result.track if result.track is not None else ''
+			writer.writerow([result.session, track, f'{result.confidence:.3f}', result.checks, matches, ''])
+	found = sum(1 for result in results.values() if not isinstance(result, Exception) and result.track is not None)
+	print(f'{found}/{len(filenames)} sessions classified in {time.time() - start:.1f} s, written to {output}')
+	return 0
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='GT7 track detection, live or from recorded sessions')
+	parser.add_argument('ip', nargs='?', help='PlayStation IP address for live detection')
+	parser.add_argument('--relay', nargs='?', const='127.0.0.1', metavar='HOST', help='read live frames from a gt7relay.py instead (default host: 127.0.0.1)')
+	parser.add_argument('--batch', metavar='DIR', help='classify every .gt7cap capture in a directory instead')
+	parser.add_argument('--output', default='sessions.csv', help='session to track CSV written by --batch (default: sessions.csv)')
+	parser.add_argument('--workers', type=int, default=None, help='worker processes for --batch (default: one per CPU)')
+	parser.add_argument('--bounds', nargs='+', default=[TRACK_BOUNDS_FILE], metavar='CSV', help='track bounds files')
+	args = parser.parse_args()
+
+	if args.batch:
+		exit(run_batch(args.batch, args.output, args.bounds, args.workers))
+	if not args.ip and not args.relay:
+		parser.error('an IP address, --relay or --batch DIR is required')
+
+	detector = TrackDetector(load_track_table(*args.bounds))
+
+	def follow(current_lap, x, z):
+		if current_lap < detector.prev_lap:
+			print("Resetting track capture")
+			detector.reset()
+
+		matches = detector.update(current_lap, x, z)
+		if matches:
+			if len(matches) == 1:
+				match = matches[0]
+				probability, track_id = match[0], match[1]
+				probability_percentage = round(probability * 100, 1)
+				if detector.track is not None:
+					print(f"Got a +96% match: {track_id} ({probability_percentage}%)")
+				else:
+					print(f"Got a possible match: {track_id} ({probability_percentage}%)")
+			else:
+				print(f"Got {len(matches)} track matches")
+
+	if args.relay:
+		import gt7packet
+		import gt7relay
+
+		# only the four channels detection needs, decrypted once by the relay
+		client = gt7relay.RelayClient(DETECT_FIELDS, host=args.relay)
+		try:
+			for frame in client:
+				flags = frame.flags
+				if flags & (gt7packet.FLAG_PAUSED | gt7packet.FLAG_LOADING) or frame.current_lap < 1:
+					continue
+				if flags & gt7packet.FLAG_CAR_ON_TRACK:
+					follow(frame.current_lap, frame.position_x, frame.position_z)
+		except KeyboardInterrupt:
+			pass
+		finally:
+			client.close()
+		exit(0)
+
+	from gt_telem.turismo_client import TurismoClient
 
 	try:
 
-		ip_address = sys.argv[1]
+		ip_address = args.ip
 
 		client = TurismoClient(ps_ip=ip_address)
 		client.start()
@@ -200,43 +520,8 @@ if __name__ == "__main__":
 				time.sleep(1)
 				continue
 			try:
-				if telemetry.cars_on_track and gotTrack == -1:
-					newXYZ = [telemetry.position.x, telemetry.position.z]
-					if telemetry.position.x > maxX:
-						maxX = telemetry.position.x
-					if telemetry.position.x < minX:
-						minX = telemetry.position.x
-					if telemetry.position.z > maxY:
-						maxY = telemetry.position.z
-					if telemetry.position.z < minY:
-						minY = telemetry.position.z
-
-					if telemetry.current_lap > prevLap:
-						prevLap = telemetry.current_lap
-						matches = find_matching_track(oldXYZ[0], oldXYZ[1], newXYZ[0], newXYZ[1], minX, minY, maxX, maxY, track_bounds)
-						if matches:
-							if len(matches) == 1:
-								match = matches[0]
-								probability, track_id = match[0], match[1]
-								probability_percentage = round(probability * 100, 1)
-								if probability_percentage > 96:
-									gotTrack = track_id
-									print(f"Got a +96% match: {track_id} ({probability_percentage}%)")
-								else:
-									print(f"Got a possible match: {track_id} ({probability_percentage}%)")
-							else:
-								print(f"Got {len(matches)} track matches")
-
-					oldXYZ = newXYZ
-
-				if telemetry.current_lap < prevLap:
-					print("Resetting track capture")
-					prevLap = 1
-					maxX = -999999.9
-					maxY = -999999.9
-					minX = 999999.9
-					minY = 999999.9
-					gotTrack = -1
+				if telemetry.cars_on_track:
+					follow(telemetry.current_lap, telemetry.position.x, telemetry.position.z)
 
 			# Check for Ctrl-C
 			except KeyboardInterrupt:
@@ -0,0 +1,155 @@
+import math
+from collections import deque
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Bounded position trail with levels of detail.
+#
+# The most recent points are kept as they came. Once the recent window has grown by a
+# chunk, its oldest chunk is handed to each level's simplifier and dropped. A level keeps
+# a point only where the path bends away from a straight line by more than its tolerance
+# (an opening window simplifier, so corners keep their points and straights collapse to a
+# few). Each level has a hard point budget: when it is exceeded, the level's tolerance is
+# doubled and its points simplified again. A view of the trail at level n is that level's
+# points followed by the recent window in full:
+#
+#   trail = Trail()
+#   trail.append(x, z)
+#   older, first_seq, recent = trail.view(trail.level_for(metres_per_pixel))
+#
+# Every point gets a sequence number, so clients can follow the recent window with
+# deltas. The epoch changes whenever points before the recent window change (a chunk
+# moved into the levels, or the trail was cleared) and a client has to start over.
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+WINDOW = 1200		# recent points kept in full, 5 minutes at 4 points per second
+CHUNK = 240			# recent points moved into the levels at a time
+
+# (tolerance in m, point budget) per level, finest first
+LEVELS = ((0.5, 8000), (2.0, 3000), (8.0, 1000))
+
+# points an opening window may span before one is kept regardless
+MAX_SPAN = 64
+
+def _offset(px, py, ax, ay, bx, by):
+	"""Distance from p to the line through a and b (to a when they coincide)"""
+	dx = bx - ax
+	dy = by - ay
+	length = math.hypot(dx, dy)
+	if length == 0:
+		return math.hypot(px - ax, py - ay)
+	return abs((px - ax) * dy - (py - ay) * dx) / length
+
+class TrailLevel:
+	"""Online opening window simplification of a path, within a point budget"""
+
+	def __init__(self, tolerance, budget):
+		self.tolerance = tolerance
+		self.budget = budget
+		self.points = []	# kept points, the last one is the current anchor
+		self.window = []	# points since the anchor, not decided yet
+
+	def __len__(self):
+		return len(self.points) + len(self.window)
+
+	def add(self, point):
+		self._push(point)
+		if len(self.points) > self.budget:
+			self._thin()
+
+	def _push(self, point):
+		points = self.points
+		if not points:
+			points.append(point)
+			return
+		window = self.window
+		if window:
+			ax, ay = points[-1]
+			bx, by = point
+			tolerance = self.tolerance
+			if len(window) >= MAX_SPAN or any(_offset(x, y, ax, ay, bx, by) > tolerance for x, y in window):
+				# the line from the anchor to this point misses a point in between, keep the last one
+				points.append(window[-1])
+				window.clear()
+		window.append(point)
+
+	def _thin(self):
+		pending = self.window
+		while len(self.points) > self.budget:
+			self.tolerance *= 2
+			points = self.points
+			self.points = []
+			self.window = []
+			for point in points:
+				self._push(point)
+			if self.window:
+				self.points.append(self.window[-1])
+			if len(self.points) >= len(points):
+				# nothing left to merge at any tolerance, drop every other point
+				self.points = points[::2] + ([points[-1]] if len(points) % 2 == 0 else [])
+		self.window = pending
+
+	def view(self):
+		"""Kept points up to the newest point added"""
+		if self.window:
+			return self.points + self.window[-1:]
+		return list(self.points)
+
+class Trail:
+	"""Position trail with a full resolution recent window and coarser older levels"""
+
+	def __init__(self, window=WINDOW, chunk=CHUNK, levels=LEVELS):
+		self.window = window
+		self.chunk = chunk
+		self.level_specs = levels
+		self.recent = deque()
+		self.seq = 0		# sequence number of the next point appended
+		self.epoch = 0
+		self.clear()
+
+	def clear(self):
+		self.recent.clear()
+		self.levels = [TrailLevel(tolerance, budget) for tolerance, budget in self.level_specs]
+		self.epoch += 1
+
+	def __len__(self):
+		return len(self.recent)
+
+	@property
+	def first_seq(self):
+		"""Sequence number of the oldest point in the recent window"""
+		return self.seq - len(self.recent)
+
+	def append(self, x, y):
+		recent = self.recent
+		recent.append([x, y])
+		self.seq += 1
+		if len(recent) >= self.window + self.chunk:
+			for _ in range(self.chunk):
+				point = recent.popleft()
+				for level in self.levels:
+					level.add(point)
+			self.epoch += 1
+
+	def since(self, seq):
+		"""Recent points from sequence number seq on, None if they left the recent window"""
+		first = self.first_seq
+		if seq < first or seq > self.seq:
+			return None
+		recent = self.recent
+		return [recent[i] for i in range(seq - first, len(recent))]
+
+	def view(self, level=0):
+		"""(older points at this level, sequence number of the first recent point, recent points)"""
+		return self.levels[level].view(), self.first_seq, list(self.recent)
+
+	def level_for(self, metres_per_pixel, pixels=2.0):
+		"""Coarsest level whose error stays under a few pixels at this scale"""
+		chosen = 0
+		for index, level in enumerate(self.levels):
+			if level.tolerance <= metres_per_pixel * pixels:
+				chosen = index
+		return chosen
+
+	def point_count(self):
+		"""Points held in total, recent window and every level"""
+		return len(self.recent) + sum(len(level) for level in self.levels)
@@ -0,0 +1,54 @@
+import struct
+
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+# Compact fixed-layout binary records for sending telemetry to browsers and other consumers.
+#
+# A WireFormat is a list of (key, struct code[, converter]) fields packed little-endian
+# without padding. The receiving side gets the layout once as a schema message
+# ({'size': n, 'fields': [[key, code, offset], ...]}) and decodes records with it, in the
+# browser with a DataView.
+# ––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––––
+
+# struct codes a schema may use, these map directly onto DataView getters
+CODES = ('b', 'B', 'h', 'H', 'i', 'I', 'f')
+
+class WireFormat:
+	"""Packs dicts (or sequences) into fixed-layout little-endian records"""
+
+	def __init__(self, fields):
+		self.keys = []
+		self.converters = []
+		codes = ''
+		for field in fields:
+			key, code = field[0], field[1]
+			if code not in CODES:
+				raise ValueError(f'unsupported wire type {code!r} for {key}')
+			self.keys.append(key)
+			self.converters.append(field[2] if len(field) > 2 else None)
+			codes += code
+		self.struct = struct.Struct('<' + codes)
+		self.size = self.struct.size
+
+		offsets = []
+		offset = 0
+		for key, code in zip(self.keys, codes):
+			offsets.append([key, code, offset])
+			offset += struct.calcsize('<' + code)
+		self._schema = {'size': self.size, 'fields': offsets}
+
+	def schema(self):
+		return self._schema
+
+	def pack(self, payload):
+		"""Pack a dict keyed by the field keys"""
+		return self.struct.pack(*[
+			conv(payload[key]) if conv else payload[key]
+			for key, conv in zip(self.keys, self.converters)
+		])
+
+	def pack_values(self, values):
+		"""Pack a sequence already in field order, without conversion"""
+		return self.struct.pack(*values)
+
+	def unpack(self, data):
+		return dict(zip(self.keys, self.struct.unpack(data)))